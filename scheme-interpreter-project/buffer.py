@@ -1,6 +1,6 @@
 """The buffer module assists in iterating through lines and tokens."""
 
-import math
+import collections
 
 class Buffer:
     """A Buffer provides a way of accessing a sequence of tokens across lines.
@@ -16,8 +16,12 @@ class Buffer:
     In addition, Buffer provides a current method to look at the
     next item to be supplied, without sequencing past it.
 
-    The __str__ method prints all tokens read so far, up to the end of the
-    current line, and marks the current token with >>.
+    The __str__ method prints the tokens of the current line and of up to
+    HISTORY-1 lines before it, numbered from the first line of the source,
+    and marks the current token with >>.  Only those lines are kept, so a
+    Buffer uses constant space however many lines it reads.  The line_count
+    and token_count attributes give the numbers of lines read and tokens
+    popped so far.
 
     >>> buf = Buffer(iter([['(', '+'], [15], [12, ')']]))
     >>> buf.pop()
@@ -46,14 +50,31 @@ class Buffer:
     2: 15
     3: 12 ) >>
     >>> buf.pop()  # returns None
+    >>> buf = Buffer(iter([[k] for k in range(12)]))
+    >>> while buf.current() != 9:
+    ...     _ = buf.pop()
+    >>> print(buf)
+     7: 6
+     8: 7
+     9: 8
+    10:  >> 9
+    >>> buf.line_count, buf.token_count
+    (10, 9)
     """
-    def __init__(self, source):
+    def __init__(self, source, history=4):
         self.index = 0
-        self.lines = []
+        self.lines = collections.deque(maxlen=history)
+        self.line_count = 0
+        self.tokens_before = 0  # Tokens on the lines before the current one
         self.source = source
         self.current_line = ()
         self.current()
 
+    @property
+    def token_count(self):
+        """The number of tokens popped so far."""
+        return self.tokens_before + min(self.index, len(self.current_line))
+
     def pop(self):
         """Remove the next item from self and return it. If self has
         exhausted its source, returns None."""
@@ -67,11 +88,15 @@ class Buffer:
 
     def current(self):
         """Return the current element, or None if none exists."""
+        if self.index < len(self.current_line):
+            return self.current_line[self.index]
         while not self.more_on_line:
+            self.tokens_before += len(self.current_line)
             self.index = 0
             try:
                 self.current_line = next(self.source)
                 self.lines.append(self.current_line)
+                self.line_count += 1
             except StopIteration:
                 self.current_line = ()
                 return None
@@ -80,18 +105,19 @@ class Buffer:
     def __str__(self):
         """Return recently read contents; current element marked with >>."""
         # Format string for right-justified line numbers
-        n = len(self.lines)
-        msg = '{0:>' + str(math.floor(math.log10(n))+1) + "}: "
+        n = self.line_count
+        msg = '{0:>' + str(len(str(n))) + "}: "
 
-        # Up to three previous lines and current line are included in output
+        # The previous lines in the history and current line are included
         s = ''
-        for i in range(max(0, n-4), n-1):
-            s += msg.format(i+1) + ' '.join(map(str, self.lines[i])) + '\n'
+        previous = list(self.lines)[:-1]
+        for i, line in enumerate(previous, n - len(previous)):
+            s += msg.format(i) + ' '.join(map(str, line)) + '\n'
         s += msg.format(n)
         s += ' '.join(map(str, self.current_line[:self.index]))
         s += ' >> '
         s += ' '.join(map(str, self.current_line[self.index:]))
-        return s.strip()
+        return s.rstrip()
 
 # Try to import readline for interactive history
 try:
@@ -110,17 +136,33 @@ class InputReader:
             self.prompt = ' ' * len(self.prompt)
 
 class LineReader:
-    """A LineReader is an iterable that prints lines after a prompt."""
+    """A LineReader is an iterable that prints lines after a prompt, unless
+    the prompt is None.  It takes its lines from the iterator LINES, such as
+    an open file, which successive LineReaders may share: each line is read
+    only when it is needed, and only once.
+
+    >>> lines = iter(["(+ 1", "2)", "3"])
+    >>> next(iter(LineReader(lines, "scm> ")))
+    scm> (+ 1
+    '(+ 1'
+    >>> list(LineReader(lines, None))
+    Traceback (most recent call last):
+        ...
+    EOFError
+    """
     def __init__(self, lines, prompt, comment=";"):
         self.lines = lines
         self.prompt = prompt
         self.comment = comment
 
     def __iter__(self):
-        while self.lines:
-            line = self.lines.pop(0).strip('\n')
-            if (self.prompt is not None and line != "" and
-                not line.lstrip().startswith(self.comment)):
+        if self.prompt is None:
+            for line in self.lines:
+                yield line.rstrip('\n')
+            raise EOFError
+        for line in self.lines:
+            line = line.rstrip('\n')
+            if line != "" and not line.lstrip().startswith(self.comment):
                 print(self.prompt + line)
                 self.prompt = ' ' * len(self.prompt)
             yield line
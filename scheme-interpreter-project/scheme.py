@@ -4,11 +4,46 @@ eval/apply mutual recurrence, environment model, and read-eval-print loop.
 from scheme_primitives import *
 from scheme_reader import *
 from ucb import main, trace
+import collections
+import importlib
 
 ##############
 # Eval/Apply #
 ##############
 
+# The evaluator used by scheme_eval in place of the tree-walking one below,
+# or None to walk expressions directly.  Set with use_engine.
+engine = None
+
+# The function used by scheme_apply to apply a procedure with the code that
+# the engine keeps for it, or None to evaluate the expression that its apply
+# method returns.  Set with use_engine.
+engine_apply = None
+
+# Alternative evaluation engines by name.  Each names the module that
+# implements it and its eval and apply functions (None if scheme_apply should
+# just call scheme_eval); None stands for the tree-walking evaluator.
+ENGINES = {
+    'tree':    None,
+    'analyze': ('scheme_analyze', 'analyze_eval', 'analyze_apply'),
+    'vm':      ('scheme_vm', 'vm_eval', 'vm_apply'),
+    'cek':     ('scheme_cek', 'cek_eval', None),
+}
+
+def use_engine(name):
+    """Make scheme_eval use the evaluation engine named NAME (a key of
+    ENGINES)."""
+    global engine, engine_apply
+    if name not in ENGINES:
+        raise SchemeError("unknown engine: {0}".format(name))
+    if ENGINES[name] is None:
+        engine = engine_apply = None
+    else:
+        module, fn, apply_fn = ENGINES[name]
+        module = importlib.import_module(module)
+        engine = getattr(module, fn)
+        engine_apply = apply_fn and getattr(module, apply_fn)
+
 
 def scheme_eval(expr, env):
     """Evaluate Scheme expression EXPR in environment ENV. If ENV is None,
@@ -19,6 +54,8 @@ def scheme_eval(expr, env):
     >>> scheme_eval(expr, create_global_frame())
     scnum(4)
     """
+    if engine is not None and env is not None:
+        return engine(expr, env)
 
     while env is not None:
         # Note: until extra-credit problem 22 is complete, env will
@@ -67,6 +104,8 @@ proper_tail_recursion = True
 def scheme_apply(procedure, args, env):
     """Apply PROCEDURE (type Procedure) to argument values ARGS
     in environment ENV.  Returns the resulting Scheme value."""
+    if engine_apply is not None:
+        return engine_apply(procedure, args, env)
     # UPDATED 4/14/2014 @ 19:08
     # Since .apply is allowed to do a partial evaluation, we finish up
     # with a call to scheme_eval to complete the evaluation.  scheme_eval
@@ -94,7 +133,7 @@ class Frame:
             return "<{{{0}}} -> {1}>".format(', '.join(s), repr(self.parent))
 
     def __eq__(self, other):
-        return isinstance(other, Frame) and \
+        return isinstance(other, (Frame, CallFrame)) and \
                 self.parent == other.parent
 
     def lookup(self, symbol):
@@ -106,7 +145,7 @@ class Frame:
         if symbol in self.bindings:
             return self.bindings[symbol]
         elif self.parent:
-            return Frame.lookup(self.parent,symbol)
+            return self.parent.lookup(symbol)
         else:        
             raise SchemeError("unknown identifier: {0}".format(str(symbol)))
 
@@ -129,14 +168,14 @@ class Frame:
         >>> env.make_call_frame(formals, vals)
         <{a: 1, b: 2, c: 3} -> <Global Frame>>
         """
-        frame = Frame(self)
-        if len(formals) == len(vals):
-            while formals !=nil and vals!=nil:
-                frame.define(scheme_car(formals), scheme_car(vals))
-                formals, vals =scheme_cdr(formals), scheme_cdr(vals)
-        else:
+        names, values = [], []
+        while formals is not nil and vals is not nil:
+            names.append(scheme_car(formals))
+            values.append(scheme_car(vals))
+            formals, vals = scheme_cdr(formals), scheme_cdr(vals)
+        if formals is not nil or vals is not nil:
             raise SchemeError('different number of formal parameters and arguments')
-        return frame
+        return CallFrame(self, tuple(names), values)
 
     def define(self, sym, val):
         """Define Scheme symbol SYM to have value VAL in SELF.  As a
@@ -147,6 +186,145 @@ class Frame:
             sym = intern(sym)
         self.bindings[sym] = val
 
+class Cell:
+    """A mutable box holding the value of a global binding.  Code may hold on
+    to the cell of a name to fetch its current value without a lookup."""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+class GlobalFrame(Frame):
+    """The global environment frame.  Its BINDINGS map each symbol to a Cell
+    holding its value.  A symbol keeps the same cell for as long as it is
+    bound, and define replaces the value in the cell.  VERSION counts the
+    defines that replace the value of a name already bound in the frame, so
+    that caches of its bindings can tell when they may be out of date.
+    Binding a new name creates a new cell, which no cache can hold yet, so
+    it leaves VERSION alone.
+
+    >>> env = GlobalFrame()
+    >>> env.define("x", scnum(1))
+    >>> cell, version = env.bindings[intern("x")], env.version
+    >>> env.define("y", scnum(2))
+    >>> env.version == version
+    True
+    >>> env.define("x", scnum(2))
+    >>> cell.value, env.version > version
+    (scnum(2), True)
+    """
+
+    def __init__(self):
+        Frame.__init__(self, None)
+        self.version = 0
+
+    def lookup(self, symbol):
+        """Return the value bound to SYMBOL.  Errors if SYMBOL is not found."""
+        if type(symbol) is str:
+            symbol = intern(symbol)
+        cell = self.bindings.get(symbol)
+        if cell is None:
+            raise SchemeError("unknown identifier: {0}".format(str(symbol)))
+        return cell.value
+
+    def define(self, sym, val):
+        """Define Scheme symbol SYM to have value VAL in SELF."""
+        assert isinstance(val, SchemeValue), "values must be SchemeValues"
+        if type(sym) is str:
+            sym = intern(sym)
+        cell = self.bindings.get(sym)
+        if cell is None:
+            self.bindings[sym] = Cell(val)
+        else:
+            cell.value = val
+            self.version += 1
+
+class CacheStats:
+    """Counts of the hits and misses of the inline caches that analyzed code
+    keeps for its references to global names."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.hits = self.misses = 0
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __repr__(self):
+        return "CacheStats(hits={0}, misses={1})".format(self.hits, self.misses)
+
+inline_cache_stats = CacheStats()
+
+@primitive("inline-cache-stats")
+def scheme_inline_cache_stats():
+    """An association list of the hit and miss counts and hit rate of the
+    inline caches for global names."""
+    stats = inline_cache_stats
+    return scheme_list(Pair(intern("hits"), stats.hits),
+                       Pair(intern("misses"), stats.misses),
+                       Pair(intern("hit-rate"), stats.hit_rate()))
+
+@primitive("native")
+def scheme_native(procedure):
+    """PROCEDURE translated into a Python function (see scheme_native.py), or
+    PROCEDURE itself if it cannot be translated."""
+    from scheme_native import native_procedure
+    return native_procedure(procedure)
+
+class CallFrame:
+    """A frame created by a procedure call or a let.  The symbols it binds are
+    the tuple NAMES, and their values are kept in the list VALUES in the same
+    order, so that code that knows the position (slot) of a name can fetch its
+    value without hashing.  Names added later by define go into the dictionary
+    BINDINGS, which is created only when needed."""
+
+    __slots__ = ('parent', 'names', 'values', 'bindings')
+
+    def __init__(self, parent, names, values):
+        self.parent = parent
+        self.names = names
+        self.values = values
+        self.bindings = None
+
+    def __repr__(self):
+        items = list(zip(self.names, self.values))
+        if self.bindings:
+            items += self.bindings.items()
+        s = sorted('{0}: {1}'.format(k,v) for k,v in items)
+        return "<{{{0}}} -> {1}>".format(', '.join(s), repr(self.parent))
+
+    __eq__ = Frame.__eq__
+
+    def lookup(self, symbol):
+        """Return the value bound to SYMBOL.  Errors if SYMBOL is not found."""
+        if type(symbol) is str:
+            symbol = intern(symbol)
+        if symbol in self.names:
+            return self.values[self.names.index(symbol)]
+        elif self.bindings and symbol in self.bindings:
+            return self.bindings[symbol]
+        return self.parent.lookup(symbol)
+
+    global_frame = Frame.global_frame
+    make_call_frame = Frame.make_call_frame
+
+    def define(self, sym, val):
+        """Define Scheme symbol SYM to have value VAL in SELF, replacing the
+        value in its slot if SYM is one of NAMES."""
+        assert isinstance(val, SchemeValue), "values must be SchemeValues"
+        if type(sym) is str:
+            sym = intern(sym)
+        if sym in self.names:
+            self.values[self.names.index(sym)] = val
+        else:
+            if self.bindings is None:
+                self.bindings = {}
+            self.bindings[sym] = val
+
 #####################
 # Procedures        #
 #####################
@@ -202,6 +380,15 @@ class PrimitiveProcedure(Procedure):
 class LambdaProcedure(Procedure):
     """A procedure defined by a lambda expression or the complex define form."""
 
+    # The analyzed form of the procedure, a pair (names, body) of the tuple of
+    # formal parameters and the analyzed BODY, filled in by the analyzing
+    # evaluator (see scheme_analyze.py) so that BODY is analyzed only once.
+    code = None
+
+    # The compiled form of BODY, filled in by the bytecode compiler (see
+    # scheme_vm.py) so that BODY is compiled only once.
+    bytecode = None
+
     def __init__(self, formals, body, env = None):
         """A procedure whose formal parameter list is FORMALS (a Scheme list),
         whose body is the single Scheme expression BODY, and whose parent
@@ -231,6 +418,14 @@ class LambdaProcedure(Procedure):
                self.body == other.body and \
                self.env == other.env
 
+    def __getstate__(self):
+        """Pickle the procedure without its analyzed or compiled body, which
+        the engines rebuild when it is next called."""
+        state = self.__dict__.copy()
+        state.pop('code', None)
+        state.pop('bytecode', None)
+        return state
+
     def apply(self, args, env):
         if proper_tail_recursion:
             # Implemented in Question 22.
@@ -286,6 +481,102 @@ class Thunk(LambdaProcedure):
         return scheme_eval(self.body, self.env)
 
 
+###############
+# Memoization #
+###############
+
+class LRUCache:
+    """A mapping that holds at most MAX_SIZE entries, discarding the least
+    recently used one to make room for a new one.  HITS, MISSES, and
+    EVICTIONS count the successful and failed lookups and the discarded
+    entries.
+
+    >>> cache = LRUCache(2)
+    >>> cache.store('a', 1); cache.store('b', 2)
+    >>> cache.lookup('a')
+    1
+    >>> cache.store('c', 3)
+    >>> cache.lookup('b') is None, cache.evictions
+    (True, 1)
+    """
+
+    def __init__(self, max_size):
+        self.entries = collections.OrderedDict()
+        self.max_size = max_size
+        self.hits = self.misses = self.evictions = 0
+
+    def lookup(self, key):
+        """The value stored for KEY, or None if there is none."""
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
+
+    def store(self, key, value):
+        """Store VALUE for KEY, evicting the least recently used entry if the
+        cache is full."""
+        self.entries[key] = value
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+# The number of results a memoized procedure keeps unless told otherwise.
+MEMO_SIZE = scint(1024)
+
+class MemoizedProcedure(Procedure):
+    """A procedure that remembers the values that the LambdaProcedure
+    PROCEDURE returns for the last MAX_SIZE distinct lists of arguments it
+    was called with.  Arguments are compared as by equal?."""
+
+    def __init__(self, procedure, max_size=MEMO_SIZE):
+        self.procedure = procedure
+        self.cache = LRUCache(max_size)
+
+    def __str__(self):
+        return '#[memoized {0}]'.format(self.procedure)
+
+    def __repr__(self):
+        return 'MemoizedProcedure({0!r})'.format(self.procedure)
+
+    def __reduce__(self):
+        """Pickle the procedure with an empty cache."""
+        return (MemoizedProcedure, (self.procedure, self.cache.max_size))
+
+    def apply(self, args, env):
+        """Apply the procedure to ARGS, using a remembered value if there is
+        one.  Returns (val, None)."""
+        key = equal_key(args)
+        value = self.cache.lookup(key)
+        if value is None:
+            value = scheme_apply(self.procedure, args, env)
+            self.cache.store(key, value)
+        return value, None
+
+@primitive("memoize")
+def scheme_memoize(procedure, max_size=MEMO_SIZE):
+    """A memoized version of the lambda procedure PROCEDURE that keeps at most
+    MAX_SIZE results."""
+    check_type(procedure, lambda p: type(p) is LambdaProcedure, 0, "memoize")
+    check_type(max_size, lambda n: scheme_integerp(n) and n > 0, 1, "memoize")
+    return MemoizedProcedure(procedure, max_size)
+
+@primitive("memo-stats")
+def scheme_memo_stats(procedure):
+    """An association list of the hit, miss, and eviction counts, size, and
+    maximum size of the cache of the memoized PROCEDURE."""
+    check_type(procedure, lambda p: type(p) is MemoizedProcedure, 0,
+               "memo-stats")
+    cache = procedure.cache
+    return scheme_list(Pair(intern("hits"), cache.hits),
+                       Pair(intern("misses"), cache.misses),
+                       Pair(intern("evictions"), cache.evictions),
+                       Pair(intern("size"), len(cache.entries)),
+                       Pair(intern("max-size"), cache.max_size))
+
+
 
 
 
@@ -305,11 +596,11 @@ def do_lambda_form(vals, env, function_type=LambdaProcedure):
     in environment ENV, creating a procedure of type FUNCTION_TYPE
     (a subtype of Procedure)."""
     check_form(vals, 2)
-    formals = vals[0]
+    formals = vals.first
     check_formals(formals)
-    body = vals[1]
-    if len(vals) > 2:
-        body = Pair('begin', scheme_cdr(vals))
+    body = vals.second.first
+    if vals.second.second is not nil:
+        body = make_pair(begin_sym, vals.second)
     if function_type == LambdaProcedure:
         return LambdaProcedure(formals, body, env), env #env or None?
     if function_type == MuProcedure:
@@ -331,10 +622,10 @@ def do_nu_form(vals, env):
 def do_define_form(vals, env):
     """Evaluate a define form with parameters VALS in environment ENV."""
     check_form(vals, 2)
-    target = vals[0]
+    target = vals.first
     if scheme_symbolp(target):     # for assigning values
         check_form(vals, 2, 2)
-        value = scheme_eval(vals[1], env)
+        value = scheme_eval(vals.second.first, env)
         env.define(target, value)
         return target, None
     elif scheme_pairp(target):     # for defining functions
@@ -351,15 +642,27 @@ def do_define_form(vals, env):
         raise SchemeError("bad argument to define")
 
 
+def do_define_memoized_form(vals, env):
+    """Evaluate a define-memoized form with parameters VALS in environment
+    ENV.  Like the define form for procedures, but the name is bound to a
+    MemoizedProcedure, so recursive calls also use the remembered values."""
+    check_form(vals, 2)
+    target = vals.first
+    if not scheme_pairp(target) or not scheme_symbolp(target.first):
+        raise SchemeError("bad argument to define-memoized")
+    procedure = do_lambda_form(Pair(target.second, vals.second), env)[0]
+    env.define(target.first, MemoizedProcedure(procedure))
+    return target.first, None
+
 def do_quote_form(vals, env):
     """Evaluate a quote form with parameters VALS. ENV is ignored."""
     check_form(vals, 1, 1)
-    return vals[0], None
+    return vals.first, None
 
 def do_let_form(vals, env):
     """Evaluate a let form with parameters VALS in environment ENV."""
     check_form(vals, 2)
-    bindings = vals[0] #the local variable binding
+    bindings = vals.first #the local variable binding
     exprs = vals.second #the action
     if not scheme_listp(bindings):
         raise SchemeError("bad bindings list in let form")
@@ -368,16 +671,16 @@ def do_let_form(vals, env):
     names, values = nil, nil
     for binding in bindings:
         check_form(binding, 2)
-        names= Pair(binding[0], names)
-        values = Pair(scheme_eval(binding[1], env),values)
+        names = make_pair(binding.first, names)
+        values = make_pair(scheme_eval(binding.second.first, env), values)
     #Check if duplicate bindings
     check_formals(names) 
     new_env = env.make_call_frame(names, values)
     # Evaluate all but the last expression after bindings, and return the last
-    last = len(exprs)-1
-    for i in range(0, last):
-        scheme_eval(exprs[i], new_env)
-    return exprs[last], new_env
+    while exprs.second is not nil:
+        scheme_eval(exprs.first, new_env)
+        exprs = exprs.second
+    return exprs.first, new_env
 
 
 #########################
@@ -402,22 +705,31 @@ def do_let_form(vals, env):
 def do_if_form(vals, env):
     """Evaluate if form with parameters VALS in environment ENV."""
     check_form(vals, 2, 3)
-    predicate = scheme_eval(vals[0], env)
+    predicate = scheme_eval(vals.first, env)
     if predicate:
-        return vals[1], env
-    elif len(vals) == 3:
-        return vals[2], env
+        return vals.second.first, env
+    elif vals.second.second is not nil:
+        return vals.second.second.first, env
     return okay, env
 
 def do_and_form(vals, env):
     """Evaluate short-circuited and with parameters VALS in environment ENV."""
-    if len(vals) == 0:
+    check_form(vals, 0)
+    if vals is nil:
         return scheme_true, None
-    for i in range(len(vals)-1):
-        predicate = scheme_eval(vals[i], env)
+    while vals.second is not nil:
+        predicate = scheme_eval(vals.first, env)
         if not predicate:
             return scheme_false, None
-    return vals[len(vals)-1], env
+        vals = vals.second
+    return vals.first, env
+
+def do_profile_form(vals, env):
+    """Evaluate (profile EXPR) with parameters VALS in environment ENV,
+    printing a profile of the procedure calls made (see scheme_profile.py)."""
+    check_form(vals, 1, 1)
+    from scheme_profile import profile_expression
+    return profile_expression(vals.first, env), None
 
 def quote(value):
     """Return a Scheme expression quoting the Scheme VALUE.
@@ -432,21 +744,24 @@ def quote(value):
 
 def do_or_form(vals, env):
     """Evaluate short-circuited or with parameters VALS in environment ENV."""
-    if len(vals) == 0:
+    check_form(vals, 0)
+    if vals is nil:
         return scheme_false, None
-    for i in range(len(vals)-1):
-        predicate = scheme_eval(vals[i], env)
+    while vals.second is not nil:
+        predicate = scheme_eval(vals.first, env)
         if predicate:
-            return predicate, None 
-    return vals[len(vals)-1], env
+            return predicate, None
+        vals = vals.second
+    return vals.first, env
 
 def do_cond_form(vals, env):
     """Evaluate cond form with parameters VALS in environment ENV."""
-    num_clauses = len(vals)
-    for i, clause in enumerate(vals):
+    check_form(vals, 0)
+    while vals is not nil:
+        clause, vals = vals.first, vals.second
         check_form(clause, 1)
         if clause.first is else_sym:
-            if i < num_clauses-1:
+            if vals is not nil:
                 raise SchemeError("else must be last")
             test = scheme_true
             if clause.second is nil:
@@ -462,11 +777,12 @@ def do_cond_form(vals, env):
 def do_begin_form(vals, env):
     """Evaluate begin form with parameters VALS in environment ENV."""
     check_form(vals, 0)
-    if scheme_nullp(vals):
+    if vals is nil:
         return okay, None
-    for i in range(len(vals)-1):
-        result = scheme_eval(vals[i], env)
-    return vals[len(vals)-1], env
+    while vals.second is not nil:
+        scheme_eval(vals.first, env)
+        vals = vals.second
+    return vals.first, env
 
 
  
@@ -476,6 +792,7 @@ and_sym              = intern("and")
 begin_sym            = intern("begin")
 cond_sym             = intern("cond")
 define_macro_sym     = intern("define-macro")
+define_memoized_sym  = intern("define-memoized")
 define_sym           = intern("define")
 else_sym             = intern("else")
 if_sym               = intern("if")
@@ -484,6 +801,7 @@ let_sym              = intern("let")
 mu_sym               = intern("mu")
 nu_sym               = intern("nu")
 or_sym               = intern("or")
+profile_sym          = intern("profile")
 quasiquote_sym       = intern("quasiquote")
 quote_sym            = intern("quote")
 set_bang_sym         = intern("set!")
@@ -497,29 +815,72 @@ SPECIAL_FORMS = {
         begin_sym:        do_begin_form,
         cond_sym:         do_cond_form,
         define_sym:       do_define_form,
+        define_memoized_sym: do_define_memoized_form,
         if_sym:           do_if_form,
         lambda_sym:       do_lambda_form,
         let_sym:          do_let_form,
         mu_sym:           do_mu_form,
         nu_sym:           do_nu_form,
         or_sym:           do_or_form,
+        profile_sym:      do_profile_form,
         quote_sym:        do_quote_form,
 }
 
 # Utility methods for checking the structure of Scheme programs
 
+# The lengths of the forms that check_form has found to be proper lists, as
+# pairs (form, length) indexed by the id of the form.  An id is reused only
+# once the object that had it is freed, and each entry holds a reference to
+# its form, so no other object can have the id of a form in the table; an
+# entry whose key is the id of EXPR is therefore always the entry for EXPR
+# (which check_form confirms with "is").  The ids of forms dropped from the
+# table may be reused, but their entries are gone with them.  The table is
+# emptied when it reaches CHECKED_FORMS_LIMIT entries, so that it keeps at
+# most that many forms alive after they are no longer in use.
+_checked_forms = {}
+CHECKED_FORMS_LIMIT = 10000
+
 def check_form(expr, min, max = None):
     """Check EXPR (default SELF.expr) is a proper list whose length is
     at least MIN and no more than MAX (default: no maximum). Raises
-    a SchemeError if this is not the case."""
-    if not scheme_listp(expr):
-        raise SchemeError("badly formed expression: " + str(expr))
-    length = len(expr)
+    a SchemeError if this is not the case.
+
+    >>> check_form(read_line("(1 2 3)"), 1, 2)
+    Traceback (most recent call last):
+        ...
+    scheme_primitives.SchemeError: too many operands in form
+    """
+    if expr is nil:
+        length = 0
+    else:
+        entry = _checked_forms.get(id(expr))
+        if entry is not None and entry[0] is expr:
+            length = entry[1]
+        else:
+            length = _form_length(expr)
+            if len(_checked_forms) >= CHECKED_FORMS_LIMIT:
+                _checked_forms.clear()
+            _checked_forms[id(expr)] = (expr, length)
     if length < min:
         raise SchemeError("too few operands in form")
     elif max is not None and length > max:
         raise SchemeError("too many operands in form")
 
+def _form_length(expr):
+    """The length of EXPR, which must be a proper list, found by walking it
+    once (with a second pointer at half speed to detect cycles)."""
+    length, p, slow = 0, expr, expr
+    while type(p) is Pair:
+        length += 1
+        p = p.second
+        if length % 2 == 0:
+            slow = slow.second
+            if slow is p:
+                break
+    if p is not nil:
+        raise SchemeError("badly formed expression: " + str(expr))
+    return length
+
 def check_formals(formals):
     """Check that FORMALS is a valid parameter list, a Scheme list of symbols
     in which each symbol is distinct. Raise a SchemeError if the list of formals
@@ -583,11 +944,24 @@ def scheme_load(*args):
         sym = intern(str(sym))
     check_type(sym, scheme_symbolp, 0, "load")
     with scheme_open(str(sym)) as infile:
-        lines = infile.readlines()
-    args = (lines, None) if quiet else (lines,)
-    def next_line():
-        return buffer_lines(*args)
-    read_eval_print_loop(next_line, env.global_frame(), quiet=quiet)
+        import scheme_cache
+        prompt = None if quiet else "scm> "
+        scheme_cache.load_file(infile, env.global_frame(), prompt, quiet)
+    return okay
+
+def scheme_save_image(filename, env):
+    """Save the global environment to the image file named FILENAME (see
+    scheme_image.py)."""
+    check_type(filename, scheme_stringp, 0, "save-image")
+    from scheme_image import save_image
+    save_image(env.global_frame(), str(filename))
+    return okay
+
+def scheme_hash_table_walk(table, procedure, env):
+    """Call PROCEDURE on each key and value in the hash table TABLE."""
+    check_type(table, scheme_hash_tablep, 0, "hash-table-walk")
+    for key, value in list(table.entries.values()):
+        scheme_apply(procedure, scheme_list(key, value), env)
     return okay
 
 def scheme_open(filename):
@@ -605,10 +979,13 @@ def scheme_open(filename):
 
 def create_global_frame():
     """Initialize and return a single-frame environment with built-in names."""
-    env = Frame(None)
+    env = GlobalFrame()
     env.define("eval", PrimitiveProcedure(scheme_eval, True))
     env.define("apply", PrimitiveProcedure(scheme_apply, True))
     env.define("load", PrimitiveProcedure(scheme_load, True))
+    env.define("save-image", PrimitiveProcedure(scheme_save_image, True))
+    env.define("hash-table-walk",
+               PrimitiveProcedure(scheme_hash_table_walk, True))
 
     for names, fn in get_primitive_bindings():
         for name in names:
@@ -616,11 +993,49 @@ def create_global_frame():
             env.define(name, proc)
     return env
 
+# When this file is run as a script, make "import scheme" (used by the engine
+# modules and by Procedure.evaluate_arguments) find this module rather than
+# loading a second copy of it.
+if __name__ == '__main__':
+    sys.modules.setdefault('scheme', sys.modules[__name__])
+
 @main
 def run(*argv):
     next_line = buffer_input
     interactive = True
     load_files = ()
+    input_file = None
+    profile, profile_json = False, None
+    sample, sample_rate = None, 100
+    image = None
+    argv = list(argv)
+    while argv and argv[0].startswith('--'):
+        option = argv.pop(0)
+        if option == '--engine' and argv:
+            try:
+                use_engine(argv.pop(0))
+            except SchemeError as err:
+                print(err)
+                sys.exit(1)
+        elif option == '--profile':
+            profile = True
+        elif option == '--profile-json' and argv:
+            profile, profile_json = True, argv.pop(0)
+        elif option == '--sample' and argv:
+            sample = argv.pop(0)
+        elif option == '--sample-rate' and argv:
+            sample_rate = float(argv.pop(0))
+        elif option == '--image' and argv:
+            image = argv.pop(0)
+        elif option == '--svg' and argv:
+            import scheme_primitives
+            scheme_primitives.turtle_svg_file = argv.pop(0)
+        elif option == '--no-cache':
+            import scheme_cache
+            scheme_cache.enabled = False
+        else:
+            print("unknown option: {0}".format(option))
+            sys.exit(1)
     if argv:
         try:
             filename = argv[0]
@@ -628,13 +1043,52 @@ def run(*argv):
                 load_files = argv[1:]
             else:
                 input_file = open(argv[0])
-                lines = input_file.readlines()
-                def next_line():
-                    return buffer_lines(lines)
                 interactive = False
         except IOError as err:
             print(err)
             sys.exit(1)
-    read_eval_print_loop(next_line, create_global_frame(), startup=True,
-                         interactive=interactive, load_files=load_files)
-    tscheme_exitonclick()
+    if image:
+        from scheme_image import load_image
+        try:
+            env = load_image(image)
+        except SchemeError as err:
+            print(err)
+            sys.exit(1)
+    else:
+        env = create_global_frame()
+    profiler = None
+    if profile:
+        from scheme_profile import Profiler
+        profiler = Profiler(env)
+    elif sample:
+        from scheme_profile import SamplingProfiler
+        profiler = SamplingProfiler(env, sample_rate)
+    if profiler:
+        try:
+            profiler.enable()
+        except SchemeError as err:
+            print(err)
+            sys.exit(1)
+    try:
+        if input_file:
+            import scheme_cache
+            scheme_cache.load_file(input_file, env, "scm> ", quiet=False,
+                                   startup=True)
+        else:
+            read_eval_print_loop(next_line, env, startup=True,
+                                 interactive=interactive,
+                                 load_files=load_files)
+    finally:
+        if input_file:
+            input_file.close()
+        if profiler:
+            profiler.disable()
+        if profile:
+            profiler.report(sys.stderr)
+            if profile_json:
+                with open(profile_json, 'w') as outfile:
+                    outfile.write(profiler.as_json())
+        elif sample:
+            profiler.write_folded(sample)
+        if turtle_screen_on():
+            tscheme_exitonclick()
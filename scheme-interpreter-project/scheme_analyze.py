@@ -0,0 +1,547 @@
+"""This module implements an analyzing evaluator for Scheme, in the style of
+section 4.1.7 of Structure and Interpretation of Computer Programs.
+
+Rather than re-examining the structure of an expression each time it is
+evaluated, as scheme_eval does, the analyzer inspects each expression once and
+turns it into a tree of Python functions.  Each analyzed expression (called
+"code" below) is a function of one argument, an environment, that obeys the
+same contract as the do_..._form functions and Procedure.apply: it returns
+either (V, None), meaning that the value is V, or (C, Env), meaning that the
+value is what you get by executing the code C in environment Env.  Returning
+(C, Env) from a tail position is what keeps tail calls proper.
+
+Analyzed lambda bodies are cached on their procedures (LambdaProcedure.code),
+so the body of a procedure is analyzed once no matter how often it is called.
+
+The analyzer also resolves variables at analysis time.  It keeps track of the
+Scope of each expression, a compile-time picture of the frames it will be
+evaluated in.  A variable bound by an enclosing lambda or let is compiled into
+a (depth, slot) reference into the values of a CallFrame.  A variable bound
+nowhere else refers to the global frame; each such reference keeps an inline
+cache of the variable's Cell, so that it usually costs one attribute fetch.
+The cache is checked against the global frame's version, which redefining a
+name changes, and its hits and misses are counted in scheme.inline_cache_stats.
+Only when the frames cannot be known in advance (in mu procedures, in
+expressions given to eval, and in bodies that define new names) are variables
+looked up by name.
+
+Select this evaluator with use_engine('analyze') in scheme.py, or by running
+    python3 scheme.py --engine analyze FILE
+"""
+
+from scheme_primitives import *
+from scheme import (Procedure, PrimitiveProcedure, LambdaProcedure,
+                    MuProcedure, NuProcedure, Thunk, CallFrame, GlobalFrame,
+                    SPECIAL_FORMS, inline_cache_stats,
+                    check_form, check_formals, and_sym, begin_sym, cond_sym,
+                    define_sym, define_memoized_sym, else_sym, if_sym,
+                    lambda_sym, let_sym, mu_sym, nu_sym, or_sym, quote_sym)
+
+#############
+# Execution #
+#############
+
+def analyze_eval(expr, env):
+    """Evaluate Scheme expression EXPR in environment ENV by analyzing it and
+    executing the result.  If ENV is None, simply returns EXPR.
+
+    >>> from scheme import create_global_frame
+    >>> from scheme_reader import read_line
+    >>> analyze_eval(read_line("((lambda (x) (* x x)) 7)"), create_global_frame())
+    scnum(49)
+    """
+    if env is None:
+        return expr
+    if isinstance(env, GlobalFrame):
+        scope = Scope(None, None, frame=env)
+    else:
+        scope = None
+    return execute(analyze(expr, scope), env)
+
+def execute(code, env):
+    """Execute analyzed CODE in environment ENV, returning its value.  This is
+    the trampoline that finishes off the (code, env) pairs returned by code in
+    tail position."""
+    while env is not None:
+        code, env = code(env)
+    return code
+
+def procedure_code(procedure):
+    """The pair (names, body) of the formal parameters and analyzed body of
+    PROCEDURE, a LambdaProcedure, analyzing its body if that has not been
+    done yet.  Such a procedure was not created by the analyzer, so nothing
+    is known about its environment beyond its own frame, unless that is the
+    global frame."""
+    code = procedure.code
+    if code is None:
+        names, parent = tuple(procedure.formals), None
+        if (isinstance(procedure.env, GlobalFrame) and
+            not isinstance(procedure, MuProcedure)):
+            parent = Scope(None, None, frame=procedure.env)
+        scope = Scope(names, parent,
+                      dynamic=binds_dynamically(procedure.body),
+                      thunks=isinstance(procedure, NuProcedure))
+        code = procedure.code = (names, analyze(procedure.body, scope))
+    return code
+
+class AnalyzedThunk(Thunk):
+    """A by-name argument to a nu procedure whose expression has already been
+    analyzed into CODE."""
+
+    def __init__(self, code, expr, env):
+        Thunk.__init__(self, nil, expr, env)
+        self.code = code
+
+    def get_actual_value(self):
+        return execute(self.code, self.env)
+
+    def __reduce__(self):
+        return (Thunk, (nil, self.body, self.env))
+
+##########
+# Scopes #
+##########
+
+class Scope:
+    """The compile-time picture of a frame.  NAMES is the tuple of symbols
+    held in the slots of a CallFrame, or None for the global frame FRAME.
+    PARENT is the scope of the enclosing frame, or None if that frame is not
+    known until run time.  DYNAMIC is true if names other than NAMES may be
+    defined in the frame at run time.  THUNKS is true for the frames of nu
+    procedures, whose values are by-name arguments."""
+
+    def __init__(self, names, parent, dynamic=False, thunks=False, frame=None):
+        self.names = names
+        self.parent = parent
+        self.dynamic = dynamic
+        self.thunks = thunks
+        self.frame = frame
+
+eval_sym = intern("eval")
+
+def binds_dynamically(body):
+    """True if evaluating BODY may add names to the frame it is evaluated in,
+    because it contains a define or define-memoized form or a call to eval
+    that is not inside a nested lambda, mu, or nu."""
+    exprs = [body]
+    while exprs:
+        expr = exprs.pop()
+        if not scheme_pairp(expr):
+            continue
+        first = expr.first
+        if first in (define_sym, define_memoized_sym, eval_sym):
+            return True
+        if first in (lambda_sym, mu_sym, nu_sym, quote_sym):
+            continue
+        while scheme_pairp(expr):
+            exprs.append(expr.first)
+            expr = expr.second
+    return False
+
+def _variable_value(sym, scope):
+    """A Python function that takes an environment described by SCOPE and
+    returns the value of the variable SYM in it."""
+    depth = 0
+    while scope is not None:
+        if scope.names is None:
+            return _global_value(sym, scope.frame)
+        if sym in scope.names:
+            return _slot_value(depth, scope.names.index(sym), scope.thunks)
+        if scope.dynamic:
+            break
+        scope, depth = scope.parent, depth + 1
+    return _named_value(sym, depth)
+
+def _global_value(sym, frame):
+    """A reference to SYM in the GlobalFrame FRAME, with its own inline cache
+    of the Cell bound to SYM."""
+    cell, version = None, -1
+    stats = inline_cache_stats
+    def global_value(env):
+        nonlocal cell, version
+        if version == frame.version:
+            stats.hits += 1
+            return cell.value
+        stats.misses += 1
+        cell = frame.bindings.get(sym)
+        if cell is None:
+            raise SchemeError("unknown identifier: {0}".format(str(sym)))
+        version = frame.version
+        return cell.value
+    return global_value
+
+def _slot_value(depth, slot, thunks):
+    if thunks:
+        fetch = _slot_value(depth, slot, False)
+        return lambda env: fetch(env).get_actual_value()
+    if depth == 0:
+        return lambda env: env.values[slot]
+    elif depth == 1:
+        return lambda env: env.parent.values[slot]
+    def slot_value(env):
+        for _ in range(depth):
+            env = env.parent
+        return env.values[slot]
+    return slot_value
+
+def _named_value(sym, depth):
+    def named_value(env):
+        for _ in range(depth):
+            env = env.parent
+        return env.lookup(sym).get_actual_value()
+    return named_value
+
+############
+# Analysis #
+############
+
+def analyze(expr, scope):
+    """Return the analyzed form of Scheme expression EXPR, to be executed in
+    environments described by SCOPE.
+
+    Errors in the form of an expression are reported when the offending
+    expression is executed, not when it is analyzed, just as they are by
+    scheme_eval.
+
+    >>> from scheme import create_global_frame
+    >>> from scheme_reader import read_line
+    >>> env = create_global_frame()
+    >>> code = analyze(read_line("(if (< 1 2) 'yes 'no)"), Scope(None, None, frame=env))
+    >>> execute(code, env)
+    intern('yes')
+    """
+    if scheme_symbolp(expr):
+        return analyze_variable(expr, scope)
+    elif scheme_atomp(expr):
+        return analyze_self_evaluating(expr)
+    try:
+        if not scheme_listp(expr):
+            raise SchemeError("malformed list: {0}".format(str(expr)))
+        first, rest = scheme_car(expr), scheme_cdr(expr)
+        if scheme_symbolp(first) and first in SPECIAL_FORMS:
+            analyzer = ANALYZERS.get(first)
+            if analyzer is None:
+                return analyze_special_form(SPECIAL_FORMS[first], rest)
+            return analyzer(rest, scope)
+        return analyze_combination(first, rest, scope)
+    except SchemeError as err:
+        return _raise_error(err)
+
+def analyze_value(expr, scope, code=None):
+    """Return a Python function that takes an environment and returns the
+    value of EXPR in it.  Used for expressions that are not in tail position,
+    so that variables and constants need not go through execute.  CODE, if
+    given, is the already analyzed form of EXPR."""
+    if scheme_symbolp(expr):
+        return _variable_value(expr, scope)
+    elif scheme_atomp(expr):
+        return lambda env: expr
+    if code is None:
+        code = analyze(expr, scope)
+    return lambda env: execute(code, env)
+
+def _raise_error(err):
+    """Code that raises the SchemeError ERR when executed."""
+    def error(env):
+        raise err
+    return error
+
+def analyze_variable(sym, scope):
+    value = _variable_value(sym, scope)
+    def variable(env):
+        return value(env), None
+    return variable
+
+def analyze_self_evaluating(expr):
+    def self_evaluating(env):
+        return expr, None
+    return self_evaluating
+
+def analyze_combination(operator, operands, scope):
+    """Analyze the call of OPERATOR on the Scheme list of OPERANDS.
+
+    Calls to lambda and mu procedures and to primitives are made directly,
+    passing a Python list of argument values rather than a Scheme list.
+    Other procedures are called through their apply methods.  Operands that
+    are themselves calls are executed by a trampoline inlined here rather
+    than through analyze_value, so that a non-tail call costs as few Python
+    frames as it does in scheme_eval.
+
+    >>> from scheme import create_global_frame
+    >>> from scheme_reader import read_line
+    >>> env = create_global_frame()
+    >>> analyze_eval(read_line(
+    ...     "(define (sum n) (if (= n 0) 0 (+ n (sum (- n 1)))))"), env)
+    intern('sum')
+    >>> analyze_eval(read_line("(sum 200)"), env)
+    scnum(20100)
+    """
+    operator_value = analyze_value(operator, scope)
+    operand_exprs = list(operands)
+    operand_codes = [analyze(operand, scope) for operand in operand_exprs]
+    # Each step is (value, None) for an operand whose value is VALUE(env),
+    # and (None, code) for one that must be executed.
+    operand_steps = []
+    for operand, code in zip(operand_exprs, operand_codes):
+        if scheme_symbolp(operand) or scheme_atomp(operand):
+            operand_steps.append((analyze_value(operand, scope), None))
+        else:
+            operand_steps.append((None, code))
+    thunk_parts = list(zip(operand_codes, operand_exprs))[::-1]
+    def combination(env):
+        procedure = operator_value(env)
+        kind = type(procedure)
+        if isinstance(procedure, NuProcedure):
+            args = nil
+            for code, operand in thunk_parts:
+                args = make_pair(AnalyzedThunk(code, operand, env), args)
+            return apply_procedure(procedure, args, env)
+        if not isinstance(procedure, Procedure):
+            procedure.evaluate_arguments(operands, env)  # Raises an error
+        values = []
+        for value, code in operand_steps:
+            if code is None:
+                values.append(value(env))
+            else:
+                val, val_env = code(env)
+                while val_env is not None:
+                    val, val_env = val(val_env)
+                values.append(val)
+        if kind is LambdaProcedure or kind is MuProcedure:
+            names, body = procedure.code or procedure_code(procedure)
+            if len(values) != len(names):
+                raise SchemeError('different number of formal parameters '
+                                  'and arguments')
+            if kind is LambdaProcedure:
+                return body, CallFrame(procedure.env, names, values)
+            return body, CallFrame(env, names, values)
+        if kind is PrimitiveProcedure and not procedure.use_env:
+            try:
+                return procedure.fn(*values), None
+            except TypeError as err:
+                raise SchemeError(err)
+        args = nil
+        for val in reversed(values):
+            args = make_pair(val, args)
+        return apply_procedure(procedure, args, env)
+    return combination
+
+def analyze_apply(procedure, args, env):
+    """Apply PROCEDURE to the Scheme list ARGS in environment ENV, executing
+    the analyzed body of a LambdaProcedure instead of analyzing it again, and
+    return the resulting value."""
+    code, env = apply_procedure(procedure, args, env)
+    return execute(code, env)
+
+def apply_procedure(procedure, args, env):
+    """Apply PROCEDURE to the Scheme list ARGS through its apply method,
+    returning analyzed code and an environment in which to execute it."""
+    expr, env = procedure.apply(args, env)
+    if env is None:
+        return expr, None
+    if expr is getattr(procedure, 'body', None):
+        return procedure_code(procedure)[1], env
+    return analyze(expr, None), env
+
+def analyze_special_form(form, vals):
+    """Analyze a special form that has no analyzer of its own by deferring to
+    its do_..._form function FORM from scheme.py each time it is executed."""
+    def special_form(env):
+        expr, env = form(vals, env)
+        if env is None:
+            return expr, None
+        return analyze(expr, None), env
+    return special_form
+
+def analyze_sequence(exprs, scope):
+    """Analyze the non-empty Scheme list of expressions EXPRS, which are
+    evaluated in order.  The value is that of the last."""
+    exprs = list(exprs)
+    leading = [analyze_value(expr, scope) for expr in exprs[:-1]]
+    last = analyze(exprs[-1], scope)
+    if not leading:
+        return last
+    def sequence(env):
+        for value in leading:
+            value(env)
+        return last(env)
+    return sequence
+
+#################
+# Special forms #
+#################
+
+# Each analyze_..._form function takes the operands VALS of a special form
+# and the SCOPE it appears in, and returns its analyzed code, performing the
+# same checks and evaluation steps as the corresponding do_..._form function
+# in scheme.py.
+
+def analyze_lambda_form(vals, scope, function_type=LambdaProcedure):
+    check_form(vals, 2)
+    formals = vals[0]
+    check_formals(formals)
+    body = vals[1]
+    if len(vals) > 2:
+        body = Pair('begin', scheme_cdr(vals))
+    names = tuple(formals)
+    if function_type is MuProcedure:
+        scope = None
+    body_scope = Scope(names, scope, dynamic=binds_dynamically(body),
+                       thunks=function_type is NuProcedure)
+    code = (names, analyze(body, body_scope))
+    def make_procedure(env):
+        procedure = function_type(formals, body, env)
+        procedure.code = code
+        return procedure, None
+    return make_procedure
+
+def analyze_mu_form(vals, scope):
+    return analyze_lambda_form(vals, scope, function_type=MuProcedure)
+
+def analyze_nu_form(vals, scope):
+    return analyze_lambda_form(vals, scope, function_type=NuProcedure)
+
+def analyze_define_form(vals, scope):
+    check_form(vals, 2)
+    target = vals[0]
+    if scheme_symbolp(target):
+        check_form(vals, 2, 2)
+        value = analyze_value(vals[1], scope)
+    elif scheme_pairp(target):
+        formals, target = scheme_cdr(target), scheme_car(target)
+        if not scheme_symbolp(target):
+            raise SchemeError("bad variable")
+        lambda_expr = Pair(lambda_sym, scheme_cons(formals, vals.second))
+        value = analyze_value(lambda_expr, scope)
+    else:
+        raise SchemeError("bad argument to define")
+    def define(env):
+        env.define(target, value(env))
+        return target, None
+    return define
+
+def analyze_quote_form(vals, scope):
+    check_form(vals, 1, 1)
+    return analyze_self_evaluating(vals[0])
+
+def analyze_let_form(vals, scope):
+    check_form(vals, 2)
+    bindings = vals[0]
+    if not scheme_listp(bindings):
+        raise SchemeError("bad bindings list in let form")
+    names, values = [], []
+    for binding in bindings:
+        check_form(binding, 2)
+        names.append(binding[0])
+        values.append(analyze_value(binding[1], scope))
+    names = tuple(names)
+    try:
+        check_formals(names)
+        duplicate = None
+    except SchemeError as err:
+        duplicate = err    # Raised only after evaluating the bindings
+    body_scope = Scope(names, scope, dynamic=binds_dynamically(vals.second))
+    body = analyze_sequence(vals.second, body_scope)
+    def let(env):
+        frame = CallFrame(env, names, [value(env) for value in values])
+        if duplicate is not None:
+            raise duplicate
+        return body, frame
+    return let
+
+def analyze_if_form(vals, scope):
+    check_form(vals, 2, 3)
+    predicate = analyze_value(vals[0], scope)
+    consequent = analyze(vals[1], scope)
+    if len(vals) == 3:
+        alternative = analyze(vals[2], scope)
+    else:
+        alternative = analyze_self_evaluating(okay)
+    def if_(env):
+        if predicate(env):
+            return consequent(env)
+        return alternative(env)
+    return if_
+
+def analyze_and_form(vals, scope):
+    if len(vals) == 0:
+        return analyze_self_evaluating(scheme_true)
+    exprs = list(vals)
+    leading = [analyze_value(expr, scope) for expr in exprs[:-1]]
+    last = analyze(exprs[-1], scope)
+    def and_(env):
+        for value in leading:
+            if not value(env):
+                return scheme_false, None
+        return last(env)
+    return and_
+
+def analyze_or_form(vals, scope):
+    if len(vals) == 0:
+        return analyze_self_evaluating(scheme_false)
+    exprs = list(vals)
+    leading = [analyze_value(expr, scope) for expr in exprs[:-1]]
+    last = analyze(exprs[-1], scope)
+    def or_(env):
+        for value in leading:
+            predicate = value(env)
+            if predicate:
+                return predicate, None
+        return last(env)
+    return or_
+
+def _analyze_clause(clause, is_last, scope):
+    """Return (test, body) for a cond CLAUSE, where TEST is None for an else
+    clause and BODY is None for a clause with no expressions after the test."""
+    try:
+        check_form(clause, 1)
+        if clause.first is else_sym:
+            if not is_last:
+                raise SchemeError("else must be last")
+            if clause.second is nil:
+                raise SchemeError("badly formed else clause")
+            test = None
+        else:
+            test = analyze_value(clause.first, scope)
+    except SchemeError as err:
+        return _raise_error(err), None
+    if clause.second is nil:
+        return test, None
+    try:
+        return test, analyze_begin_form(clause.second, scope)
+    except SchemeError as err:
+        return test, _raise_error(err)
+
+def analyze_cond_form(vals, scope):
+    num_clauses = len(vals)
+    clauses = [_analyze_clause(clause, i == num_clauses-1, scope)
+               for i, clause in enumerate(vals)]
+    def cond(env):
+        for test, body in clauses:
+            value = scheme_true if test is None else test(env)
+            if value:
+                if body is None:
+                    return value, None
+                return body(env)
+        return okay, None
+    return cond
+
+def analyze_begin_form(vals, scope):
+    check_form(vals, 0)
+    if scheme_nullp(vals):
+        return analyze_self_evaluating(okay)
+    return analyze_sequence(vals, scope)
+
+ANALYZERS = {
+        and_sym:          analyze_and_form,
+        begin_sym:        analyze_begin_form,
+        cond_sym:         analyze_cond_form,
+        define_sym:       analyze_define_form,
+        if_sym:           analyze_if_form,
+        lambda_sym:       analyze_lambda_form,
+        let_sym:          analyze_let_form,
+        mu_sym:           analyze_mu_form,
+        nu_sym:           analyze_nu_form,
+        or_sym:           analyze_or_form,
+        quote_sym:        analyze_quote_form,
+}
@@ -0,0 +1,467 @@
+"""Benchmarks for the Scheme interpreter.
+
+Usage: python3 scheme_bench.py NAME [ARGS...]
+
+Runs the benchmark called NAME (one of the keys of BENCHMARKS) and prints its
+timings.  With no NAME, lists the available benchmarks.
+"""
+
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from scheme import (read_eval_print_loop, create_global_frame, use_engine,
+                    scheme_eval, scheme_load, ENGINES)
+from scheme_native import native_procedure
+from scheme_primitives import Pair, intern, make_pair, nil, scnum, scstr
+from scheme_reader import buffer_lines, read_line, scheme_read
+from buffer import Buffer
+from scheme_tokens import count_tokens, tokenize_lines
+from ucb import main
+
+BENCHMARKS = {}
+
+def benchmark(name):
+    """An annotation to record a Python function as the benchmark NAME."""
+    def add(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return add
+
+def best_time(fn, repeat=3):
+    """The shortest of REPEAT wall-clock times, in seconds, taken by FN()."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def run_lines(lines, env=None):
+    """Evaluate the Scheme source LINES quietly in ENV (by default a new global
+    frame), discarding anything printed, and return the environment."""
+    if env is None:
+        env = create_global_frame()
+    lines = iter(list(lines))
+    def next_line():
+        return buffer_lines(lines, None)
+    with contextlib.redirect_stdout(io.StringIO()):
+        read_eval_print_loop(next_line, env, quiet=True)
+    return env
+
+def read_source(src_file):
+    """The lines of SRC_FILE, without the (exit) lines that tests.scm uses to
+    stop early."""
+    with open(src_file) as infile:
+        return [line for line in infile if line.strip() != '(exit)']
+
+def report(label, seconds, baseline=None):
+    """Print one line of benchmark output."""
+    line = '{0:<24} {1:9.4f}s'.format(label, seconds)
+    if baseline:
+        line += '   {0:5.2f}x'.format(baseline / seconds)
+    print(line)
+
+FIB = """
+(define (fib n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2)))))
+(fib {0})
+"""
+
+@benchmark("engines")
+def bench_engines(src_file='tests.scm', *engines):
+    """Compare evaluation engines on SRC_FILE and on a tree-recursive fib."""
+    engines = engines or tuple(ENGINES)
+    workloads = [(src_file, read_source(src_file)),
+                 ('fib 18', FIB.format(18).split('\n'))]
+    for label, lines in workloads:
+        print(label)
+        baseline = None
+        for name in engines:
+            use_engine(name)
+            seconds = best_time(lambda: run_lines(lines))
+            report('  ' + name, seconds, baseline)
+            baseline = baseline or seconds
+    use_engine('tree')
+
+SUM = """
+(define (sum n total) (if (= n 0) total (sum (- n 1) (+ n total))))
+"""
+
+@benchmark("native")
+def bench_native(n='20'):
+    """Compare fib N and a tail-recursive sum run by the tree-walking evaluator
+    and as procedures translated to Python (see scheme_native.py)."""
+    env = run_lines((FIB.format(0) + SUM).split('\n'))
+    workloads = [('fib', '(fib {0})'.format(n)), ('sum', '(sum 500 0)')]
+    for name, call in workloads:
+        print(call)
+        expr, sym = read_line(call), intern(name)
+        proc = env.lookup(sym)
+        baseline = best_time(lambda: scheme_eval(expr, env))
+        report('  tree', baseline)
+        env.define(sym, native_procedure(proc))
+        report('  native', best_time(lambda: scheme_eval(expr, env)), baseline)
+
+ARITH_LOOP = """
+(define (loop i acc) (if (= i 0) acc (loop (- i 1) (+ acc (* i 3)))))
+(loop {0} 0)
+"""
+
+@benchmark("arith")
+def bench_arith(n='100000', *engines):
+    """Time the two-operand arithmetic primitives against the general _arith
+    path on SchemeInts and SchemeFloats, then an arithmetic loop of N
+    iterations under each engine."""
+    import operator
+    import scheme_primitives as p
+    n = int(n)
+    operands = [('int', p.scnum(12345), p.scnum(678)),
+                ('float', p.scnum(1.5), p.scnum(0.25))]
+    for label, x, y in operands:
+        print(label)
+        for name, fast, op, init in [('+', p.scheme_add, operator.add, 0),
+                                     ('*', p.scheme_mul, operator.mul, 1)]:
+            args = (x, y)
+            baseline = best_time(lambda: [p._arith(op, init, args)
+                                          for _ in range(n)])
+            report('  {0} _arith'.format(name), baseline)
+            report('  {0} primitive'.format(name),
+                   best_time(lambda: [fast(x, y) for _ in range(n)]), baseline)
+    lines = ARITH_LOOP.format(n).split('\n')
+    print('loop {0}'.format(n))
+    for name in engines or tuple(ENGINES):
+        use_engine(name)
+        report('  ' + name, best_time(lambda: run_lines(lines)))
+    use_engine('tree')
+
+INDEXED_SUM = """
+(define (list-ref lst k) (if (= k 0) (car lst) (list-ref (cdr lst) (- k 1))))
+(define (range n) (define (build k acc) (if (< k 0) acc (build (- k 1) (cons k acc)))) (build (- n 1) nil))
+(define items (range {0}))
+(define items (if (eq? '{1} 'vector) (list->vector items) items))
+(define (sum i total) (if (= i {0}) total (sum (+ i 1) (+ total ({1}-ref items i)))))
+"""
+
+@benchmark("vectors")
+def bench_vectors(engine='analyze', *sizes):
+    """Sum the elements of vectors and lists of each of SIZES by index, with
+    vector-ref and a list-ref written in Scheme, showing time per element."""
+    use_engine(engine)
+    for kind in ('vector', 'list'):
+        print(kind + '-ref')
+        for n in map(int, sizes or ('250', '500', '1000')):
+            env = run_lines(INDEXED_SUM.format(n, kind).split('\n'))
+            expr = read_line('(sum 0 0)')
+            seconds = best_time(lambda: scheme_eval(expr, env))
+            report('  n={0}'.format(n), seconds)
+            print('{0:<24} {1:9.3f}us per element'.format('', seconds / n * 1e6))
+    use_engine('tree')
+
+NUMERIC_SUM = """
+(define (sum-to v k total)
+  (if (= k 0) total (sum-to v (- k 1) (+ total (f64vector-ref v (- k 1))))))"""
+
+@benchmark("numeric")
+def bench_numeric(n='1000000'):
+    """Sum a numeric vector of N elements with vector-sum and with a Scheme
+    loop over f64vector-ref."""
+    n = int(n)
+    use_engine('analyze')
+    env = run_lines(NUMERIC_SUM.split('\n'))
+    scheme_eval(read_line('(define v (make-f64vector {0} 0.5))'.format(n)),
+                env)
+    loop = read_line('(sum-to v {0} 0)'.format(n))
+    bulk = read_line('(vector-sum v)')
+    base = best_time(lambda: scheme_eval(loop, env), repeat=1)
+    report('scheme loop', base)
+    report('vector-sum', best_time(lambda: scheme_eval(bulk, env)), base)
+    use_engine('tree')
+
+@benchmark("pairs")
+def bench_pairs(n='1000000'):
+    """Build a list of N elements with the Pair constructor and with
+    make_pair, showing the memory allocated per pair."""
+    n = int(n)
+    one = scnum(1)
+    for make in (Pair, make_pair):
+        def build():
+            lst = nil
+            for _ in range(n):
+                lst = make(one, lst)
+            return lst
+        tracemalloc.start()
+        lst = build()
+        allocated = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del lst
+        report(make.__name__, best_time(build))
+        print('{0:<24} {1:9.1f} bytes per pair'.format('', allocated / n))
+
+@benchmark("lists")
+def bench_lists(n='1000000'):
+    """Apply the list operations to lists of N elements, which must neither
+    exhaust the Python stack nor take more than linear time."""
+    n = int(n)
+    items = [scnum(k) for k in range(n)]
+    env = create_global_frame()
+    for name in ('xs', 'ys'):
+        lst = nil
+        for item in reversed(items):
+            lst = make_pair(item, lst)
+        env.define(intern(name), lst)
+    call = make_pair(intern('list'), env.lookup(intern('xs')))
+    for label, expr in (('length', '(length xs)'),
+                        ('equal?', '(equal? xs ys)'),
+                        ('append', '(append xs ys)'),
+                        ('evaluate arguments', call)):
+        if isinstance(expr, str):
+            expr = read_line(expr)
+        report(label, best_time(lambda: scheme_eval(expr, env), repeat=1))
+    xs = env.lookup(intern('xs'))
+    report('str', best_time(lambda: str(xs), repeat=1))
+    report('repr', best_time(lambda: repr(xs), repeat=1))
+    report('iterate', best_time(lambda: list(iter(xs)), repeat=1))
+
+@benchmark("forms")
+def bench_forms(engine='tree', *sizes):
+    """Call a procedure whose body is a begin, and, or and let with N forms
+    each, for each of SIZES, showing time per form evaluated."""
+    use_engine(engine)
+    for n in map(int, sizes or ('100', '200', '400')):
+        forms = ' '.join(['(+ x 1)'] * n)
+        env = run_lines(['(define (f x) (begin {0}) (and {0}) (or #f {0}) '
+                         '(let ((y x)) {0}))'.format(forms)])
+        expr = read_line('(f 1)')
+        seconds = best_time(lambda: scheme_eval(expr, env))
+        report('  n={0}'.format(n), seconds)
+        print('{0:<24} {1:9.3f}us per form'.format('', seconds / (4 * n) * 1e6))
+    use_engine('tree')
+
+@benchmark("tokens")
+def bench_tokens(src_file='tests.scm', megabytes='5'):
+    """Count the tokens in copies of SRC_FILE making up about MEGABYTES of
+    source."""
+    with open(src_file) as infile:
+        text = infile.read()
+    lines = (text * (int(float(megabytes) * 1e6) // len(text) + 1)).split('\n')
+    count = count_tokens(lines)
+    seconds = best_time(lambda: count_tokens(lines))
+    report('count_tokens', seconds)
+    print('{0:<24} {1:9.0f} tokens per second'.format('', count / seconds))
+
+@benchmark("read")
+def bench_read(megabytes='50'):
+    """Read a data file of about MEGABYTES of quoted lists of records, along
+    with a list nested 100000 deep."""
+    record = '({0} {0}.5 name{1} "string {0}")'
+    fd, path = tempfile.mkstemp(suffix='.scm')
+    try:
+        with os.fdopen(fd, 'w') as outfile:
+            print("'" + '(' * 100000 + ')' * 100000, file=outfile)
+            size, k = 0, 0
+            while size < float(megabytes) * 1e6:
+                line = "'(" + ' '.join(record.format(k + j, j % 97)
+                                       for j in range(20)) + ')'
+                print(line, file=outfile)
+                size += len(line) + 1
+                k += 20
+        def read_all():
+            with open(path) as infile:
+                src = Buffer(tokenize_lines(infile))
+                while src.current() is not None:
+                    scheme_read(src)
+        seconds = best_time(read_all, repeat=1)
+        report('read', seconds)
+        print('{0:<24} {1:9.2f} MB per second'.format('', size / seconds / 1e6))
+    finally:
+        os.remove(path)
+
+@benchmark("load")
+def bench_load(lines='100000'):
+    """Load a file of LINES definitions without the cache of its expressions,
+    the first time, the second time (when it is cached), and from its cache
+    (see scheme_cache.py), showing the time taken and the peak memory
+    allocated while loading."""
+    import scheme_cache
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'definitions.scm')
+    cache_dir = os.path.join(directory, scheme_cache.CACHE_DIR)
+    try:
+        with open(path, 'w') as outfile:
+            for k in range(int(lines)):
+                print('(define x{0} (+ {1} 1))'.format(k % 1000, k), file=outfile)
+        load = lambda: scheme_load(scstr(path), create_global_frame())
+        def first():
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        def second():
+            first()
+            load()
+        for label, enabled, prepare in (('load', False, lambda: None),
+                                        ('first load', True, first),
+                                        ('second load', True, second),
+                                        ('cached load', True, lambda: None)):
+            scheme_cache.enabled = enabled
+            prepare()
+            report(label, best_time(load, repeat=1))
+            prepare()
+            tracemalloc.start()
+            load()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print('{0:<24} {1:9.1f} MB peak'.format('', peak / 1e6))
+    finally:
+        scheme_cache.enabled = True
+        shutil.rmtree(directory)
+
+@benchmark("cache")
+def bench_cache(lines='20000'):
+    """Load a library of LINES definitions repeatedly without and with the
+    cache of its expressions (see scheme_cache.py)."""
+    import scheme_cache
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'library.scm')
+    try:
+        with open(path, 'w') as outfile:
+            for k in range(int(lines)):
+                print('(define (f{0} x) (if (< x {0}) (list x "{0}") '
+                      '(cons x (quote (a b {0})))))'.format(k), file=outfile)
+        load = lambda: scheme_load(scstr(path), create_global_frame())
+        scheme_cache.enabled = False
+        baseline = best_time(load)
+        report('no cache', baseline)
+        scheme_cache.enabled = True
+        report('first load', best_time(load, repeat=1))
+        report('cached', best_time(load), baseline)
+    finally:
+        shutil.rmtree(directory)
+
+PRELUDE_DEFINITION = """
+(define (f{0} x) (if (< x {0}) (cons x (f{0} (+ x 1))) nil))
+(define table{0} (map (lambda (k) (* k {0})) (f{0} {1})))"""
+
+@benchmark("image")
+def bench_image(definitions='2000'):
+    """Start an interpreter by loading a prelude of DEFINITIONS procedures and
+    lists, without and with its cache, and from an image of the global frame
+    saved after loading it (see scheme_image.py)."""
+    import scheme_cache
+    from scheme_image import load_image, save_image
+    directory = tempfile.mkdtemp()
+    prelude = os.path.join(directory, 'prelude.scm')
+    image = os.path.join(directory, 'prelude.img')
+    try:
+        with open(prelude, 'w') as outfile:
+            outfile.write('(define (map f s) (if (null? s) nil '
+                          '(cons (f (car s)) (map f (cdr s)))))')
+            for k in range(int(definitions)):
+                outfile.write(PRELUDE_DEFINITION.format(k, k - 20))
+        def replay():
+            env = create_global_frame()
+            scheme_load(scstr(prelude), env)
+            return env
+        scheme_cache.enabled = False
+        baseline = best_time(replay)
+        report('load prelude', baseline)
+        scheme_cache.enabled = True
+        replay()
+        report('load cached prelude', best_time(replay), baseline)
+        save_image(replay(), image)
+        report('load image', best_time(lambda: load_image(image)), baseline)
+        print('{0:<24} {1:9.1f} MB image'.format('', os.path.getsize(image) / 1e6))
+    finally:
+        shutil.rmtree(directory)
+
+KOCH = """
+(define (koch d k)
+  (if (= k 0)
+      (fd d)
+      (begin (koch (/ d 3) (- k 1)) (lt 60) (koch (/ d 3) (- k 1)) (rt 120)
+             (koch (/ d 3) (- k 1)) (lt 60) (koch (/ d 3) (- k 1)))))
+(speed 0)
+(turtle-batch {1})
+(clear)
+(koch 300 {0})
+(flush-turtle)
+"""
+
+@benchmark("turtle")
+def bench_turtle(depth='4', batch='1000'):
+    """Draw a Koch curve of DEPTH levels, updating the screen after each
+    command and after each BATCH commands."""
+    for size in ('0', batch):
+        lines = KOCH.format(depth, size).split('\n')
+        report('batch ' + size, best_time(lambda: run_lines(lines), repeat=1))
+
+@benchmark("svg")
+def bench_svg(segments='1000000', depth='6'):
+    """Draw SEGMENTS lines with an SvgTurtle, and then a Koch curve of DEPTH
+    levels from Scheme into an SVG file (see scheme_svg.py)."""
+    import scheme_primitives
+    from scheme_svg import SvgTurtle
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'drawing.svg')
+    try:
+        def draw():
+            t = SvgTurtle(path)
+            for k in range(int(segments)):
+                t.forward(k % 7 + 1)
+                t.left(59)
+            t.exitonclick()
+        seconds = best_time(draw, repeat=1)
+        report('SvgTurtle', seconds)
+        print('{0:<24} {1:9.0f} segments per second'.format(
+            '', int(segments) / seconds))
+        scheme_primitives.turtle_svg_file = path
+        lines = KOCH.format(depth, 0).split('\n') + ['(exitonclick)']
+        report('koch ' + depth, best_time(lambda: run_lines(lines), repeat=1))
+        print('{0:<24} {1:9.1f} MB file'.format('', os.path.getsize(path) / 1e6))
+    finally:
+        shutil.rmtree(directory)
+
+@benchmark("startup")
+def bench_startup(runs='20', top='10'):
+    """Time RUNS starts of the interpreter on a one-line file, against starts
+    of Python alone, and list the TOP imports by cumulative time as reported
+    by python3 -X importtime."""
+    import subprocess
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'startup.scm')
+    try:
+        with open(path, 'w') as outfile:
+            print('(display (+ 1 2))', file=outfile)
+        commands = [('python', [sys.executable, '-c', 'pass']),
+                    ('scheme.py FILE', [sys.executable, 'scheme.py', path])]
+        baseline = None
+        for label, command in commands:
+            run = lambda: subprocess.run(command, stdout=subprocess.DEVNULL,
+                                         check=True)
+            seconds = best_time(run, repeat=int(runs))
+            report(label, seconds)
+            baseline = baseline or seconds
+        print('{0:<24} {1:9.4f}s over python'.format('', seconds - baseline))
+        output = subprocess.run([sys.executable, '-X', 'importtime',
+                                 'scheme.py', path],
+                                stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE, universal_newlines=True)
+        imports = []
+        for line in output.stderr.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[1].strip().isdigit():
+                imports.append((int(fields[1]), fields[2].strip()))
+        print('imports by cumulative time')
+        for microseconds, name in sorted(imports, reverse=True)[:int(top)]:
+            print('  {0:<30} {1:7.1f}ms'.format(name, microseconds / 1e3))
+    finally:
+        shutil.rmtree(directory)
+
+@main
+def run(name=None, *args):
+    if name not in BENCHMARKS:
+        print('benchmarks:', ' '.join(sorted(BENCHMARKS)))
+        return
+    BENCHMARKS[name](*args)
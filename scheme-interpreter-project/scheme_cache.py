@@ -0,0 +1,289 @@
+"""This module caches the expressions read from Scheme source files.
+
+Loading a file with load, or running python3 scheme.py FILE, tokenizes and
+reads every line of the file before evaluating it.  The first time a file is
+loaded, load_file only notes that in the directory __scmcache__ next to the
+file, so that loading a file once costs no more than without a cache.  When
+the unchanged file is loaded again, load_file records what reading it
+produced: the expressions, the lines echoed after the prompt (if there is
+one), and the syntax errors and warnings reported.  It pickles that record
+into __scmcache__, and later loads of the unchanged file replay the record,
+evaluating the expressions without reading the source again.
+
+The record is a sequence of pickles, each of a list of up to CHUNK_EVENTS
+events, which are written as the file is read and read back as they are
+replayed, so that loading a file takes no more memory with a cache than
+without one.
+
+A cache is used only if the path, modification time, and size of the file,
+the prompt, and VERSION all match those recorded in it, so a changed file or
+interpreter simply replaces its cache.  Caches that cannot be written (in a
+read-only directory, say) are skipped silently.  Set enabled to False, or run
+    python3 scheme.py --no-cache FILE
+to load files without caches.
+"""
+
+import contextlib
+import gc
+import io
+import itertools
+import os
+import pickle
+import sys
+
+from scheme_primitives import *
+from scheme_reader import buffer_lines, scheme_read
+from scheme import scheme_eval, read_eval_print_loop
+
+# Whether load_file uses and writes caches
+enabled = True
+
+# Change CACHE_FORMAT whenever the reader or the representation of the
+# expressions it produces changes, so that older caches are not used.
+CACHE_FORMAT = 2
+VERSION = (CACHE_FORMAT, sys.version_info[:2])
+CACHE_DIR = '__scmcache__'
+
+# The number of events pickled together in a cache
+CHUNK_EVENTS = 1000
+
+# The events recorded while reading a file are tuples whose first element is
+#   ECHO (text)                    TEXT was printed as lines were read
+#   WARNING (text)                 TEXT was printed to stderr as lines were read
+#   ERROR (message)                reading failed with the error MESSAGE
+#   FORM (expr, more, line_count)  EXPR was read, ending on line LINE_COUNT,
+#                                  with more tokens on that line if MORE
+ECHO, WARNING, ERROR, FORM = range(4)
+
+def load_file(infile, env, prompt=None, quiet=True, startup=False):
+    """Evaluate the Scheme source in the open file INFILE in ENV, just as
+    read_eval_print_loop would, echoing lines after PROMPT unless it is None
+    and printing values unless QUIET, using the cache of INFILE if there is
+    one.
+
+    >>> import tempfile
+    >>> from scheme import create_global_frame
+    >>> env = create_global_frame()
+    >>> with tempfile.TemporaryDirectory() as directory:
+    ...     path = os.path.join(directory, 'exit.scm')
+    ...     with open(path, 'w') as outfile:
+    ...         print('(define x 1) (exit) (define x 2)', file=outfile)
+    ...     for _ in range(3):  # Noting, writing, and then reading the cache
+    ...         with open(path) as infile:
+    ...             load_file(infile, env)
+    ...         print(env.lookup('x'), os.listdir(directory))
+    1 ['__scmcache__', 'exit.scm']
+    1 ['__scmcache__', 'exit.scm']
+    1 ['__scmcache__', 'exit.scm']
+    """
+    events = None
+    if enabled:
+        events = cached_events(infile, prompt)
+    if events is None:
+        read_eval_print_loop(lambda: buffer_lines(infile, prompt), env,
+                             quiet=quiet, startup=startup)
+        return
+    try:
+        line_count = replay(events, env, quiet, startup)
+        for _ in events:  # Finish reading, so that a new cache is complete
+            pass
+    finally:
+        events.close()
+    if line_count is not None:
+        infile.seek(0)
+        lines = itertools.islice(infile, line_count, None)
+        read_eval_print_loop(lambda: buffer_lines(lines, prompt), env,
+                             quiet=quiet, startup=startup)
+
+def replay(events, env, quiet, startup):
+    """Evaluate the expressions of EVENTS, a generator, in ENV, printing their
+    echoes and errors, as read_eval_print_loop does.  An error in an
+    expression that is followed by more tokens on the same line makes
+    read_eval_print_loop skip the rest of that line; replay then returns the
+    number of lines read so far, at which reading must resume from the
+    source.  Otherwise, returns None, having stopped at the end of EVENTS or
+    on (exit), or having closed EVENTS after a keyboard interrupt."""
+    for event in events:
+        kind = event[0]
+        if kind is ECHO:
+            sys.stdout.write(event[1])
+        elif kind is WARNING:
+            sys.stderr.write(event[1])
+        elif kind is ERROR:
+            print("Error:", event[1])
+        else:
+            _, expression, more, line_count = event
+            try:
+                result = scheme_eval(expression, env)
+                if not quiet and result is not None:
+                    scheme_print(result)
+            except (SchemeError, SyntaxError, ValueError, RuntimeError) as err:
+                if (isinstance(err, RuntimeError) and
+                    'maximum recursion depth exceeded' not in err.args[0]):
+                    raise
+                print("Error:", err)
+                if more:
+                    return line_count
+            except KeyboardInterrupt:  # <Control>-C
+                if not startup:
+                    raise
+                print("\nKeyboardInterrupt")
+                events.close()
+                return None
+            except EOFError:  # (exit)
+                return None
+    return None
+
+def read_events(infile, prompt):
+    """Generate the events of reading all of INFILE as read_eval_print_loop
+    would, reading only as far as needed for each event."""
+    line_count = 0
+    def lines():
+        nonlocal line_count
+        for line in infile:
+            line_count += 1
+            yield line
+    source = lines()
+    out, err = io.StringIO(), io.StringIO()
+    src = None
+    while True:
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = out, err
+        try:
+            while src is None or not src.more_on_line:
+                src = buffer_lines(source, prompt)
+            expression = scheme_read(src)
+            event = (FORM, expression, src.more_on_line, line_count)
+        except (SchemeError, SyntaxError, ValueError, RuntimeError) as exc:
+            if (isinstance(exc, RuntimeError) and
+                'maximum recursion depth exceeded' not in exc.args[0]):
+                raise
+            event, src = (ERROR, str(exc)), None
+        except EOFError:
+            event = None
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+        for kind, text in ((ECHO, out), (WARNING, err)):
+            if text.tell():
+                yield (kind, text.getvalue())
+                text.seek(0)
+                text.truncate()
+        if event is None:
+            return
+        yield event
+
+def cache_path(filename, prompt):
+    """The name of the cache file for the source file FILENAME read with
+    PROMPT."""
+    directory, name = os.path.split(os.path.abspath(filename))
+    kind = 'quiet' if prompt is None else 'echo'
+    return os.path.join(directory, CACHE_DIR,
+                        '{0}.{1}.pickle'.format(name, kind))
+
+def cached_events(infile, prompt):
+    """A generator of the events of reading the open file INFILE with PROMPT,
+    from its cache if that is valid, or by reading INFILE and writing a new
+    cache as it goes if INFILE was loaded unchanged before.  Otherwise,
+    returns None, leaving INFILE unread, after noting that it was loaded."""
+    try:
+        stat = os.fstat(infile.fileno())
+        path = cache_path(infile.name, prompt)
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+    key = {'version': VERSION, 'path': os.path.abspath(infile.name),
+           'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'prompt': prompt}
+    try:
+        cache = open(path, 'rb')
+    except OSError:  # A missing or unreadable cache
+        pass
+    else:
+        try:
+            if pickle.load(cache) == key:
+                if pickle.load(cache) is True:
+                    return load_events(cache)
+                cache.close()  # Loaded once before
+                return record_events(read_events(infile, prompt), path, key)
+        except Exception:  # An outdated cache
+            pass
+        cache.close()
+    note_load(path, key)
+    return None
+
+def note_load(path, key):
+    """Write KEY and False to the cache file PATH, if possible, noting that
+    its source was loaded without recording the events of reading it."""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as cache:
+            dump(key, cache) and dump(False, cache)
+    except OSError:
+        pass
+
+def load_events(cache):
+    """Generate the events pickled in chunks in the open file CACHE, and
+    close it at the end."""
+    with cache:
+        while True:
+            try:
+                chunk = pickle.load(cache)
+            except EOFError:
+                return
+            yield from chunk
+
+@contextlib.contextmanager
+def collection_paused():
+    """Pause the garbage collector while unpickling, which creates many
+    objects but no garbage, so that the collector would otherwise spend most
+    of the time searching them for cycles."""
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if collecting:
+            gc.enable()
+
+def record_events(events, path, key):
+    """Generate EVENTS, writing KEY, True, and then chunks of the events to the
+    cache file PATH, if possible.  The cache is put in place only once all of
+    EVENTS have been generated."""
+    temp = '{0}.{1}.tmp'.format(path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        cache = open(temp, 'wb')
+    except OSError:
+        yield from events
+        return
+    complete = False
+    try:
+        writing = dump(key, cache) and dump(True, cache)
+        chunk = []
+        for event in events:
+            if writing:
+                chunk.append(event)
+                if len(chunk) == CHUNK_EVENTS:
+                    writing = dump(chunk, cache)
+                    chunk = []
+            yield event
+        if writing and chunk:
+            writing = dump(chunk, cache)
+        try:
+            cache.close()
+            if writing:
+                os.replace(temp, path)
+                complete = True
+        except OSError:
+            pass
+    finally:
+        cache.close()
+        if not complete:
+            with contextlib.suppress(OSError):
+                os.remove(temp)
+
+def dump(value, cache):
+    """Pickle VALUE to the open file CACHE, returning whether that worked."""
+    try:
+        pickle.dump(value, cache, pickle.HIGHEST_PROTOCOL)
+        return True
+    except (OSError, RecursionError, pickle.PicklingError):
+        return False
@@ -0,0 +1,236 @@
+"""This module implements an evaluator for Scheme with an explicit stack.
+
+Like the tree-walking scheme_eval in scheme.py, cek_eval works directly on the
+expressions read by scheme_read, but it never calls itself to evaluate an
+operator, an operand, or any other subexpression.  Its state consists of a
+control (the expression being evaluated, or the value just computed), the
+environment, and a continuation: a Python list of frames, each recording what
+remains to be done with the value of a subexpression.  Evaluating a
+subexpression pushes a frame; producing a value pops one and resumes it.  The
+depth of recursion in a Scheme program is therefore limited only by the
+memory available for the continuation, not by Python's recursion limit.
+
+Each continuation frame is a tuple whose first element is one of
+
+  OPERATOR (operands, env)           call the value on OPERANDS
+  OPERAND (procedure, values, rest, env)  add the value to VALUES
+  IF (vals, env)                     choose a branch of (if . VALS)
+  AND (rest, env), OR (rest, env)    test the value, then evaluate REST
+  COND (clause, clauses, env)        test the value for CLAUSE
+  SEQUENCE (rest, env)               discard the value and evaluate REST
+  LET (binding, rest, names, values, body, env)  bind the value
+  DEFINE (target, env)               bind TARGET to the value
+
+Calls in tail position push no frame, so tail-recursive loops run in constant
+space.  Special forms without a case here (lambda, mu, nu, quote, and the
+complex define form) are evaluated with their do_..._form functions, which do
+not evaluate subexpressions themselves.
+
+Select this evaluator with use_engine('cek') in scheme.py, or by running
+    python3 scheme.py --engine cek FILE
+"""
+
+from scheme_primitives import *
+from scheme import (Procedure, NuProcedure, Thunk, SPECIAL_FORMS, check_form,
+                    check_formals, and_sym, begin_sym, cond_sym, define_sym,
+                    else_sym, if_sym, let_sym, or_sym)
+
+(OPERATOR, OPERAND, IF, AND, OR, COND, SEQUENCE, LET, DEFINE) = range(9)
+
+def cek_eval(expr, env):
+    """Evaluate Scheme expression EXPR in environment ENV.  If ENV is None,
+    simply returns EXPR.
+
+    >>> from scheme import create_global_frame
+    >>> from scheme_reader import read_line
+    >>> env = create_global_frame()
+    >>> cek_eval(read_line(
+    ...     "(define (sum n) (if (= n 0) 0 (+ n (sum (- n 1)))))"), env)
+    intern('sum')
+    >>> cek_eval(read_line("(sum 20000)"), env)
+    scnum(200010000)
+    """
+    if env is None:
+        return expr
+    stack = []
+    push, pop = stack.append, stack.pop
+    while True:
+        # Evaluate EXPR in ENV, either computing its VALUE directly or
+        # pushing a frame and continuing with a subexpression.
+        if type(expr) is SchemeSymbol:
+            value = env.lookup(expr)
+            if type(value) is Thunk:
+                expr, env = value.body, value.env
+                continue
+        elif type(expr) is not Pair and expr.atomp():
+            value = expr
+        elif not expr.listp():
+            raise SchemeError("malformed list: {0}".format(str(expr)))
+        else:
+            first, rest = expr.first, expr.second
+            if type(first) is SchemeSymbol and first in SPECIAL_FORMS:
+                if first is if_sym:
+                    check_form(rest, 2, 3)
+                    push((IF, rest, env))
+                    expr = rest.first
+                    continue
+                elif first is and_sym or first is or_sym:
+                    if rest is nil:
+                        value = scheme_true if first is and_sym else scheme_false
+                    else:
+                        if rest.second is not nil:
+                            push((AND if first is and_sym else OR,
+                                  rest.second, env))
+                        expr = rest.first
+                        continue
+                elif first is begin_sym:
+                    check_form(rest, 0)
+                    if rest is nil:
+                        value = okay
+                    else:
+                        if rest.second is not nil:
+                            push((SEQUENCE, rest.second, env))
+                        expr = rest.first
+                        continue
+                elif first is cond_sym:
+                    if rest is nil:
+                        value = okay
+                    else:
+                        clause = rest.first
+                        check_form(clause, 1)
+                        if clause.first is else_sym:
+                            expr, env = SPECIAL_FORMS[first](rest, env)
+                            if env is not None:
+                                continue
+                            value = expr
+                        else:
+                            push((COND, clause, rest.second, env))
+                            expr = clause.first
+                            continue
+                elif first is let_sym:
+                    check_form(rest, 2)
+                    bindings = rest.first
+                    if not scheme_listp(bindings):
+                        raise SchemeError("bad bindings list in let form")
+                    if bindings is nil:
+                        env = env.make_call_frame(nil, nil)
+                        expr = Pair(begin_sym, rest.second)
+                        continue
+                    check_form(bindings.first, 2)
+                    push((LET, bindings.first, bindings.second, nil, nil,
+                          rest.second, env))
+                    expr = bindings.first.second.first
+                    continue
+                elif (first is define_sym and rest is not nil and
+                      type(rest.first) is SchemeSymbol):
+                    check_form(rest, 2, 2)
+                    push((DEFINE, rest.first, env))
+                    expr = rest.second.first
+                    continue
+                else:
+                    expr, env = SPECIAL_FORMS[first](rest, env)
+                    if env is not None:
+                        continue
+                    value = expr
+            else:
+                push((OPERATOR, rest, env))
+                expr = first
+                continue
+
+        # Return VALUE to the continuation: pop frames until one of them
+        # needs another subexpression evaluated.
+        while True:
+            if not stack:
+                return value
+            frame = pop()
+            kind = frame[0]
+            if kind is OPERAND:
+                _, procedure, values, rest, env = frame
+                values.append(value)
+                if rest is not nil:
+                    push((OPERAND, procedure, values, rest.second, env))
+                    expr = rest.first
+                    break
+                args = scheme_list(*values)
+            elif kind is OPERATOR:
+                _, rest, env = frame
+                procedure = value
+                if type(procedure) is NuProcedure or not isinstance(
+                        procedure, Procedure):
+                    args = procedure.evaluate_arguments(rest, env)
+                elif rest is not nil:
+                    push((OPERAND, procedure, [], rest.second, env))
+                    expr = rest.first
+                    break
+                else:
+                    args = nil
+            elif kind is IF:
+                _, vals, env = frame
+                if value:
+                    expr = vals.second.first
+                    break
+                elif vals.second.second is not nil:
+                    expr = vals.second.second.first
+                    break
+                value = okay
+                continue
+            elif kind is AND or kind is OR:
+                _, rest, env = frame
+                if (not value) if kind is AND else value:
+                    if kind is AND:
+                        value = scheme_false
+                    continue
+                if rest.second is not nil:
+                    push((kind, rest.second, env))
+                expr = rest.first
+                break
+            elif kind is SEQUENCE:
+                _, rest, env = frame
+                if rest.second is not nil:
+                    push((SEQUENCE, rest.second, env))
+                expr = rest.first
+                break
+            elif kind is COND:
+                _, clause, clauses, env = frame
+                if value:
+                    if clause.second is nil:
+                        continue
+                    expr = Pair(begin_sym, clause.second)
+                    break
+                if clauses is nil:
+                    value = okay
+                    continue
+                clause = clauses.first
+                check_form(clause, 1)
+                if clause.first is else_sym:
+                    expr = Pair(cond_sym, clauses)
+                    break
+                push((COND, clause, clauses.second, env))
+                expr = clause.first
+                break
+            elif kind is LET:
+                _, binding, rest, names, values, body, env = frame
+                names = make_pair(binding.first, names)
+                values = make_pair(value, values)
+                if rest is not nil:
+                    check_form(rest.first, 2)
+                    push((LET, rest.first, rest.second, names, values, body,
+                          env))
+                    expr = rest.first.second.first
+                    break
+                check_formals(names)
+                env = env.make_call_frame(names, values)
+                expr = Pair(begin_sym, body)
+                break
+            else:
+                _, target, env = frame
+                env.define(target, value)
+                value = target
+                continue
+
+            # Apply PROCEDURE to ARGS.  A procedure that returns an expression
+            # to evaluate is tail-called: no frame remains for the call.
+            expr, env = procedure.apply(args, env)
+            if env is not None:
+                break
+            value = expr
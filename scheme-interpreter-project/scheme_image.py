@@ -0,0 +1,129 @@
+"""This module saves the global environment to an image file and restores it.
+
+Starting a session by loading a large prelude evaluates every definition in it
+again.  Instead, the global frame can be saved once the prelude is loaded:
+    (load "prelude")
+    (save-image "prelude.img")
+and a later session can start from the image:
+    python3 scheme.py --image prelude.img
+
+An image holds the bindings of the global frame and everything they refer to:
+lambda, mu, and nu procedures with the frames they were defined in, lists,
+vectors, strings, hash tables, and symbols, which are interned again when the
+image is loaded.  Primitive procedures are saved by name and restored as the
+primitives of the same name in the interpreter loading the image, so an image
+cannot hold primitives that are not in the global frame to begin with.  The
+analyzed and compiled forms of procedures are not saved; engines that use them
+rebuild them when the procedures are first called.
+"""
+
+import pickle
+import sys
+
+from scheme_primitives import *
+from scheme import PrimitiveProcedure, create_global_frame
+from scheme_cache import collection_paused
+
+# Change IMAGE_FORMAT whenever the classes of the values saved in images
+# change, so that older images are rejected.
+IMAGE_FORMAT = 1
+VERSION = (IMAGE_FORMAT, sys.version_info[:2])
+
+def primitive_names(env):
+    """A dictionary from the Python function of each primitive procedure
+    bound in the global frame ENV to the first name it is bound to."""
+    names = {}
+    for sym, cell in env.bindings.items():
+        if isinstance(cell.value, PrimitiveProcedure):
+            names.setdefault(cell.value.fn, str(sym))
+    return names
+
+class ImagePickler(pickle.Pickler):
+    """A pickler that saves primitive procedures by their names in NAMES, a
+    dictionary from their Python functions to their names.
+
+    Unlike Pair.__reduce__, it saves each pair only once, so that lists that
+    share tails, and circular lists, are restored with the same structure.
+    The first pair of a list it saves is followed by the others in the list,
+    each saved empty, and then by all their elements, which fill_pairs puts
+    in place when the list is loaded.  A list ends at the first pair that has
+    been saved already, so that pickling does not recurse along lists."""
+
+    def __init__(self, outfile, names):
+        pickle.Pickler.__init__(self, outfile, pickle.HIGHEST_PROTOCOL)
+        self.names = names
+        self.saved = set()   # The ids of the pairs saved so far
+        self.pending = set() # The ids of pairs to save empty
+
+    def reducer_override(self, obj):
+        if type(obj) is not Pair:
+            return NotImplemented
+        if id(obj) in self.pending:
+            self.pending.remove(id(obj))
+            return (empty_pair, ())
+        pairs, items, p = [], [obj.first], obj.second
+        self.saved.add(id(obj))
+        while type(p) is Pair and id(p) not in self.saved:
+            self.saved.add(id(p))
+            self.pending.add(id(p))
+            pairs.append(p)
+            items.append(p.first)
+            p = p.second
+        return (empty_pair, (), (pairs, items, p), None, None, fill_pairs)
+
+    def persistent_id(self, obj):
+        if type(obj) is not PrimitiveProcedure:
+            return None
+        name = self.names.get(obj.fn)
+        if name is None:
+            raise SchemeError("cannot save primitive: {0}".format(obj.fn))
+        return name
+
+def empty_pair():
+    """A pair whose elements are filled in later by fill_pairs."""
+    return object.__new__(Pair)
+
+def fill_pairs(pair, state):
+    """Link PAIR and the PAIRS after it into a list of ITEMS ending in END,
+    where STATE is (PAIRS, ITEMS, END)."""
+    pairs, items, end = state
+    for p, item, second in zip([pair] + pairs, items, pairs + [end]):
+        p.first = item
+        p.second = second
+
+class ImageUnpickler(pickle.Unpickler):
+    """An unpickler that restores primitive procedures as the procedures of
+    the same name in the global frame PRIMITIVES."""
+
+    def __init__(self, infile, primitives):
+        pickle.Unpickler.__init__(self, infile)
+        self.primitives = primitives
+
+    def persistent_load(self, name):
+        return self.primitives.lookup(name)
+
+def save_image(env, filename):
+    """Save the global frame ENV to the image file FILENAME."""
+    names = primitive_names(create_global_frame())
+    try:
+        with open(filename, 'wb') as outfile:
+            pickler = ImagePickler(outfile, names)
+            pickler.dump(VERSION)
+            pickler.dump(env)
+    except RecursionError:
+        raise SchemeError("cannot save image: values are nested too deeply")
+    except (OSError, pickle.PicklingError) as exc:
+        raise SchemeError("cannot save image: {0}".format(exc))
+
+def load_image(filename):
+    """The global frame saved in the image file FILENAME."""
+    try:
+        with open(filename, 'rb') as infile:
+            unpickler = ImageUnpickler(infile, create_global_frame())
+            if unpickler.load() != VERSION:
+                raise SchemeError("{0} was saved by a different version of "
+                                  "the interpreter".format(filename))
+            with collection_paused():
+                return unpickler.load()
+    except (OSError, EOFError, pickle.UnpicklingError) as exc:
+        raise SchemeError("cannot load image: {0}".format(exc))
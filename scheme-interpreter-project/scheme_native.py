@@ -0,0 +1,470 @@
+"""This module translates Scheme procedures into Python functions.
+
+native_procedure takes a LambdaProcedure and writes the Python source of an
+equivalent function, which it compiles once with compile and exec.  The result
+is a NativeProcedure, which can be called wherever the original could: its
+apply method runs the Python function and returns (value, None).
+
+The generated code keeps formal parameters and let-bound names in Python local
+variables and reads global names through their Cells in the global frame.
+Calls to primitive procedures from get_primitive_bindings call their Python
+functions directly (the two-operand versions in BINARY_PRIMITIVES when there
+are two operands), as long as the global name still refers to the primitive.
+A call of the procedure to itself in tail position becomes another iteration
+of a while loop, so that tail-recursive loops run in constant space.  Other
+calls, including tail calls to other procedures, are ordinary Python calls.
+A call whose operator turns out to be a mu or nu procedure is handed to the
+interpreter before its operands are evaluated, together with a frame holding
+the local variables of the native code, so that mu procedures see the
+caller's variables and nu procedures receive their operands unevaluated.
+
+Only lambda procedures whose bodies use quote, if, cond, and, or, begin, let,
+and procedure calls can be translated.  For anything else (mu and nu
+procedures, bodies that use define, lambda, or eval, and malformed bodies)
+native_procedure returns the original procedure, which the interpreter runs as
+usual.  Primitives that take the calling environment, such as eval, receive
+the environment of the native procedure's definition.
+
+From Scheme, (native f) returns the native version of procedure f, e.g.
+    (define fib (native fib))
+"""
+
+from scheme_primitives import *
+from scheme import (PrimitiveProcedure, LambdaProcedure, MuProcedure,
+                    NuProcedure, Procedure, CallFrame, GlobalFrame,
+                    SPECIAL_FORMS, scheme_apply, check_form,
+                    check_formals, and_sym, begin_sym, cond_sym, else_sym,
+                    if_sym, let_sym, or_sym, quote_sym)
+from scheme_analyze import binds_dynamically
+
+class NativeProcedure(Procedure):
+    """A Scheme procedure translated into the Python function FN.  PROCEDURE
+    is the LambdaProcedure it was translated from, and SOURCE the text of the
+    Python code."""
+
+    def __init__(self, fn, procedure, source):
+        self.fn = fn
+        self.procedure = procedure
+        self.source = source
+        self.arity = len(procedure.formals)
+
+    def __str__(self):
+        return '#[native {0}]'.format(self.procedure)
+
+    def __repr__(self):
+        return 'NativeProcedure({0!r})'.format(self.procedure)
+
+    def __getstate__(self):
+        """Pickle only the procedure translated, since FN cannot be pickled.
+        The environment it refers to may not have been loaded yet when the
+        NativeProcedure is, so it is translated again when first called."""
+        return self.procedure
+
+    def __setstate__(self, procedure):
+        self.procedure = procedure
+        self.fn = self.source = self.arity = None
+
+    def translate_again(self):
+        """Fill in FN, SOURCE, and ARITY by translating PROCEDURE again."""
+        native = native_procedure(self.procedure)
+        if native is self.procedure:
+            raise SchemeError("cannot translate {0}".format(self.procedure))
+        self.fn, self.source, self.arity = native.fn, native.source, native.arity
+
+    def apply(self, args, env):
+        """Apply the native procedure to ARGS.  Returns (val, None)."""
+        return call_native(self, list(args)), None
+
+def call_native(procedure, args):
+    """Call the NativeProcedure PROCEDURE on the Python list ARGS."""
+    if len(args) != procedure.arity:
+        if procedure.arity is None:
+            procedure.translate_again()
+            return call_native(procedure, args)
+        raise SchemeError('different number of formal parameters and arguments')
+    try:
+        return procedure.fn(*args)
+    except TypeError as err:
+        raise SchemeError(err)
+
+_PRIMITIVE_FNS = {fn for names, fn in get_primitive_bindings()}
+
+class Unsupported(Exception):
+    """Raised when a procedure uses a feature that cannot be translated."""
+
+def native_procedure(procedure):
+    """Return a NativeProcedure equivalent to the LambdaProcedure PROCEDURE,
+    or PROCEDURE itself if it cannot be translated.
+
+    >>> from scheme import create_global_frame, scheme_eval
+    >>> from scheme_reader import read_line
+    >>> env = create_global_frame()
+    >>> scheme_eval(read_line(
+    ...     "(define (sum n total) (if (= n 0) total (sum (- n 1) (+ n total))))"),
+    ...     env)
+    intern('sum')
+    >>> sum = native_procedure(env.lookup('sum'))
+    >>> type(sum).__name__
+    'NativeProcedure'
+    >>> env.define('sum', sum)
+    >>> scheme_eval(read_line("(sum 100000 0)"), env)
+    scnum(5000050000)
+    """
+    if type(procedure) is not LambdaProcedure:
+        return procedure
+    try:
+        return Translator(procedure).translate()
+    except (Unsupported, SchemeError):
+        return procedure
+
+class Translator:
+    """A Translator writes the Python source of the function for one
+    procedure.  Each Scheme expression is translated into a Python expression,
+    preceded by any statements needed to compute it (for conditionals and
+    let), which are written to self.lines.  SCOPE dictionaries map the
+    symbols bound in the procedure to the names of Python variables."""
+
+    def __init__(self, procedure):
+        self.procedure = procedure
+        self.env = procedure.env
+        self.namespace = {'call': native_caller(self.env),
+                          'call_by_name': by_name_caller(self.env),
+                          'BY_NAME': (MuProcedure, NuProcedure),
+                          'lookup': self.env.lookup, 'ORIGINAL': procedure}
+        self.lines = []
+        self.indent = 1
+        self.count = 0
+
+    def translate(self):
+        procedure = self.procedure
+        if binds_dynamically(procedure.body):
+            raise Unsupported('define or eval')
+        params = [self.fresh('p') for _ in procedure.formals]
+        scope = dict(zip(procedure.formals, params))
+        self.params = params
+        self.emit('while True:')
+        self.indent += 1
+        self.tail(procedure.body, scope)
+        source = 'def native({0}):\n{1}\n'.format(', '.join(params),
+                                                  '\n'.join(self.lines))
+        exec(compile(source, '<native {0}>'.format(procedure), 'exec'),
+             self.namespace)
+        native = NativeProcedure(self.namespace['native'], procedure, source)
+        self.namespace['THIS'] = native
+        return native
+
+    # Output
+
+    def emit(self, line):
+        self.lines.append('    ' * self.indent + line)
+
+    def fresh(self, prefix='t'):
+        """A new Python variable name."""
+        self.count += 1
+        return '{0}{1}'.format(prefix, self.count)
+
+    def constant(self, value):
+        name = self.fresh('k')
+        self.namespace[name] = value
+        return name
+
+    def global_cell(self, sym):
+        """The name of a Python variable holding the Cell of global SYM, or
+        None if SYM has no global binding."""
+        if not isinstance(self.env, GlobalFrame):
+            return None
+        cell = self.env.bindings.get(sym)
+        if cell is None:
+            return None
+        name = self.fresh('g')
+        self.namespace[name] = cell
+        return name
+
+    # Expressions
+
+    def expr(self, expr, scope):
+        """Return a Python expression for the value of EXPR."""
+        if scheme_symbolp(expr):
+            if expr in scope:
+                return scope[expr]
+            cell = self.global_cell(expr)
+            if cell is not None:
+                return cell + '.value'
+            return 'lookup({0})'.format(self.constant(expr))
+        elif scheme_atomp(expr):
+            return self.constant(expr)
+        form, vals = self.split(expr)
+        if form is None:
+            return self.call(expr.first, vals, scope)
+        if form is quote_sym:
+            check_form(vals, 1, 1)
+            return self.constant(vals[0])
+        result = self.fresh()
+        self.statement(form, vals, scope, result)
+        return result
+
+    def split(self, expr):
+        """Return (form, operands) for a combination EXPR, where FORM is the
+        special form symbol or None for a call."""
+        if not scheme_listp(expr):
+            raise Unsupported('malformed list')
+        first = expr.first
+        if scheme_symbolp(first) and first in SPECIAL_FORMS:
+            if first not in (quote_sym, if_sym, cond_sym, and_sym, or_sym,
+                             begin_sym, let_sym):
+                raise Unsupported(str(first))
+            return first, expr.second
+        return None, expr.second
+
+    def arguments(self, operands, scope):
+        """Translate OPERANDS, returning Python expressions for their values,
+        which are computed in order into variables when needed."""
+        args = []
+        for operand in operands:
+            arg = self.expr(operand, scope)
+            if not self.is_simple(operand, scope):
+                temp = self.fresh()
+                self.emit('{0} = {1}'.format(temp, arg))
+                arg = temp
+            args.append(arg)
+        return args
+
+    def is_simple(self, expr, scope):
+        return (scheme_symbolp(expr) and expr in scope) or (
+            scheme_atomp(expr) and not scheme_symbolp(expr))
+
+    def operator(self, operator, operands, scope, known, target):
+        """Write a statement that puts the value of OPERATOR in a new
+        variable, which is returned, followed by an if statement that passes
+        OPERANDS to call_by_name, prefixed by TARGET, if that value is a mu or
+        nu procedure.  KNOWN, if not None, names a value that the operator
+        usually has and that needs no test."""
+        op = self.fresh()
+        self.emit('{0} = {1}'.format(op, self.expr(operator, scope)))
+        test = 'type({0}) in BY_NAME'.format(op)
+        if known is not None:
+            test = '{0} is not {1} and {2}'.format(op, known, test)
+        self.emit('if {0}:'.format(test))
+        self.indent += 1
+        self.emit('{0}call_by_name({1}, {2}, {3}, [{4}])'.format(
+            target, op, self.constant(operands), self.constant(tuple(scope)),
+            ', '.join(scope.values())))
+        self.indent -= 1
+        return op
+
+    def call(self, operator, operands, scope):
+        cell = None
+        if scheme_symbolp(operator) and operator not in scope:
+            cell = self.global_cell(operator)
+        current = self.namespace[cell].value if cell is not None else None
+        result = self.fresh()
+        known = kind = None
+        if (type(current) is PrimitiveProcedure and not current.use_env and
+            current.fn in _PRIMITIVE_FNS):
+            known, kind = self.constant(current), 'primitive'
+        elif current is self.procedure and len(operands) == len(self.params):
+            known, kind = 'THIS', 'self'
+        op = self.operator(operator, operands, scope, known, result + ' = ')
+        self.emit('else:')
+        self.indent += 1
+        arg_list = ', '.join(self.arguments(operands, scope))
+        general = 'call({0}, [{1}])'.format(op, arg_list)
+        if kind == 'primitive':
+            fn = current.fn
+            if len(operands) == 2:
+                fn = BINARY_PRIMITIVES.get(fn, fn)
+            general = '{0}({1}) if {2} is {3} else {4}'.format(
+                self.constant(fn), arg_list, op, known, general)
+        elif kind == 'self':
+            general = 'native({0}) if {1} is THIS or {1} is ORIGINAL ' \
+                      'else {2}'.format(arg_list, op, general)
+        self.emit('{0} = {1}'.format(result, general))
+        self.indent -= 1
+        return result
+
+    # Statements
+
+    def statement(self, form, vals, scope, result):
+        """Write statements that compute the special form FORM with operands
+        VALS, assigning its value to the variable RESULT."""
+        if form is if_sym:
+            check_form(vals, 2, 3)
+            self.emit('if {0}:'.format(self.expr(vals[0], scope)))
+            self.block(vals[1], scope, result)
+            self.emit('else:')
+            if len(vals) == 3:
+                self.block(vals[2], scope, result)
+            else:
+                self.block(okay, scope, result)
+        elif form is cond_sym:
+            self.emit('while True:')
+            self.indent += 1
+            for clause, body in self.clauses(vals):
+                if clause is None:
+                    self.assign_sequence(body, scope, result)
+                    self.emit('break')
+                    break
+                self.emit('{0} = {1}'.format(result, self.expr(clause, scope)))
+                self.emit('if {0}:'.format(result))
+                self.indent += 1
+                if body is not nil:
+                    self.assign_sequence(body, scope, result)
+                self.emit('break')
+                self.indent -= 1
+            else:
+                self.emit('{0} = {1}'.format(result, self.constant(okay)))
+                self.emit('break')
+            self.indent -= 1
+        elif form is and_sym or form is or_sym:
+            exprs = list(vals)
+            if not exprs:
+                value = scheme_true if form is and_sym else scheme_false
+                self.emit('{0} = {1}'.format(result, self.constant(value)))
+                return
+            test = 'if {0}:' if form is and_sym else 'if not {0}:'
+            depth = self.indent
+            for expr in exprs[:-1]:
+                self.emit('{0} = {1}'.format(result, self.expr(expr, scope)))
+                self.emit(test.format(result))
+                self.indent += 1
+            self.emit('{0} = {1}'.format(result, self.expr(exprs[-1], scope)))
+            self.indent = depth
+        elif form is begin_sym:
+            check_form(vals, 0)
+            self.assign_sequence(vals if vals is not nil else Pair(okay, nil),
+                                 scope, result)
+        elif form is let_sym:
+            scope = self.let_scope(vals, scope)
+            self.assign_sequence(vals.second, scope, result)
+
+    def block(self, expr, scope, result):
+        """Write an indented block that assigns the value of EXPR to RESULT."""
+        self.indent += 1
+        self.emit('{0} = {1}'.format(result, self.expr(expr, scope)))
+        self.indent -= 1
+
+    def assign_sequence(self, exprs, scope, result):
+        exprs = list(exprs)
+        for expr in exprs[:-1]:
+            self.emit(self.expr(expr, scope))
+        self.emit('{0} = {1}'.format(result, self.expr(exprs[-1], scope)))
+
+    def clauses(self, vals):
+        """Pairs (test, body) for the clauses of a cond, where test is None
+        for an else clause."""
+        clauses = list(vals)
+        for i, clause in enumerate(clauses):
+            check_form(clause, 1)
+            if clause.first is else_sym:
+                if i < len(clauses)-1 or clause.second is nil:
+                    raise Unsupported('malformed cond')
+                check_form(clause.second, 1)
+                yield None, clause.second
+            else:
+                check_form(clause.second, 0)
+                yield clause.first, clause.second
+
+    def let_scope(self, vals, scope):
+        """Write assignments for the bindings of a let with operands VALS,
+        returning the scope of its body."""
+        check_form(vals, 2)
+        bindings = vals[0]
+        if not scheme_listp(bindings):
+            raise Unsupported('malformed let')
+        names = []
+        for binding in bindings:
+            check_form(binding, 2, 2)
+            name = self.fresh('v')
+            self.emit('{0} = {1}'.format(name, self.expr(binding[1], scope)))
+            names.append((binding[0], name))
+        check_formals(scheme_list(*[sym for sym, _ in names]))
+        scope = dict(scope)
+        scope.update(names)
+        return scope
+
+    # Tail position
+
+    def tail(self, expr, scope):
+        """Write statements that return the value of EXPR, which is in tail
+        position, or that continue the loop for a call to the procedure
+        itself."""
+        if not scheme_pairp(expr):
+            self.emit('return ' + self.expr(expr, scope))
+            return
+        form, vals = self.split(expr)
+        if form is None:
+            self.tail_call(expr.first, vals, scope)
+        elif form is if_sym:
+            check_form(vals, 2, 3)
+            self.emit('if {0}:'.format(self.expr(vals[0], scope)))
+            self.indent += 1
+            self.tail(vals[1], scope)
+            self.indent -= 1
+            self.tail(vals[2] if len(vals) == 3 else okay, scope)
+        elif form is cond_sym:
+            for clause, body in self.clauses(vals):
+                if clause is None:
+                    self.tail_sequence(body, scope)
+                    return
+                test = self.fresh()
+                self.emit('{0} = {1}'.format(test, self.expr(clause, scope)))
+                self.emit('if {0}:'.format(test))
+                self.indent += 1
+                if body is nil:
+                    self.emit('return ' + test)
+                else:
+                    self.tail_sequence(body, scope)
+                self.indent -= 1
+            self.emit('return ' + self.constant(okay))
+        elif form is begin_sym:
+            check_form(vals, 0)
+            self.tail_sequence(vals if vals is not nil else Pair(okay, nil),
+                               scope)
+        elif form is let_sym:
+            self.tail_sequence(vals.second, self.let_scope(vals, scope))
+        else:
+            self.emit('return ' + self.expr(expr, scope))
+
+    def tail_sequence(self, exprs, scope):
+        exprs = list(exprs)
+        for expr in exprs[:-1]:
+            self.emit(self.expr(expr, scope))
+        self.tail(exprs[-1], scope)
+
+    def tail_call(self, operator, operands, scope):
+        cell = None
+        if scheme_symbolp(operator) and operator not in scope:
+            cell = self.global_cell(operator)
+        if (cell is None or self.namespace[cell].value is not self.procedure
+            or len(operands) != len(self.params)):
+            self.emit('return ' + self.call(operator, operands, scope))
+            return
+        op = self.operator(operator, operands, scope, 'THIS', 'return ')
+        args = self.arguments(operands, scope)
+        self.emit('if {0} is THIS or {0} is ORIGINAL:'.format(op))
+        self.indent += 1
+        if args:
+            self.emit('{0} = {1}'.format(', '.join(self.params), ', '.join(args)))
+        self.emit('continue')
+        self.indent -= 1
+        self.emit('return call({0}, [{1}])'.format(op, ', '.join(args)))
+
+def native_caller(env):
+    """Return a function that calls a procedure on a Python list of values
+    from native code.  Procedures that take the calling environment, such as
+    eval, receive ENV, the environment of the native procedure's definition."""
+    def call(procedure, args):
+        if type(procedure) is NativeProcedure:
+            return call_native(procedure, args)
+        return scheme_apply(procedure, scheme_list(*args), env)
+    return call
+
+def by_name_caller(env):
+    """Return a function that calls a mu or nu procedure from native code on
+    the Scheme list of unevaluated OPERANDS, in a frame whose parent is ENV
+    that binds NAMES to the VALUES of the native code's local variables."""
+    def call_by_name(procedure, operands, names, values):
+        frame = CallFrame(env, names, values)
+        args = procedure.evaluate_arguments(operands, frame)
+        return scheme_apply(procedure, args, frame)
+    return call_by_name
@@ -1,15 +1,24 @@
 """This module implements the primitives of the Scheme language."""
 
+import array
+import itertools
 import math
 import operator
+import os
 import sys
+import types
 import numbers
 import re
 
 try:
-    import turtle
-except:
-    print("warning: could not import the turtle module.", file=sys.stderr)
+    import numpy
+except ImportError:
+    numpy = None
+
+# The turtle module, imported by the first turtle primitive called (see
+# _tscheme_prep), since importing it and tkinter slows down every start.
+# It is replaced by an SvgTurtle (see scheme_svg.py) when drawing to a file.
+turtle = None
 
 #############################
 # Errors and Error Checking #
@@ -60,7 +69,9 @@ class SchemeValue:
     """The parent class of all Scheme values manipulated by the interpreter.
     The methods here give default implementations, and are overridden in the
     subclasses of SchemeValue."""
-    
+
+    __slots__ = ()
+
     def __bool__(self):
         """True if I am supposed to count as a "true value" in Python.  This
         is the method used by Python's conditionals (if, and, or, not, while)
@@ -107,6 +118,9 @@ class SchemeValue:
 
     def listp(self):
         return scheme_false
+
+    def vectorp(self):
+        return scheme_false
     
     def length(self):
         bad_type(self, 0, "length")
@@ -155,7 +169,7 @@ class SchemeValue:
         bad_type(self, 0, "zero?")
 
     def cons(self, y):
-        return Pair(self, y)
+        return make_pair(self, y)
 
     def append(self, y):
         bad_type(self, 0, "append")
@@ -229,6 +243,9 @@ class okay(SchemeValue):
     def __repr__(self):
         return "okay"
 
+    def __reduce__(self):
+        return "okay"
+
 okay = okay() # Assignment hides the okay class; there is only one instance
 
 ############
@@ -242,6 +259,9 @@ class scheme_true(SchemeValue):
     def __repr__(self):
         return 'scheme_true'
 
+    def __reduce__(self):
+        return 'scheme_true'
+
     def __str__(self):
         return "#t"
 
@@ -255,6 +275,9 @@ class scheme_false(SchemeValue):
     def __repr__(self):
         return 'scheme_false'
 
+    def __reduce__(self):
+        return 'scheme_false'
+
     def __str__(self):
         return "#f"
 
@@ -316,6 +339,12 @@ class SchemeNumber(SchemeValue):
 # integer, x, into a SchemeInt, use SchemeInt(x); likewise for SchemeFloat.
 
 class SchemeInt(SchemeNumber, int):
+    def __str__(self):
+        return int.__repr__(self)
+
+    def __reduce__(self):
+        return (scnum, (int(self),))
+
     def integerp(self):
         return scheme_true
 
@@ -360,6 +389,12 @@ class SchemeInt(SchemeNumber, int):
         return scbool(self % 2 == 1)
 
 class SchemeFloat(SchemeNumber, float):
+    def __str__(self):
+        return float.__repr__(self)
+
+    def __reduce__(self):
+        return (SchemeFloat, (float(self),))
+
     def neg(self):
         return SchemeFloat(-self)
 
@@ -378,6 +413,17 @@ scint = SchemeInt
 scfloat = SchemeFloat
 
 def scnum(num):
+    """The Scheme number for NUM: a SchemeInt if NUM has an integral value,
+    otherwise a SchemeFloat.
+
+    Each call returns a new number, so that eq? distinguishes equal numbers
+    computed separately, as it always has.
+
+    >>> scnum(3) is scnum(3), scnum(2.0), scnum(2.5)
+    (False, scnum(2), scnum(2.5))
+    """
+    if type(num) is int:
+        return scint(num)
     r = round(num)
     if r == num:
         return scint(r)
@@ -414,6 +460,9 @@ class SchemeSymbol(SchemeValue):
     def __str__(self):
         return self.name
 
+    def __reduce__(self):
+        return (intern, (self.name,))
+
 # The symbols corresponding to each unique symbol name.
 _all_symbols = {}
 
@@ -444,15 +493,15 @@ class SchemeStr(SchemeValue, str):
     def __repr__(self):
         return "scstr({!r})".format(str(self))
 
-    _escape = re.compile(r'''"|\.''')
+    _escape = re.compile(r'''"|\\.''')
 
     def print_repr(self):
         s = str.__repr__(self)
         if s[0] == "'":
             s = s[1:-1]
-            s = SchemeStr._escape.sub(lambda x: (r'\"' if x == '"' 
-                                                 else "'" if x == r"\'"
-                                                 else x), s)
+            s = SchemeStr._escape.sub(lambda x: (r'\"' if x.group() == '"'
+                                                 else "'" if x.group() == r"\'"
+                                                 else x.group()), s)
             s = '"' + s + '"'
         return s
 
@@ -482,18 +531,21 @@ class Pair(SchemeValue):
     scnum(2)
     >>> print(s.map(lambda x: x+4))
     (5 6)
+
+    Pairs have no instance dictionary, and code that already holds
+    SchemeValues builds them with make_pair, which skips the conversions.
     """
+
+    __slots__ = ('first', 'second')
+
     def __init__(self, first, second):
         """The pair (FIRST . SECOND).  As a convenience, FIRST and SECOND
         are coerced from Python numbers to SchemeNumbers or from Python
         strings to SchemeStrs."""
-        first = scheme_coerce(first)
-        second = scheme_coerce(second)
-
-        assert isinstance(first, SchemeValue) and \
-               isinstance(second, SchemeValue), \
-            "bad types to Pair: {}, {}".format(type(first), type(second))
-            
+        if not isinstance(first, SchemeValue):
+            first = scheme_coerce(first)
+        if not isinstance(second, SchemeValue):
+            second = scheme_coerce(second)
         self.first = first
         self.second = second
 
@@ -533,9 +585,9 @@ class Pair(SchemeValue):
         repeated pair in the list."""
         p0 = self
         p1 = self.second
-        while p1 is not p0 and p1.pairp():
+        while p1 is not p0 and type(p1) is Pair:
             p1 = p1.second
-            if p1 is p0 or not p1.pairp():
+            if p1 is p0 or type(p1) is not Pair:
                 break
             p0 = p0.second
         return p1
@@ -543,33 +595,44 @@ class Pair(SchemeValue):
     def __repr__(self):
         def uncoerce(x):
             if scheme_numberp(x):
-                return x + 0
+                return repr(x + 0)
             elif scheme_symbolp(x):
-                return str(x)
+                return repr(str(x))
             else:
-                return x
-        return "Pair({0!r}, {1!r})".format(uncoerce(self.first),
-                                           uncoerce(self.second))
+                return repr(x)
+        parts, p = [], self
+        while type(p) is Pair:
+            parts.append("Pair(" + uncoerce(p.first) + ", ")
+            p = p.second
+        return "".join(parts) + uncoerce(p) + ")" * len(parts)
 
     def __str__(self):
-        s = "(" + str(self.first)
-        second = self.second
-        while second.pairp():
-            s += " " + str(second.car())
-            second = second.cdr()
-        if not second.nullp():
-            s += " . " + str(second)
-        return s + ")"
+        parts, second = [str(self.first)], self.second
+        while type(second) is Pair:
+            parts.append(str(second.first))
+            second = second.second
+        if second is not nil:
+            parts.append(". " + str(second))
+        return "(" + " ".join(parts) + ")"
 
     def __len__(self):
-        if not self._list_end().nullp():
+        if self._list_end() is not nil:
             raise SchemeError("length attempted on improper list")
         n, second = 1, self.second
-        while second.pairp():
+        while second is not nil:
             n += 1
             second = second.second
         return n
 
+    def __iter__(self):
+        """The elements of the list of which I am the head."""
+        p = self
+        while type(p) is Pair:
+            yield p.first
+            p = p.second
+        if p is not nil:
+            raise SchemeError("ill-formed list")
+
     def __getitem__(self, k):
         if k < 0:
             raise IndexError("negative index into list")
@@ -583,29 +646,75 @@ class Pair(SchemeValue):
         return y.first
 
     def __eq__(self, p):
-        if not isinstance(p, Pair):
-            return False
-        return bool(self.first.equalp(p.first) and self.second.equalp(p.second))
+        x = self
+        while type(x) is Pair:
+            if not isinstance(p, Pair) or not x.first.equalp(p.first):
+                return False
+            x, p = x.second, p.second
+        return bool(x.equalp(p))
+
+    def __hash__(self):
+        """A hash of my structure, consistent with equal?."""
+        return hash(equal_key(self))
+
+    def __reduce__(self):
+        """Pickle the list of which I am the head as its elements and its
+        end, so that pickling a long list does not recurse along it."""
+        items, p = [], self
+        while type(p) is Pair:
+            items.append(p.first)
+            p = p.second
+        return (pair_chain, (items, p))
 
     def map(self, fn):
         """Return a Scheme list after mapping Python function FN to SELF."""
-        mapped = fn(self.first)
-        if self.second.nullp() or self.second.pairp():
-            return Pair(mapped, self.second.map(fn))
-        else:
+        result = last = Pair(fn(self.first), nil)
+        p = self.second
+        while type(p) is Pair:
+            last.second = Pair(fn(p.first), nil)
+            last = last.second
+            p = p.second
+        if p is not nil:
             raise SchemeError("ill-formed list")
+        return result
 
     def append(self, y):
         if not self.listp():
             raise SchemeError("attempt to append to improper list")
-        result = last = Pair(self.first, y)
+        result = last = make_pair(self.first, y)
         p = self.second
         while p is not nil:
-            last.second = Pair(p.first, y)
+            last.second = make_pair(p.first, y)
             last = last.second
             p = p.second
         return result
 
+_new_object = object.__new__
+
+def make_pair(first, second):
+    """The pair (FIRST . SECOND), where FIRST and SECOND are SchemeValues.
+    Unlike Pair(FIRST, SECOND), does not check or convert its arguments.
+
+    >>> make_pair(scnum(1), nil)
+    Pair(1, nil)
+    """
+    pair = _new_object(Pair)
+    pair.first = first
+    pair.second = second
+    return pair
+
+def pair_chain(items, end):
+    """The list of the SchemeValues ITEMS, ending in END instead of nil if
+    END is not nil.
+
+    >>> pair_chain([scnum(1), scnum(2)], scnum(3))
+    Pair(1, Pair(2, 3))
+    """
+    result = end
+    for item in reversed(items):
+        result = make_pair(item, result)
+    return result
+
 class nil(SchemeValue):
     """The empty list"""
 
@@ -621,6 +730,9 @@ class nil(SchemeValue):
     def __repr__(self):
         return "nil"
 
+    def __reduce__(self):
+        return "nil"
+
     def __str__(self):
         return "()"
 
@@ -632,6 +744,9 @@ class nil(SchemeValue):
             raise IndexError("negative index into list")
         raise IndexError("list index out of bounds")
 
+    def __iter__(self):
+        return iter(())
+
     def append(self, y):
         return y
 
@@ -640,6 +755,254 @@ class nil(SchemeValue):
 
 nil = nil() # Assignment hides the nil class; there is only one instance
 
+###########
+# Vectors #
+###########
+
+class SchemeVector(SchemeValue):
+    """A Scheme vector: a fixed-length sequence of values indexed from 0,
+    kept in the Python list ITEMS, so that indexing takes constant time.
+
+    >>> v = SchemeVector([scnum(1), scstr("two"), nil])
+    >>> print(v)
+    #(1 two ())
+    >>> v
+    SchemeVector([scnum(1), scstr('two'), nil])
+    """
+
+    def __init__(self, items):
+        self.items = items
+
+    def vectorp(self):
+        return scheme_true
+
+    def equalp(self, y):
+        if not isinstance(y, SchemeVector) or len(self.items) != len(y.items):
+            return scheme_false
+        for a, b in zip(self.items, y.items):
+            if not a.equalp(b):
+                return scheme_false
+        return scheme_true
+
+    def print_repr(self):
+        return "#(" + " ".join(x.print_repr() for x in self.items) + ")"
+
+    def __repr__(self):
+        return "SchemeVector({0!r})".format(self.items)
+
+    def __str__(self):
+        return "#(" + " ".join(str(x) for x in self.items) + ")"
+
+    def __len__(self):
+        return len(self.items)
+
+def _check_index(items, k, name):
+    """Check that K is a valid index into the sequence ITEMS."""
+    check_type(k, scheme_integerp, 1, name)
+    if not 0 <= k < len(items):
+        msg = "index {0} out of range for vector of length {1}"
+        raise SchemeError(msg.format(k, len(items)))
+
+###############
+# Hash tables #
+###############
+
+class IdentityKey:
+    """A dictionary key for a value that is equal only to itself."""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __hash__(self):
+        return id(self.value)
+
+    def __eq__(self, other):
+        return type(other) is IdentityKey and self.value is other.value
+
+_pair_key, _vector_key = object(), object()
+
+def equal_key(value):
+    """A hashable key for the Scheme VALUE, such that the keys of two values
+    are equal when the values are equal?.  The key of a list contains the keys
+    of its elements, so lists are hashed by structure.
+
+    >>> a = intern('a')
+    >>> equal_key(Pair(1, Pair(a, 2.0))) == equal_key(Pair(1.0, Pair(a, 2)))
+    True
+    >>> equal_key(Pair(1, Pair(2, nil))) == equal_key(Pair(1, Pair(Pair(2, nil), nil)))
+    False
+    """
+    if type(value) is Pair:
+        items = [_pair_key]
+        while type(value) is Pair:
+            items.append(equal_key(value.first))
+            value = value.second
+        items.append(equal_key(value))
+        return tuple(items)
+    if type(value) is SchemeVector:
+        return (_vector_key,) + tuple(equal_key(x) for x in value.items)
+    try:
+        hash(value)
+    except TypeError:
+        return IdentityKey(value)
+    return value
+
+class SchemeHashTable(SchemeValue):
+    """A mutable table from keys to values.  An equal? table (EQUAL true)
+    treats keys that are equal? as the same key, hashing lists, strings, and
+    numbers by value; an eq? table compares keys by identity.  ENTRIES maps
+    the Python key of each key (see python_key) to a tuple (key, value).
+
+    >>> table = SchemeHashTable(equal=True)
+    >>> table.entries[table.python_key(Pair(1, nil))] = (Pair(1, nil), scstr("one"))
+    >>> table.python_key(Pair(1, nil)) in table.entries
+    True
+    """
+
+    def __init__(self, equal=True):
+        self.equal = equal
+        self.entries = {}
+
+    def python_key(self, key):
+        if self.equal:
+            return equal_key(key)
+        return IdentityKey(key)
+
+    def __str__(self):
+        return "#[hash-table {0}]".format("equal?" if self.equal else "eq?")
+
+    def __repr__(self):
+        return "SchemeHashTable(equal={0})".format(self.equal)
+
+    def __getstate__(self):
+        """Pickle the keys and values but not their Python keys, which may
+        hash object identities."""
+        return (self.equal, list(self.entries.values()))
+
+    def __setstate__(self, state):
+        self.equal, items = state
+        self.entries = {self.python_key(key): (key, value)
+                        for key, value in items}
+
+###################
+# Numeric vectors #
+###################
+
+# Numeric vectors hold 64-bit floats (f64) or integers (s64) in a numpy array,
+# or, when numpy is not installed, in a memoryview of an array.array.  Either
+# way, slices share storage with the vector they are taken from, and the bulk
+# operations (vector+, vector-sum, ...) loop over the elements in C.
+
+_NUMPY_TYPES = {'f64': 'float64', 's64': 'int64'}
+_ARRAY_TYPECODES = {'f64': 'd', 's64': 'q'}
+
+class SchemeNumVector(SchemeValue):
+    """A vector of numbers of KIND 'f64' or 's64', whose elements are stored
+    in DATA (see _num_array).
+
+    >>> v = SchemeNumVector.from_values('s64', [1, 2, 3])
+    >>> print(v)
+    #s64(1 2 3)
+    >>> print(v.slice(1, 3))
+    #s64(2 3)
+    """
+
+    def __init__(self, kind, data):
+        self.kind = kind
+        self.data = data
+
+    @staticmethod
+    def from_values(kind, values):
+        """A new vector of KIND holding the Python numbers VALUES."""
+        return SchemeNumVector(kind, _num_array(kind, values))
+
+    def element(self, k):
+        """Element K as a Scheme number."""
+        if self.kind == 'f64':
+            return scnum(float(self.data[k]))
+        return scint(int(self.data[k]))
+
+    def slice(self, start, end):
+        """Elements START up to END, sharing storage with SELF."""
+        return SchemeNumVector(self.kind, self.data[start:end])
+
+    def equalp(self, y):
+        return scbool(isinstance(y, SchemeNumVector) and self.kind == y.kind
+                      and len(self.data) == len(y.data)
+                      and all(a == b for a, b in zip(self.data, y.data)))
+
+    def __len__(self):
+        return len(self.data)
+
+    def __str__(self):
+        return "#{0}({1})".format(self.kind, " ".join(
+            str(self.element(k)) for k in range(len(self.data))))
+
+    def __repr__(self):
+        return "SchemeNumVector({0!r}, {1!r})".format(self.kind,
+                                                      list(self.data))
+
+    def __reduce__(self):
+        """Pickle the elements, which a slice then no longer shares with the
+        vector it was taken from."""
+        return (SchemeNumVector.from_values, (self.kind, self.data.tolist()))
+
+def _num_array(kind, values):
+    """Storage of KIND for the Python numbers in the iterable VALUES."""
+    try:
+        if numpy is not None:
+            values = list(values)
+            if kind == 's64':
+                data = numpy.array(values)
+                if data.dtype != _NUMPY_TYPES[kind]:  # Floats, or big ints
+                    data = numpy.array([operator.index(x) for x in values],
+                                       dtype=_NUMPY_TYPES[kind])
+                return data
+            return numpy.array(values, dtype=_NUMPY_TYPES[kind])
+        return memoryview(array.array(_ARRAY_TYPECODES[kind], values))
+    except (TypeError, OverflowError) as err:
+        raise SchemeError("bad element for {0}vector: {1}".format(kind, err))
+
+def _near_s64_limit(estimate):
+    """Whether ESTIMATE, a float or numpy array of floats approximating s64
+    results, comes near the limits of s64, where numpy would wrap around, so
+    that the results must be computed exactly with Python integers."""
+    return numpy.size(estimate) > 0 and numpy.abs(estimate).max() >= 2.0 ** 62
+
+def scheme_num_vectorp(x):
+    return scbool(isinstance(x, SchemeNumVector))
+
+def _bulk_arith(op, x, y, name):
+    """The numeric vector resulting from applying OP to corresponding
+    elements of numeric vectors X and Y, or to the elements of X and the
+    number Y."""
+    check_type(x, scheme_num_vectorp, 0, name)
+    if isinstance(y, SchemeNumVector):
+        if len(x.data) != len(y.data):
+            raise SchemeError("{0}: vectors of lengths {1} and {2}".format(
+                name, len(x.data), len(y.data)))
+        kind = 'f64' if 'f64' in (x.kind, y.kind) else 's64'
+        other = y.data
+    else:
+        _check_num(y, name)
+        kind = 'f64' if x.kind == 'f64' or type(y) is SchemeFloat else 's64'
+        other = float(y) if kind == 'f64' else int(y)
+    data = x.data
+    if numpy is not None:
+        if kind == 'f64' or not _near_s64_limit(op(
+                data.astype('float64'), other.astype('float64')
+                if isinstance(other, numpy.ndarray) else float(other))):
+            return SchemeNumVector(kind, op(data, other).astype(
+                _NUMPY_TYPES[kind], copy=False))
+        data = data.tolist()  # So that _num_array rejects results beyond s64
+        if isinstance(other, numpy.ndarray):
+            other = other.tolist()
+    if not isinstance(other, (memoryview, list)):
+        other = itertools.repeat(other, len(data))
+    return SchemeNumVector.from_values(kind, map(op, data, other))
+
 ########################
 # Primitive Operations #
 ########################
@@ -727,6 +1090,247 @@ def scheme_append(*vals):
         result = vals[i].append(result)
     return result
 
+@primitive("vector?")
+def scheme_vectorp(x):
+    return x.vectorp()
+
+@primitive("make-vector")
+def scheme_make_vector(k, fill=None):
+    """A vector of K elements, each FILL (0 by default)."""
+    check_type(k, lambda n: scheme_integerp(n) and n >= 0, 0, "make-vector")
+    return SchemeVector([scint(0) if fill is None else fill] * k)
+
+@primitive("vector")
+def scheme_vector(*vals):
+    return SchemeVector(list(vals))
+
+@primitive("vector-length")
+def scheme_vector_length(vector):
+    check_type(vector, scheme_vectorp, 0, "vector-length")
+    return scint(len(vector.items))
+
+@primitive("vector-ref")
+def scheme_vector_ref(vector, k):
+    check_type(vector, scheme_vectorp, 0, "vector-ref")
+    _check_index(vector.items, k, "vector-ref")
+    return vector.items[k]
+
+@primitive("vector-set!")
+def scheme_vector_set(vector, k, value):
+    check_type(vector, scheme_vectorp, 0, "vector-set!")
+    _check_index(vector.items, k, "vector-set!")
+    vector.items[k] = value
+    return okay
+
+@primitive("vector-fill!")
+def scheme_vector_fill(vector, value):
+    check_type(vector, scheme_vectorp, 0, "vector-fill!")
+    vector.items[:] = [value] * len(vector.items)
+    return okay
+
+@primitive("list->vector")
+def scheme_list_to_vector(lst):
+    check_type(lst, scheme_listp, 0, "list->vector")
+    items = []
+    while lst is not nil:
+        items.append(lst.first)
+        lst = lst.second
+    return SchemeVector(items)
+
+@primitive("vector->list")
+def scheme_vector_to_list(vector):
+    check_type(vector, scheme_vectorp, 0, "vector->list")
+    result = nil
+    for item in reversed(vector.items):
+        result = Pair(item, result)
+    return result
+
+@primitive("hash-table?")
+def scheme_hash_tablep(x):
+    return scbool(isinstance(x, SchemeHashTable))
+
+@primitive("make-hash-table")
+def scheme_make_hash_table(equivalence=None):
+    """A new, empty hash table that compares keys with EQUIVALENCE, which is
+    the eq? or equal? procedure (equal? by default)."""
+    if equivalence is None:
+        return SchemeHashTable(equal=True)
+    fn = getattr(equivalence, 'fn', None)
+    if fn is not scheme_eqp and fn is not scheme_equalp:
+        bad_type(equivalence, 0, "make-hash-table")
+    return SchemeHashTable(equal=fn is scheme_equalp)
+
+@primitive("hash-table-ref")
+def scheme_hash_table_ref(table, key, default=None):
+    """The value for KEY in TABLE, or DEFAULT if there is none."""
+    check_type(table, scheme_hash_tablep, 0, "hash-table-ref")
+    entry = table.entries.get(table.python_key(key))
+    if entry is not None:
+        return entry[1]
+    if default is None:
+        raise SchemeError("key not found in hash table: {0}".format(key))
+    return default
+
+@primitive("hash-table-set!")
+def scheme_hash_table_set(table, key, value):
+    check_type(table, scheme_hash_tablep, 0, "hash-table-set!")
+    table.entries[table.python_key(key)] = (key, value)
+    return okay
+
+@primitive("hash-table-delete!")
+def scheme_hash_table_delete(table, key):
+    check_type(table, scheme_hash_tablep, 0, "hash-table-delete!")
+    table.entries.pop(table.python_key(key), None)
+    return okay
+
+@primitive("hash-table-count")
+def scheme_hash_table_count(table):
+    check_type(table, scheme_hash_tablep, 0, "hash-table-count")
+    return scint(len(table.entries))
+
+@primitive("hash-table-keys")
+def scheme_hash_table_keys(table):
+    check_type(table, scheme_hash_tablep, 0, "hash-table-keys")
+    result = nil
+    for key, _ in reversed(list(table.entries.values())):
+        result = Pair(key, result)
+    return result
+
+def _num_vector_primitives(kind):
+    """Define the primitives for numeric vectors of KIND, named after SRFI 4:
+    (f64vector 1 2), (make-f64vector k fill), f64vector-ref, ..."""
+    name = kind + "vector"
+    is_kind = lambda v: isinstance(v, SchemeNumVector) and v.kind == kind
+
+    @primitive(name)
+    def make_from(*vals):
+        _check_nums(*vals)
+        return SchemeNumVector.from_values(kind, vals)
+
+    @primitive("make-" + name)
+    def make(k, fill=None):
+        check_type(k, lambda n: scheme_integerp(n) and n >= 0, 0, "make-" + name)
+        fill = 0 if fill is None else _check_num(fill, "make-" + name)
+        return SchemeNumVector.from_values(kind, itertools.repeat(fill, k))
+
+    @primitive(name + "?")
+    def predicate(x):
+        return scbool(is_kind(x))
+
+    @primitive(name + "-length")
+    def length(v):
+        check_type(v, is_kind, 0, name + "-length")
+        return scint(len(v.data))
+
+    @primitive(name + "-ref")
+    def ref(v, k):
+        check_type(v, is_kind, 0, name + "-ref")
+        _check_index(v.data, k, name + "-ref")
+        return v.element(k)
+
+    @primitive(name + "-set!")
+    def set_element(v, k, x):
+        check_type(v, is_kind, 0, name + "-set!")
+        _check_index(v.data, k, name + "-set!")
+        _check_num(x, name + "-set!")
+        try:
+            v.data[k] = float(x) if kind == 'f64' else operator.index(x)
+        except (TypeError, OverflowError) as err:
+            raise SchemeError(err)
+        return okay
+
+    @primitive("list->" + name)
+    def from_list(lst):
+        check_type(lst, scheme_listp, 0, "list->" + name)
+        vals = []
+        while lst is not nil:
+            vals.append(_check_num(lst.first, "list->" + name))
+            lst = lst.second
+        return SchemeNumVector.from_values(kind, vals)
+
+    @primitive(name + "->list")
+    def to_list(v):
+        check_type(v, is_kind, 0, name + "->list")
+        result = nil
+        for k in range(len(v.data) - 1, -1, -1):
+            result = Pair(v.element(k), result)
+        return result
+
+_num_vector_primitives('f64')
+_num_vector_primitives('s64')
+
+@primitive("vector+")
+def scheme_vector_add(x, y):
+    """Element-wise sum of numeric vector X and numeric vector or number Y."""
+    return _bulk_arith(operator.add, x, y, "vector+")
+
+@primitive("vector*")
+def scheme_vector_mul(x, y):
+    """Element-wise product of numeric vector X and numeric vector or number
+    Y."""
+    return _bulk_arith(operator.mul, x, y, "vector*")
+
+@primitive("vector-sum")
+def scheme_vector_sum(v):
+    check_type(v, scheme_num_vectorp, 0, "vector-sum")
+    if numpy is not None:
+        total = v.data.sum()
+        if v.kind == 's64' and _near_s64_limit(v.data.sum(dtype='float64')):
+            total = sum(v.data.tolist())
+    elif v.kind == 'f64':
+        total = math.fsum(v.data)
+    else:
+        total = sum(v.data)
+    return scnum(float(total) if v.kind == 'f64' else int(total))
+
+@primitive("vector-dot")
+def scheme_vector_dot(x, y):
+    check_type(x, scheme_num_vectorp, 0, "vector-dot")
+    check_type(y, scheme_num_vectorp, 1, "vector-dot")
+    if len(x.data) != len(y.data):
+        raise SchemeError("vector-dot: vectors of lengths {0} and {1}".format(
+            len(x.data), len(y.data)))
+    floats = 'f64' in (x.kind, y.kind)
+    if numpy is not None:
+        total = numpy.dot(x.data, y.data)
+        if not floats and _near_s64_limit(numpy.dot(
+                x.data.astype('float64'), y.data.astype('float64'))):
+            total = sum(map(operator.mul, x.data.tolist(), y.data.tolist()))
+    elif floats:
+        total = math.fsum(map(operator.mul, x.data, y.data))
+    else:
+        total = sum(map(operator.mul, x.data, y.data))
+    return scnum(float(total) if floats else int(total))
+
+@primitive("vector-map")
+def scheme_vector_map(procedure, v):
+    """The numeric vector of the results of calling the primitive PROCEDURE
+    on each element of numeric vector V.  The result holds floats if V does
+    or if any result is not an integer."""
+    fn = getattr(procedure, 'fn', None)
+    if fn is None or getattr(procedure, 'use_env', True):
+        bad_type(procedure, 0, "vector-map")
+    check_type(v, scheme_num_vectorp, 1, "vector-map")
+    results = [_check_num(fn(v.element(k)), "vector-map")
+               for k in range(len(v.data))]
+    floats = v.kind == 'f64' or any(type(x) is SchemeFloat for x in results)
+    return SchemeNumVector.from_values('f64' if floats else 's64', results)
+
+@primitive("vector-slice")
+def scheme_vector_slice(v, start, end=None):
+    """Elements START up to END (the end of V by default) of numeric vector
+    V, sharing storage with V, so that setting an element of either sets it
+    in both."""
+    check_type(v, scheme_num_vectorp, 0, "vector-slice")
+    if end is None:
+        end = scint(len(v.data))
+    for k, index in ((1, start), (2, end)):
+        check_type(index, scheme_integerp, k, "vector-slice")
+    if not 0 <= start <= end <= len(v.data):
+        raise SchemeError("bad slice {0}:{1} of vector of length {2}".format(
+            start, end, len(v.data)))
+    return v.slice(start, end)
+
 @primitive("string?")
 def scheme_stringp(x):
     return x.stringp()
@@ -757,27 +1361,82 @@ def _arith(fn, init, vals):
     s = init
     for val in vals:
         s = fn(s, val)
-    if round(s) == s:
-        return SchemeInt(round(s))
+    return _number(s)
+
+def _number(s):
+    """The Scheme number for the result S of arithmetic, which is a SchemeInt
+    whenever S has an integral value."""
+    if type(s) is int:
+        return scint(s)
+    r = round(s)
+    if r == s:
+        return scint(r)
     else:
         return SchemeFloat(s)
 
+# The arithmetic primitives check for the common case of two operands that are
+# both SchemeInts or SchemeFloats with exact type tests, and compute the result
+# directly.  Their results are the same as those of _arith.  The two-operand
+# versions are also available separately in BINARY_PRIMITIVES.
+
+_fast_number_types = (SchemeInt, SchemeFloat)
+
+def _add2(x, y):
+    tx, ty = type(x), type(y)
+    if tx is SchemeInt and ty is SchemeInt:
+        return scint(int.__add__(x, y))
+    if tx in _fast_number_types and ty in _fast_number_types:
+        return _number(x + y)
+    return _arith(operator.add, 0, (x, y))
+
+def _sub2(x, y):
+    tx, ty = type(x), type(y)
+    if tx is SchemeInt and ty is SchemeInt:
+        return scint(int.__sub__(x, y))
+    if tx in _fast_number_types and ty in _fast_number_types:
+        return _number(x - y)
+    return _arith(operator.sub, x, (y,))
+
+def _mul2(x, y):
+    tx, ty = type(x), type(y)
+    if tx is SchemeInt and ty is SchemeInt:
+        return scint(int.__mul__(x, y))
+    if tx in _fast_number_types and ty in _fast_number_types:
+        return _number(x * y)
+    return _arith(operator.mul, 1, (x, y))
+
+def _div2(x, y):
+    try:
+        if type(x) in _fast_number_types and type(y) in _fast_number_types:
+            return _number(x / y)
+        return _arith(operator.truediv, x, (y,))
+    except ZeroDivisionError as err:
+        raise SchemeError(err)
+
 @primitive("+")
 def scheme_add(*vals):
+    if len(vals) == 2:
+        return _add2(vals[0], vals[1])
     return _arith(operator.add, 0, vals)
 
 @primitive("-")
 def scheme_sub(val0, *vals):
+    if len(vals) == 1:
+        return _sub2(val0, vals[0])
     if len(vals) == 0:
         return val0.neg()
     return _arith(operator.sub, val0, vals)
 
 @primitive("*")
 def scheme_mul(*vals):
+    if len(vals) == 2:
+        return _mul2(vals[0], vals[1])
     return _arith(operator.mul, 1, vals)
 
 @primitive("/")
 def scheme_div(*vals):
+    if len(vals) == 2:
+        return _div2(vals[0], vals[1])
     try:
         if len(vals) == 1:
             return _arith(operator.truediv, scnum(1), vals)
@@ -807,26 +1466,44 @@ def scheme_floor(val):
 def scheme_ceil(val):
     return val.ceil()
 
+# The comparisons also test for SchemeInts and SchemeFloats with exact type
+# tests before calling the methods that check their operands.
+
 @primitive("=")
 def scheme_eq(x, y):
+    if type(x) in _fast_number_types and type(y) in _fast_number_types:
+        return scheme_true if x == y else scheme_false
     return x.eq(y)
 
 @primitive("<")
 def scheme_lt(x, y):
+    if type(x) in _fast_number_types and type(y) in _fast_number_types:
+        return scheme_true if x < y else scheme_false
     return x.ltp(y)
 
 @primitive(">")
 def scheme_gt(x, y):
+    if type(x) in _fast_number_types and type(y) in _fast_number_types:
+        return scheme_true if x > y else scheme_false
     return x.gtp(y)
 
 @primitive("<=")
 def scheme_le(x, y):
+    if type(x) in _fast_number_types and type(y) in _fast_number_types:
+        return scheme_true if x <= y else scheme_false
     return x.lep(y)
 
 @primitive(">=")
 def scheme_ge(x, y):
+    if type(x) in _fast_number_types and type(y) in _fast_number_types:
+        return scheme_true if x >= y else scheme_false
     return x.gep(y)
 
+# Versions of variadic primitives for calls with exactly two operands, for
+# code that knows the number of operands when it is compiled.
+BINARY_PRIMITIVES = {scheme_add: _add2, scheme_sub: _sub2, scheme_mul: _mul2,
+                     scheme_div: _div2}
+
 @primitive("even?")
 def scheme_evenp(x):
     return x.evenp()
@@ -879,22 +1556,60 @@ def scheme_exit():
 
 _turtle_screen_on = False
 
+# The name of the SVG file to draw into instead of a window, if any.  The
+# environment variable SCHEME_TURTLE_SVG sets it if nothing else does.
+turtle_svg_file = None
+
 def turtle_screen_on():
     return _turtle_screen_on
 
 def _tscheme_prep():
-    global _turtle_screen_on
+    global _turtle_screen_on, turtle
     if not _turtle_screen_on:
+        svg_file = turtle_svg_file or os.environ.get('SCHEME_TURTLE_SVG')
+        if turtle is None and svg_file:
+            from scheme_svg import SvgTurtle
+            turtle = SvgTurtle(svg_file)
+        elif turtle is None:
+            try:
+                import turtle
+            except ImportError as exc:
+                raise SchemeError("could not import the turtle module: "
+                                  "{0}".format(exc))
         _turtle_screen_on = True
         turtle.title("Scheme Turtles")
         turtle.mode('logo')
 
+# When _turtle_batch_size is positive, turtle animation is off and the screen
+# is updated only after that many drawing commands, and by flush-turtle and
+# exitonclick.  _turtle_pending counts the commands drawn since the last
+# update.
+_turtle_batch_size = 0
+_turtle_pending = 0
+
+def _tscheme_command(name, *args):
+    """Call the turtle function NAME on ARGS, updating the screen if a batch
+    of commands is complete."""
+    global _turtle_pending
+    _tscheme_prep()
+    getattr(turtle, name)(*args)
+    if _turtle_batch_size:
+        _turtle_pending += 1
+        if _turtle_pending >= _turtle_batch_size:
+            _tscheme_flush()
+
+def _tscheme_flush():
+    """Show the commands drawn since the screen was last updated."""
+    global _turtle_pending
+    if _turtle_screen_on and _turtle_pending:
+        turtle.update()
+    _turtle_pending = 0
+
 @primitive("forward", "fd")
 def tscheme_forward(n):
     """Move the turtle forward a distance N units on the current heading."""
     _check_nums(n)
-    _tscheme_prep()
-    turtle.forward(n)
+    _tscheme_command('forward', n)
     return okay
 
 @primitive("backward", "back", "bk")
@@ -902,24 +1617,21 @@ def tscheme_backward(n):
     """Move the turtle backward a distance N units on the current heading,
     without changing direction."""
     _check_nums(n)
-    _tscheme_prep()
-    turtle.backward(n)
+    _tscheme_command('backward', n)
     return okay
 
 @primitive("left", "lt")
 def tscheme_left(n):
     """Rotate the turtle's heading N degrees counterclockwise."""
     _check_nums(n)
-    _tscheme_prep()
-    turtle.left(n)
+    _tscheme_command('left', n)
     return okay
 
 @primitive("right", "rt")
 def tscheme_right(n):
     """Rotate the turtle's heading N degrees clockwise."""
     _check_nums(n)
-    _tscheme_prep()
-    turtle.right(n)
+    _tscheme_command('right', n)
     return okay
 
 @primitive("circle")
@@ -933,82 +1645,71 @@ def tscheme_circle(r, extent = None):
         _check_nums(r)
     else:
         _check_nums(r, extent)
-    _tscheme_prep()
-    turtle.circle(r, extent and extent)
+    _tscheme_command('circle', r, extent and extent)
     return okay
 
 @primitive("setposition", "setpos", "goto")
 def tscheme_setposition(x, y):
     """Set turtle's position to (X,Y), heading unchanged."""
     _check_nums(x, y)
-    _tscheme_prep()
-    turtle.setposition(x, y)
+    _tscheme_command('setposition', x, y)
     return okay
 
 @primitive("setheading", "seth")
 def tscheme_setheading(h):
     """Set the turtle's heading H degrees clockwise from north (up)."""
     _check_nums(h)
-    _tscheme_prep()
-    turtle.setheading(h)
+    _tscheme_command('setheading', h)
     return okay
 
 @primitive("penup", "pu")
 def tscheme_penup():
     """Raise the pen, so that the turtle does not draw."""
-    _tscheme_prep()
-    turtle.penup()
+    _tscheme_command('penup')
     return okay
 
 @primitive("pendown", "pd")
 def tscheme_pendown():
     """Lower the pen, so that the turtle starts drawing."""
-    _tscheme_prep()
-    turtle.pendown()
+    _tscheme_command('pendown')
     return okay
 
 @primitive("showturtle", "st")
 def tscheme_showturtle():
     """Make turtle visible."""
-    _tscheme_prep()
-    turtle.showturtle()
+    _tscheme_command('showturtle')
     return okay
 
 @primitive("hideturtle", "ht")
 def tscheme_hideturtle():
     """Make turtle visible."""
-    _tscheme_prep()
-    turtle.hideturtle()
+    _tscheme_command('hideturtle')
     return okay
 
 @primitive("clear")
 def tscheme_clear():
     """Clear the drawing, leaving the turtle unchanged."""
-    _tscheme_prep()
-    turtle.clear()
+    _tscheme_command('clear')
     return okay
 
 @primitive("color")
 def tscheme_color(c):
     """Set the color to C, a string such as '"red"' or '"#ffc0c0"' (representing
     hexadecimal red, green, and blue values."""
-    _tscheme_prep()
     check_type(c, scheme_stringp, 0, "color")
-    turtle.color(eval(c))
+    _tscheme_command('color', eval(c))
     return okay
 
 @primitive("begin_fill")
 def tscheme_begin_fill():
     """Start a sequence of moves that outline a shape to be filled."""
-    _tscheme_prep()
-    turtle.begin_fill()
+    _tscheme_command('begin_fill')
     return okay
 
 @primitive("end_fill")
 def tscheme_end_fill():
     """Fill in shape drawn since last begin_fill."""
-    _tscheme_prep()
-    turtle.end_fill()
+    _tscheme_command('end_fill')
     return okay
 
 @primitive("exitonclick")
@@ -1016,7 +1717,9 @@ def tscheme_exitonclick():
     """Wait for a click on the turtle window, and then close it."""
     global _turtle_screen_on
     if _turtle_screen_on:
-        print("Close or click on turtle window to complete exit")
+        _tscheme_flush()
+        if isinstance(turtle, types.ModuleType):  # Not an SvgTurtle
+            print("Close or click on turtle window to complete exit")
         turtle.exitonclick()
         _turtle_screen_on = False
     return okay
@@ -1030,3 +1733,23 @@ def tscheme_speed(s):
     _tscheme_prep()
     turtle.speed(s)
     return okay
+
+@primitive("turtle-batch")
+def tscheme_turtle_batch(n):
+    """Draw turtle commands in batches of N (a non-negative integer), with
+    animation off, updating the screen only after each batch and on
+    flush-turtle and exitonclick; or, if N is 0, animate each command as it
+    is drawn.  The final drawing is the same either way."""
+    global _turtle_batch_size
+    check_type(n, lambda x: scheme_integerp(x) and x >= 0, 0, "turtle-batch")
+    _tscheme_prep()
+    _tscheme_flush()
+    _turtle_batch_size = int(n)
+    turtle.tracer(0 if n else 1)
+    return okay
+
+@primitive("flush-turtle")
+def tscheme_flush_turtle():
+    """Show the turtle commands drawn so far in the current batch."""
+    _tscheme_flush()
+    return okay
@@ -0,0 +1,389 @@
+"""This module implements profilers for Scheme programs.
+
+While a Profiler is enabled, the apply methods of PrimitiveProcedure,
+LambdaProcedure, and MuProcedure are replaced by versions that time every
+call.  Disabling the profiler puts the original methods back, so profiling
+costs nothing when it is off.  For each procedure, named by the global
+variable bound to it (or by its parameter list if it has no global name) and
+for each primitive, the profiler counts calls and records
+
+  self time   the time spent in the procedure itself, excluding its callees;
+  total time  the time from entry to exit, counting recursive calls once;
+  max depth   the greatest number of simultaneous active calls.
+
+While profiling, expressions are evaluated by Instrument.evaluate, a version
+of the tree-walking evaluator that ends the call whose body it is evaluating
+when it makes a call in tail position, so that tail calls still run in
+constant space and are recorded as siblings rather than nested calls.  The
+other engines call procedures without going through their apply methods, so
+profiling cannot be combined with them.
+
+Run a whole program under the profiler with
+    python3 scheme.py --profile FILE
+which prints a table at exit (--profile-json OUT also writes it to OUT as
+JSON), or profile one expression with the special form (profile EXPR).
+
+A SamplingProfiler instead keeps a shadow stack of the names of the active
+procedures and samples it periodically from a timer thread, writing folded
+stacks for flame graphs.  Sample a whole program with
+    python3 scheme.py --sample OUT [--sample-rate HZ] FILE
+or wrap calls to scheme_load in a "with SamplingProfiler(env)" statement.
+"""
+
+import json
+import sys
+import threading
+import time
+
+import scheme
+from scheme_primitives import *
+from scheme import (PrimitiveProcedure, LambdaProcedure, MuProcedure,
+                    GlobalFrame, SPECIAL_FORMS, scheme_eval, scheme_apply,
+                    scheme_load)
+
+# The profiler that is currently enabled, if any.
+active = None
+
+class ProcedureStats:
+    """The profile of the calls to the procedures or primitives called NAME."""
+
+    __slots__ = ('name', 'kind', 'calls', 'self_time', 'total_time',
+                 'max_depth', 'depth')
+
+    def __init__(self, name, kind):
+        self.name = name
+        self.kind = kind
+        self.calls = 0
+        self.self_time = 0.0
+        self.total_time = 0.0
+        self.max_depth = 0
+        self.depth = 0
+
+    def as_dict(self):
+        return {'name': self.name, 'kind': self.kind, 'calls': self.calls,
+                'self_time': self.self_time, 'total_time': self.total_time,
+                'max_depth': self.max_depth}
+
+def _primitive_names():
+    """A dictionary from the Python functions of primitives to their names."""
+    names = {scheme_eval: 'eval', scheme_apply: 'apply', scheme_load: 'load'}
+    for symbols, fn in get_primitive_bindings():
+        names.setdefault(fn, symbols[0])
+    return names
+
+class Instrument:
+    """The common part of the profilers: while enabled, the apply methods of
+    procedures are replaced by the versions returned by self.wrap, which call
+    self.enter for each call, and expressions are evaluated by self.evaluate,
+    which calls self.leave as the calls it makes return.  By default, the
+    procedures called are kept on self.stack.  Procedures are named in the
+    global environment ENV."""
+
+    primitive_names = _primitive_names()
+
+    def __init__(self, env):
+        self.env = env
+        self.names, self.names_version = {}, None
+        self.stack = []
+        self.saved = None
+
+    def enable(self):
+        """Start instrumenting calls until disable is called."""
+        global active
+        assert active is None, 'another profiler is enabled'
+        if scheme.engine is not None:
+            raise SchemeError("cannot profile with an engine other than tree")
+        active = self
+        self.saved = (scheme.engine, PrimitiveProcedure.apply,
+                      LambdaProcedure.apply, MuProcedure.apply)
+        scheme.engine = self.evaluate
+        for cls in (PrimitiveProcedure, LambdaProcedure, MuProcedure):
+            cls.apply = self.wrap(cls.apply)
+
+    def disable(self):
+        """Stop instrumenting and restore the original apply methods."""
+        global active
+        (scheme.engine, PrimitiveProcedure.apply, LambdaProcedure.apply,
+         MuProcedure.apply) = self.saved
+        active = None
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.disable()
+
+    def wrap(self, apply):
+        """A version of the apply method APPLY that records each call.  A call
+        to a primitive ends when APPLY returns; a call to a lambda or mu
+        procedure ends when the evaluation of its body does."""
+        stack = self.stack
+        def instrumented_apply(procedure, args, env):
+            depth = len(stack)
+            self.enter(procedure)
+            try:
+                expr, env = apply(procedure, args, env)
+            except BaseException:
+                self.leave(depth)
+                raise
+            if env is None:
+                self.leave(depth)
+            return expr, env
+        return instrumented_apply
+
+    def evaluate(self, expr, env):
+        """Evaluate EXPR in ENV as scheme_eval does, ending the calls made by
+        this evaluation when they are replaced by calls in tail position, and
+        when it returns.  Calls made by a procedure that applies another,
+        such as apply or hash-table-walk, end when that procedure returns."""
+        depth = len(self.stack)
+        try:
+            while env is not None:
+                if expr is None:
+                    raise SchemeError("Cannot evaluate an undefined "
+                                      "expression.")
+                if scheme_symbolp(expr):
+                    expr, env = env.lookup(expr).get_actual_value(), None
+                elif scheme_atomp(expr):
+                    env = None
+                elif not scheme_listp(expr):
+                    raise SchemeError("malformed list: {0}".format(str(expr)))
+                else:
+                    first, rest = scheme_car(expr), scheme_cdr(expr)
+                    if scheme_symbolp(first) and first in SPECIAL_FORMS:
+                        expr, env = SPECIAL_FORMS[first](rest, env)
+                    else:
+                        procedure = scheme_eval(first, env)
+                        args = procedure.evaluate_arguments(rest, env)
+                        self.leave(depth)
+                        expr, env = procedure.apply(args, env)
+            return expr
+        finally:
+            self.leave(depth)
+
+    def enter(self, procedure):
+        """Record the start of a call to PROCEDURE on self.stack."""
+        self.stack.append(procedure)
+
+    def leave(self, depth):
+        """Record the end of the calls on self.stack above DEPTH."""
+        del self.stack[depth:]
+
+    def name_of(self, procedure):
+        """A pair (name, kind) describing PROCEDURE."""
+        if type(procedure) is PrimitiveProcedure:
+            return (self.primitive_names.get(procedure.fn, '#[primitive]'),
+                    'primitive')
+        name = self.global_name(procedure)
+        if name is None:
+            name = '({0} {1})'.format(procedure._symbol(), procedure.formals)
+        return name, procedure._symbol()
+
+    def global_name(self, procedure):
+        """The name of a global variable bound to PROCEDURE, or None."""
+        env = self.env
+        if not isinstance(env, GlobalFrame):
+            return None
+        version = (env.version, len(env.bindings))  # Defining a new name
+        if self.names_version != version:          # leaves env.version alone
+            self.names = {id(cell.value): str(sym)
+                          for sym, cell in env.bindings.items()
+                          if isinstance(cell.value, LambdaProcedure)}
+            self.names_version = version
+        return self.names.get(id(procedure))
+
+class Profiler(Instrument):
+    """Collects ProcedureStats for the procedure calls made while it is
+    enabled in the global environment ENV.
+
+    >>> from scheme import create_global_frame
+    >>> from scheme_reader import read_line
+    >>> env = create_global_frame()
+    >>> scheme_eval(read_line(
+    ...     "(define (fact n) (if (= n 0) 1 (* n (fact (- n 1)))))"), env)
+    intern('fact')
+    >>> with Profiler(env) as profiler:
+    ...     scheme_eval(read_line("(fact 5)"), env)
+    scnum(120)
+    >>> fact = profiler.stats['fact']
+    >>> fact.calls, fact.max_depth, profiler.stats['*'].calls
+    (6, 6, 5)
+
+    Calls in tail position replace the call they are made from.
+
+    >>> scheme_eval(read_line(
+    ...     "(define (loop n) (if (= n 0) 'done (loop (- n 1))))"), env)
+    intern('loop')
+    >>> with Profiler(env) as profiler:
+    ...     scheme_eval(read_line("(loop 5000)"), env)
+    intern('done')
+    >>> loop = profiler.stats['loop']
+    >>> loop.calls, loop.max_depth, profiler.stack
+    (5001, 1, [])
+    """
+
+    def __init__(self, env, clock=time.perf_counter):
+        Instrument.__init__(self, env)
+        self.clock = clock
+        self.stats = {}
+        self.elapsed = 0.0
+
+    def enable(self):
+        Instrument.enable(self)
+        self.start = self.clock()
+
+    def disable(self):
+        self.elapsed += self.clock() - self.start
+        Instrument.disable(self)
+
+    def enter(self, procedure):
+        stats = self.stats_for(procedure)
+        stats.calls += 1
+        stats.depth += 1
+        if stats.depth > stats.max_depth:
+            stats.max_depth = stats.depth
+        self.stack.append([stats, self.clock(), 0.0])
+
+    def leave(self, depth):
+        stack = self.stack
+        while len(stack) > depth:
+            stats, start, callee_time = stack.pop()
+            elapsed = self.clock() - start
+            stats.self_time += elapsed - callee_time
+            stats.depth -= 1
+            if stats.depth == 0:
+                stats.total_time += elapsed
+            if stack:
+                stack[-1][2] += elapsed
+
+    def stats_for(self, procedure):
+        """The ProcedureStats for calls to PROCEDURE."""
+        name, kind = self.name_of(procedure)
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = ProcedureStats(name, kind)
+        return stats
+
+    def sorted_stats(self):
+        """ProcedureStats in decreasing order of self time."""
+        return sorted(self.stats.values(),
+                      key=lambda s: (-s.self_time, -s.calls, s.name))
+
+    def report(self, out=sys.stdout):
+        """Print a table of the profile to OUT."""
+        print('{0:<32} {1:>9} {2:>10} {3:>10} {4:>9}'.format(
+            'procedure', 'calls', 'self (s)', 'total (s)', 'max depth'),
+            file=out)
+        for s in self.sorted_stats():
+            print('{0:<32} {1:>9} {2:>10.4f} {3:>10.4f} {4:>9}'.format(
+                s.name[:32], s.calls, s.self_time, s.total_time, s.max_depth),
+                file=out)
+        print('{0:<32} {1:>9} {2:>10.4f}'.format('(elapsed)', '',
+                                                 self.elapsed), file=out)
+
+    def as_json(self):
+        """The profile as a JSON string."""
+        return json.dumps({'elapsed': self.elapsed,
+                           'procedures': [s.as_dict()
+                                          for s in self.sorted_stats()]},
+                          indent=2)
+
+def profile_expression(expr, env):
+    """Evaluate EXPR in ENV with profiling, print the profile, and return the
+    value of EXPR.  Inside another profiled evaluation, simply evaluates
+    EXPR."""
+    if active is not None:
+        return scheme_eval(expr, env)
+    profiler = Profiler(env.global_frame())
+    profiler.enable()
+    try:
+        return scheme_eval(expr, env)
+    finally:
+        profiler.disable()
+        profiler.report()
+
+class SamplingProfiler(Instrument):
+    """Samples the Scheme procedures active in the global environment ENV
+    RATE times a second while it is enabled.
+
+    Calls push the name of their procedure onto a shadow stack, and a timer
+    thread counts the distinct stacks it finds there, which costs much less
+    per call than timing every call as Profiler does.  The counts are written
+    in the folded format of Brendan Gregg's flamegraph tools: one line per
+    stack, with the names of the procedures from outermost to innermost
+    separated by semicolons, followed by the number of samples.
+
+    >>> from scheme import create_global_frame
+    >>> from scheme_reader import read_line
+    >>> env = create_global_frame()
+    >>> scheme_eval(read_line(
+    ...     "(define (fib n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2)))))"),
+    ...     env)
+    intern('fib')
+    >>> with SamplingProfiler(env, rate=200) as sampler:
+    ...     scheme_eval(read_line("(fib 17)"), env)
+    scnum(1597)
+    >>> all(stack[0] == 'fib' for stack in sampler.counts)
+    True
+
+    Calls in tail position replace the call they are made from.
+
+    >>> scheme_eval(read_line(
+    ...     "(define (loop n) (if (= n 0) 'done (loop (- n 1))))"), env)
+    intern('loop')
+    >>> with SamplingProfiler(env, rate=200) as sampler:
+    ...     scheme_eval(read_line("(loop 5000)"), env)
+    intern('done')
+    >>> sampler.stack, all(stack[:2] != ('loop', 'loop')
+    ...                    for stack in sampler.counts)
+    ([], True)
+    """
+
+    def __init__(self, env, rate=100):
+        Instrument.__init__(self, env)
+        self.interval = 1 / rate
+        self.counts = {}
+        self.labels = {}
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def enable(self):
+        Instrument.enable(self)
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.sample_loop, daemon=True)
+        self.thread.start()
+
+    def disable(self):
+        self.stopped.set()
+        self.thread.join()
+        Instrument.disable(self)
+
+    def enter(self, procedure):
+        self.stack.append(self.label(procedure))
+
+    def label(self, procedure):
+        """The name of PROCEDURE in the folded output."""
+        if type(procedure) is PrimitiveProcedure:
+            label = self.labels.get(procedure.fn)
+            if label is None:
+                label = self.labels[procedure.fn] = self.name_of(procedure)[0]
+            return label
+        return self.name_of(procedure)[0].replace(';', ':')
+
+    def sample_loop(self):
+        while not self.stopped.wait(self.interval):
+            stack = tuple(self.stack)
+            if stack:
+                self.counts[stack] = self.counts.get(stack, 0) + 1
+
+    def folded(self):
+        """The samples as lines of folded stacks."""
+        return ['{0} {1}'.format(';'.join(stack), count)
+                for stack, count in sorted(self.counts.items())]
+
+    def write_folded(self, filename):
+        """Write the samples to the file FILENAME in folded format."""
+        with open(filename, 'w') as outfile:
+            for line in self.folded():
+                print(line, file=outfile)
@@ -16,7 +16,8 @@ would be read to the value, where possible.
 """
 
 from ucb import main, trace, interact
-from scheme_primitives import Pair, nil, intern, scnum, scstr, scbool
+from scheme_primitives import (Pair, nil, intern, scnum, scstr, scbool,
+                               SchemeVector, make_pair)
 from scheme_tokens import tokenize_lines, DELIMITERS
 from buffer import Buffer, InputReader, LineReader
 
@@ -34,27 +35,12 @@ def scheme_read(src):
     Pair('quote', Pair('hello', nil))
     >>> print(read_line("(car '(1 2))"))
     (car (quote (1 2)))
+    >>> len(read_line("'(" + "x " * 5000 + ")").second.first)
+    5000
     """
     if src.current() is None:
         raise EOFError
-    val = src.pop()
-    if val == "nil":
-        return nil
-    elif type(val) is int or type(val) is float:
-        return scnum(val)
-    elif type(val) is bool:
-        return scbool(val)
-    elif val not in DELIMITERS:
-        if val[0] == '"':
-            return scstr(eval(val))
-        else:
-            return intern(val)
-    elif val == "'":
-        return Pair('quote', Pair(scheme_read(src), nil))
-    elif val == "(":
-        return read_tail(src)
-    else:
-        raise SyntaxError("unexpected token: {0}".format(val))
+    return _read(src, [])
 
 def read_tail(src):
     """Return the remainder of a list in SRC, starting before an element or ).
@@ -78,23 +64,109 @@ def read_tail(src):
     >>> read_line("((1 1 . 2) . 1)")
     Pair(Pair(1, Pair(1, 2)), 1)
     """
-    try:
-        if src.current() is None:
+    return _read(src, [[LIST, [], nil, False]])
+
+def read_vector(src):
+    """Return the vector whose elements follow in SRC, up to a ).
+
+    >>> read_line("#(1 (2 3) #(a))")
+    SchemeVector([scnum(1), Pair(2, Pair(3, nil)), SchemeVector([intern('a')])])
+    >>> read_line("#(1 . 2)")
+    Traceback (most recent call last):
+        ...
+    SyntaxError: unexpected token: .
+    """
+    return _read(src, [[VECTOR, [], nil, False]])
+
+# The reader keeps a stack of the unfinished expressions that enclose the
+# current token, instead of calling itself for each element of a list, so
+# that neither the length nor the depth of an expression is limited by the
+# Python stack.  Each frame is a list [kind, items, tail, check], where kind
+# is
+#
+#   LIST     a list whose ITEMS have been read
+#   DOT      a list whose ITEMS are followed by a dot, before the tail
+#   TAILED   a list whose ITEMS are followed by a dot and the datum TAIL; the
+#            frame above it reads the rest of the list
+#   VECTOR   a vector whose ITEMS have been read
+#   QUOTE    a quote mark, waiting for the expression it quotes
+#
+# and CHECK is true for a frame that reads the rest of a TAILED list.  Like
+# the recursive reader that this replaces, the reader reads that rest as a
+# list of its own, which must be nil, so the values and errors are the same.
+
+LIST, DOT, TAILED, VECTOR, QUOTE = range(5)
+_quote_sym = intern('quote')
+
+def _read(src, stack):
+    """Read expressions from SRC until the frames of STACK are complete, and
+    return the value of the outermost one (or the first expression read, if
+    STACK is empty)."""
+    while True:
+        try:
+            val = src.pop()
+        except EOFError:  # Raised by a LineReader at the end of its lines
+            val = None
+        if val is None:
+            if all(frame[0] is QUOTE for frame in stack):
+                raise EOFError
             raise SyntaxError("unexpected end of file")
-        if src.current() == ")":
-            src.pop()
-            return nil
-        if src.current() == ".":           
-            src.pop()
-            first = scheme_read(src)
-            if read_tail(src) is nil:
-                return first
-            raise SyntaxError("Expected one element after .")        
-        first = scheme_read(src)
-        rest = read_tail(src)
-        return Pair(first, rest)
-    except EOFError:
-        raise SyntaxError("unexpected end of file")
+        elif val == "nil":
+            value = nil
+        elif type(val) is int or type(val) is float:
+            value = scnum(val)
+        elif type(val) is bool:
+            value = scbool(val)
+        elif val not in DELIMITERS:
+            if val[0] == '"':
+                value = scstr(eval(val))
+            else:
+                value = intern(val)
+        elif val == "'":
+            stack.append([QUOTE, None, None, False])
+            continue
+        elif val == "(":
+            stack.append([LIST, [], nil, False])
+            continue
+        elif val == "#(":
+            stack.append([VECTOR, [], nil, False])
+            continue
+        elif val == ")" and stack and stack[-1][0] in (LIST, VECTOR):
+            value = _close(stack)
+        elif val == "." and stack and stack[-1][0] is LIST:
+            stack[-1][0] = DOT
+            continue
+        else:
+            raise SyntaxError("unexpected token: {0}".format(val))
+
+        # Add VALUE to the innermost frame, completing any quotes
+        while stack and stack[-1][0] is QUOTE:
+            stack.pop()
+            value = make_pair(_quote_sym, make_pair(value, nil))
+        if not stack:
+            return value
+        frame = stack[-1]
+        if frame[0] is DOT:
+            frame[0], frame[2] = TAILED, value
+            stack.append([LIST, [], nil, True])
+        else:
+            frame[1].append(value)
+
+def _close(stack):
+    """Remove the frame at the top of STACK, which a ) completes, and return
+    its value, along with those of the TAILED frames that it completes."""
+    kind, items, tail, check = stack.pop()
+    if kind is VECTOR:
+        return SchemeVector(items)
+    while True:
+        value = tail
+        for item in reversed(items):
+            value = make_pair(item, value)
+        if not check:
+            return value
+        if value is not nil:
+            raise SyntaxError("Expected one element after .")
+        kind, items, tail, check = stack.pop()
 
 # Convenience methods
 
@@ -103,7 +175,8 @@ def buffer_input(prompt="scm> "):
     return Buffer(tokenize_lines(InputReader(prompt)))
 
 def buffer_lines(lines, prompt="scm> ", show_prompt=False):
-    """Return a Buffer instance iterating through LINES."""
+    """Return a Buffer instance iterating through LINES, an iterator (such as
+    an open file) from which lines are taken as they are needed."""
     if show_prompt:
         input_lines = lines
     else:
@@ -0,0 +1,261 @@
+"""This module draws turtle graphics into an SVG file instead of a window.
+
+SvgTurtle keeps the position, heading, pen, and fill of the turtle itself and
+writes the lines it draws to an SVG file as it goes, so that programs that
+draw with the turtle primitives can run without a display (or tkinter).  It
+computes positions exactly as the turtle module does, including the polygons
+with which circle approximates arcs, so the drawing matches the one in the
+turtle window.  The turtle itself is not drawn.
+
+To draw into FILE rather than a window, run
+    python3 scheme.py --svg FILE ...
+or set the environment variable SCHEME_TURTLE_SVG to FILE.  The file is
+complete once exitonclick is called, which the interpreter does on exit.
+"""
+
+import math
+
+# The number of points in a path element, after which it is written out
+PATH_POINTS = 1000
+
+# The width of the first line of the file, which holds the viewBox and so is
+# rewritten once the extent of the drawing is known
+HEADER_WIDTH = 256
+
+# The margin around the drawing, in turtle units
+MARGIN = 10
+
+class SvgTurtle:
+    """A turtle in logo mode that draws into the SVG file FILENAME.  It has
+    the methods of the turtle module that the turtle primitives call.
+
+    >>> import io
+    >>> t = SvgTurtle(io.StringIO())
+    >>> t.forward(100); t.right(90); t.circle(-50, 180)
+    >>> [round(v, 2) + 0 for v in t.position()], t.heading()
+    ([0.0, 0.0], 270.0)
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.out = None
+        self.reset()
+
+    def reset(self):
+        """Start a new drawing with the turtle at the origin facing north."""
+        if self.out is None:
+            if isinstance(self.filename, str):
+                self.out = open(self.filename, 'w')
+            else:
+                self.out = self.filename
+        self.out.seek(0)
+        self.out.truncate()
+        self.out.write(' ' * HEADER_WIDTH + '\n')
+        self.body_start = self.out.tell()
+        self.x, self.y = 0.0, 0.0
+        self.dx, self.dy = 0.0, 1.0
+        self.drawing = True
+        self.pencolor = self.fillcolor = 'black'
+        self.fillpath = None   # The points of the shape being filled
+        self.filled = None     # The elements drawn since begin_fill
+        self.path = []         # The data of the path being drawn
+        self.bounds = [0.0, 0.0, 0.0, 0.0]
+
+    def mode(self, mode):
+        assert mode == 'logo', 'SvgTurtle supports only logo mode'
+        self.reset()
+
+    def title(self, title):
+        pass
+
+    def speed(self, s):
+        pass
+
+    def tracer(self, n):
+        pass
+
+    def update(self):
+        pass
+
+    def showturtle(self):
+        pass
+
+    def hideturtle(self):
+        pass
+
+    def position(self):
+        return (self.x, self.y)
+
+    def heading(self):
+        """The heading in degrees clockwise from north."""
+        result = round(math.degrees(math.atan2(self.dy, self.dx)), 10) % 360.0
+        return (90.0 - result) % 360.0
+
+    # Movement
+
+    def _rotate(self, angle):
+        """Turn counterclockwise by ANGLE degrees."""
+        angle = math.radians(angle)
+        c, s = math.cos(angle), math.sin(angle)
+        dx, dy = self.dx, self.dy
+        self.dx, self.dy = dx*c - dy*s, dy*c + dx*s
+
+    def _go(self, distance):
+        self._goto(self.x + self.dx * distance, self.y + self.dy * distance)
+
+    def _goto(self, x, y):
+        """Move to (X, Y), drawing a line if the pen is down."""
+        if self.drawing:
+            path = self.path
+            if not path:
+                path.append('M{0:.2f} {1:.2f}'.format(self.x, -self.y))
+                self._include(self.x, self.y)
+            path.append('{0:.2f} {1:.2f}'.format(x, -y))
+            bounds = self.bounds
+            if x < bounds[0]:
+                bounds[0] = x
+            elif x > bounds[2]:
+                bounds[2] = x
+            if y < bounds[1]:
+                bounds[1] = y
+            elif y > bounds[3]:
+                bounds[3] = y
+            if len(path) >= PATH_POINTS:
+                self._end_path()
+        elif self.path:
+            self._end_path()
+        if self.fillpath is not None:
+            self.fillpath.append((x, y))
+        self.x, self.y = x, y
+
+    def forward(self, distance):
+        self._go(float(distance))
+
+    def backward(self, distance):
+        self._go(-float(distance))
+
+    def left(self, angle):
+        self._rotate(float(angle))
+
+    def right(self, angle):
+        self._rotate(-float(angle))
+
+    def setposition(self, x, y):
+        self._goto(float(x), float(y))
+
+    def setheading(self, to_angle):
+        angle = self.heading() - float(to_angle)
+        self._rotate((angle + 180.0) % 360.0 - 180.0)
+
+    def circle(self, radius, extent=None):
+        """Draw an arc of EXTENT degrees (by default, a circle) with RADIUS,
+        as a polygon with as many sides as the turtle module uses."""
+        radius = float(radius)
+        if extent is None:
+            extent = 360.0
+        extent = float(extent)
+        frac = abs(extent) / 360.0
+        steps = 1 + int(min(11 + abs(radius) / 6.0, 59.0) * frac)
+        w = 1.0 * extent / steps
+        w2 = 0.5 * w
+        l = 2.0 * radius * math.sin(math.radians(w2))
+        if radius < 0:
+            l, w, w2 = -l, -w, -w2
+        self._rotate(w2)
+        for _ in range(steps):
+            self._go(l)
+            self._rotate(w)
+        self._rotate(-w2)
+
+    # Pen and fill
+
+    def penup(self):
+        self.drawing = False
+        self._end_path()
+
+    def pendown(self):
+        self.drawing = True
+
+    def color(self, color):
+        self._end_path()
+        self.pencolor = self.fillcolor = svg_color(color)
+
+    def begin_fill(self):
+        self._end_path()
+        if self.filled is None:
+            self.filled = []
+        self.fillpath = [(self.x, self.y)]
+
+    def end_fill(self):
+        """Fill the shape traced since begin_fill, beneath the lines drawn
+        since then."""
+        if self.filled is None:
+            return
+        self._end_path()
+        filled, fillpath = self.filled, self.fillpath
+        self.filled = self.fillpath = None
+        if len(fillpath) > 2:
+            points = ' '.join('{0:.2f} {1:.2f}'.format(x, -y)
+                              for x, y in fillpath)
+            self._write('<polygon points="{0}" fill="{1}" '
+                        'fill-rule="evenodd"/>\n'.format(points,
+                                                         self.fillcolor))
+            for x, y in fillpath:
+                self._include(x, y)
+        for element in filled:
+            self._write(element)
+
+    def clear(self):
+        """Erase the drawing, including any shape being filled, leaving the
+        turtle where it is."""
+        self.path = []
+        self.filled = self.fillpath = None
+        self.out.seek(self.body_start)
+        self.out.truncate()
+        self.bounds = [self.x, self.y, self.x, self.y]
+
+    def exitonclick(self):
+        """Complete the file."""
+        self.end_fill()
+        self._end_path()
+        self.out.write('</svg>\n')
+        x0, y0, x1, y1 = self.bounds
+        header = ('<svg xmlns="http://www.w3.org/2000/svg" '
+                  'viewBox="{0:.2f} {1:.2f} {2:.2f} {3:.2f}" '
+                  'style="background: white">').format(
+                      x0 - MARGIN, -y1 - MARGIN,
+                      x1 - x0 + 2 * MARGIN, y1 - y0 + 2 * MARGIN)
+        self.out.seek(0)
+        self.out.write(header.ljust(HEADER_WIDTH))
+        if self.out is not self.filename:
+            self.out.close()
+            self.out = None
+
+    # Output
+
+    def _end_path(self):
+        """Write the path being drawn, if any."""
+        if self.path:
+            self._write('<path d="{0}" fill="none" stroke="{1}" '
+                        'stroke-linecap="round" stroke-linejoin="round"/>\n'
+                        .format(' '.join(self.path), self.pencolor))
+            self.path = []
+
+    def _write(self, element):
+        if self.filled is not None:
+            self.filled.append(element)
+        else:
+            self.out.write(element)
+
+    def _include(self, x, y):
+        """Extend the bounds of the drawing to include (X, Y)."""
+        bounds = self.bounds
+        bounds[0], bounds[2] = min(bounds[0], x), max(bounds[2], x)
+        bounds[1], bounds[3] = min(bounds[1], y), max(bounds[3], y)
+
+def svg_color(color):
+    """The SVG form of the turtle COLOR, a color name, a string "#rrggbb", or a
+    tuple of red, green, and blue values from 0 to 1."""
+    if isinstance(color, tuple):
+        return '#' + ''.join('{0:02x}'.format(round(255 * c)) for c in color)
+    return color.replace(' ', '')
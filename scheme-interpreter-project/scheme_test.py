@@ -1,6 +1,6 @@
 """Unit testing framework for the Scheme interpreter.
 
-Usage: python3 scheme_test.py FILE
+Usage: python3 scheme_test.py FILE [ENGINE]
 
 Interprets FILE as interactive Scheme source code, and compares each line
 of printed output from the read-eval-print loop and from any output functions
@@ -10,12 +10,13 @@ to an expected output described in a comment.  For example,
 ; expect 5
 
 Differences between printed and expected outputs are printed with line numbers.
+ENGINE, if given, names the evaluation engine to test (see scheme.ENGINES).
 """
 
 import io
 import sys
 from buffer import Buffer
-from scheme import read_eval_print_loop, create_global_frame
+from scheme import read_eval_print_loop, create_global_frame, use_engine
 from scheme_tokens import tokenize_lines
 from ucb import main
 
@@ -68,8 +69,9 @@ class TestReader:
         raise EOFError
 
 @main
-def run_tests(src_file='tests.scm'):
+def run_tests(src_file='tests.scm', engine='tree'):
     """Run a read-eval loop that reads from src_file and collects outputs."""
+    use_engine(engine)
     sys.stderr = sys.stdout = io.StringIO() # Collect output to stdout and stderr
     reader = None
     try:
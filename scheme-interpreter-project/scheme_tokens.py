@@ -6,120 +6,223 @@ of tokens.  A token may be:
   * A number (represented as an int or float)
   * A boolean (represented as a bool)
   * A symbol (represented as a string)
-  * A delimiter, including parentheses, dots, and single quotes
+  * A delimiter, including parentheses, dots, single quotes, and the #( that
+    starts a vector
+  * A string (represented as a Python string literal, quotes included),
+    which may continue over several lines
 
 This file also includes some features of Scheme that have not been addressed
 in the course, such as quasiquoting and Scheme strings.
 """
 
 from ucb import main
-import itertools
+import re
 import string
 import sys
-import tokenize
 
 _NUMERAL_STARTS = set(string.digits) | set('+-.')
 _SYMBOL_CHARS = (set('!$%&*/:<=>?@^_~') | set(string.ascii_lowercase) |
                  set(string.ascii_uppercase) | _NUMERAL_STARTS)
-_STRING_DELIMS = set('"')
-_WHITESPACE = set(' \t\n\r')
 _SINGLE_CHAR_TOKENS = set("()'`")
-_TOKEN_END = _WHITESPACE | _SINGLE_CHAR_TOKENS | _STRING_DELIMS | {',', ',@'}
-DELIMITERS = _SINGLE_CHAR_TOKENS | {'.', ',', ',@'}
+DELIMITERS = _SINGLE_CHAR_TOKENS | {'.', ',', ',@', '#('}
+
+# The candidate tokens of a line, after any whitespace.  The number of the
+# group that matches gives the kind of token: COMMENT (the rest of the line),
+# SINGLE (a one-character delimiter), HASH (# and the character after it, as
+# in #t, #f, and #(), COMMA (, or ,@), STRING (a string that ends on the same
+# line), OPEN_STRING (a " that starts a string ending on a later line), or
+# ATOM (a number or symbol: a character other than whitespace or one of
+# ( ) ' ` " , ; #, followed by the characters up to the next whitespace or
+# one of ( ) ' ` " ,).
+_TOKEN = re.compile(r"""[ \t\n\r]*(?:
+    (;)
+  | ([()'`])
+  | (\#[\s\S]?)
+  | (,@?)
+  | ("(?:[^"\\]|\\[\s\S])*")
+  | (")
+  | ([^ \t\n\r()'`",;\#][^ \t\n\r()'`",]*))""", re.VERBOSE)
+COMMENT, SINGLE, HASH, COMMA, STRING, OPEN_STRING, ATOM = range(1, 8)
+
+# The same candidates as one group, for findall, except that a comment or
+# a string that does not end on the line extends to the end of the line.
+_TOKEN_TEXT = re.compile(r"""[ \t\n\r]*(
+    ;[\s\S]*
+  | [()'`]
+  | \#[\s\S]?
+  | ,@?
+  | "(?:[^"\\]|\\[\s\S])*"
+  | "[\s\S]*
+  | [^ \t\n\r()'`",;\#][^ \t\n\r()'`",]*)""", re.VERBOSE)
+_COMPLETE_STRING = re.compile(r'"(?:[^"\\]|\\[\s\S])*"\Z')
+
+# The tokens for candidate texts seen before, which is emptied when it
+# reaches KNOWN_TOKENS_LIMIT entries.
+_known_tokens = {}
+KNOWN_TOKENS_LIMIT = 10000
+
+# The rest of a string that started on an earlier line, through its closing ".
+_STRING_REST = re.compile(r'(?:[^"\\]|\\[\s\S])*"')
+# The line breaks in a string, which become \n escapes so that the token is
+# a Python string literal.
+_STRING_NEWLINE = re.compile(r'(\\[\s\S])|\n')
+
+_INTEGER = re.compile(r'[+-]?[0-9]+\Z')
+_DECIMAL = re.compile(r'[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?\Z')
+_SYMBOL = re.compile(r'[!$%&*/:<=>?@^_~a-zA-Z0-9+.-]+\Z')
+# Characters that may appear in the other numerals that int and float accept,
+# such as 1_000, +inf, and those with surrounding whitespace.
+_OTHER_NUMERAL = re.compile(r'[_nN]|[^!-~]')
 
 def valid_symbol(s):
     """Returns whether s is not a well-formed value."""
-    if len(s) == 0:
-        return False
-    for c in s:
-        if c not in _SYMBOL_CHARS:
-            return False
-    return True
-
-def next_candidate_token(line, k):
-    """A tuple (tok, k'), where tok is the next substring of line at or
-    after position k that could be a token (assuming it passes a validity
-    check), and k' is the position in line following that token.  Returns
-    (None, len(line)) when there are no more tokens."""
-    while k < len(line):
-        c = line[k]
-        if c == ';':
-            return None, len(line)
-        elif c in _WHITESPACE:
-            k += 1
-        elif c in _SINGLE_CHAR_TOKENS:
-            return c, k+1
-        elif c == '#':  # Boolean values #t and #f
-            return line[k:k+2], min(k+2, len(line))
-        elif c == ',': # Unquote; check for @
-            if k+1 < len(line) and line[k+1] == '@':
-                return ',@', k+2
-            return c, k+1
-        elif c in _STRING_DELIMS:
-            if k+1 < len(line) and line[k+1] == c: # No triple quotes in Scheme
-                return c+c, k+2
-            line_bytes = (bytes(line[k:], encoding='utf-8'),)
-            gen = tokenize.tokenize(iter(line_bytes).__next__)
-            next(gen) # Throw away encoding token
-            token = next(gen)
-            if token.type != tokenize.STRING:
-                raise ValueError("invalid string: {0}".format(token.string))
-            return token.string, token.end[1]+k
-        else:
-            j = k
-            while j < len(line) and line[j] not in _TOKEN_END:
-                j += 1
-            return line[k:j], min(j, len(line))
-    return None, len(line)
+    return _SYMBOL.match(s) is not None
 
-def tokenize_line(line):
-    """The list of Scheme tokens on line.  Excludes comments and whitespace."""
-    result = []
-    text, i = next_candidate_token(line, 0)
-    while text is not None:
-        if text in DELIMITERS:
-            result.append(text)
-        elif text == '#t' or text.lower() == 'true':
-            result.append(True)
-        elif text == '#f' or text.lower() == 'false':
-            result.append(False)
-        elif text == 'nil':
-            result.append(text)
-        elif text[0] in _SYMBOL_CHARS:
-            number = False
-            if text[0] in _NUMERAL_STARTS:
+def atom_token(text):
+    """The token for the number or symbol TEXT, or None if TEXT is not one.
+
+    >>> [atom_token(text) for text in ('12', '-1.5e2', '+', 'Foo', '.', 'true')]
+    [12, -150.0, '+', 'foo', '.', True]
+    """
+    if text in DELIMITERS:
+        return text
+    lower = text.lower()
+    if lower == 'true':
+        return True
+    elif lower == 'false':
+        return False
+    elif text[0] not in _SYMBOL_CHARS:
+        return None
+    if text[0] in _NUMERAL_STARTS:
+        if _INTEGER.match(text):
+            return int(text)
+        elif _DECIMAL.match(text):
+            return float(text)
+        elif _OTHER_NUMERAL.search(text):
+            try:
+                return int(text)
+            except ValueError:
                 try:
-                    result.append(int(text))
-                    number = True
+                    return float(text)
                 except ValueError:
-                    try:
-                        result.append(float(text))
-                        number = True
-                    except ValueError:
-                        pass
-            if not number:
-                if valid_symbol(text):
-                    result.append(text.lower())
-                else:
-                    raise ValueError("invalid numeral or symbol: {0}".format(text))
-        elif text[0] in _STRING_DELIMS:
-            result.append(text)
-        else:
+                    pass
+    if _SYMBOL.match(text):
+        return lower
+    raise ValueError("invalid numeral or symbol: {0}".format(text))
+
+_HASH_TOKENS = {'#t': True, '#f': False, '#(': '#('}
+
+def candidate_token(text):
+    """The token for the candidate TEXT found by _TOKEN_TEXT, which is
+    neither a comment nor an unfinished string, or None if it is invalid."""
+    c = text[0]
+    if c == '#':
+        return _HASH_TOKENS.get(text)
+    elif c in _SINGLE_CHAR_TOKENS or c == ',' or c == '"':
+        return text
+    return atom_token(text)
+
+def _scan(line, k, result):
+    """Append the tokens in LINE from position K onward to RESULT.  Returns
+    the position of the opening quote of a string that does not end on
+    LINE, or None.
+
+    The token for each candidate text is looked up in _known_tokens, and
+    only computed if it is not there."""
+    texts = _TOKEN_TEXT.findall(line, k)
+    if not texts:
+        return None
+    last = texts[-1]
+    if last[0] == ';':
+        texts.pop()
+    elif last[0] == '"' and _COMPLETE_STRING.match(last) is None:
+        return _scan_tokens(line, k, result)
+    get = _known_tokens.get
+    tokens = [get(text) for text in texts]
+    if None in tokens:
+        if len(_known_tokens) >= KNOWN_TOKENS_LIMIT:
+            _known_tokens.clear()
+        for i, token in enumerate(tokens):
+            if token is None:
+                token = candidate_token(texts[i])
+                if token is None:
+                    return _scan_tokens(line, k, result)
+                tokens[i] = _known_tokens[texts[i]] = token
+    result += tokens
+    return None
+
+def _scan_tokens(line, k, result):
+    """Append the tokens in LINE from position K onward to RESULT, one match
+    at a time, warning about invalid tokens.  Returns as _scan does."""
+    for match in _TOKEN.finditer(line, k):
+        kind = match.lastindex
+        text = match.group(kind)
+        if kind == OPEN_STRING:
+            return match.start(kind)
+        elif kind == COMMENT:
+            return None
+        token = candidate_token(text)
+        if token is None:
             print("warning: invalid token: {0}".format(text), file=sys.stderr)
             print("    ", line, file=sys.stderr)
-            print(" " * (i+3), "^", file=sys.stderr)
-        text, i = next_candidate_token(line, i)
+            print(" " * (match.end()+3), "^", file=sys.stderr)
+        else:
+            result.append(token)
+    return None
+
+def tokenize_line(line):
+    """The list of Scheme tokens on line.  Excludes comments and whitespace.
+
+    >>> tokenize_line("(define (f x) (g ,@x 'y \\"z\\"))  ; comment")
+    ['(', 'define', '(', 'f', 'x', ')', '(', 'g', ',@', 'x', "'", 'y', '"z"', ')', ')']
+    >>> tokenize_line('(display "unfinished')
+    Traceback (most recent call last):
+        ...
+    ValueError: invalid string: "unfinished
+    """
+    result = []
+    open_string = _scan(line, 0, result)
+    if open_string is not None:
+        raise ValueError("invalid string: {0}".format(line[open_string:]))
     return result
 
 def tokenize_lines(input):
     """An iterator that returns lists of tokens, one for each line of the
-    iterable input sequence."""
-    return map(tokenize_line, input)
+    iterable input sequence.  A string that spans several lines is a single
+    token, in the list for the line on which it ends.
+
+    >>> list(tokenize_lines(['(print "two', 'lines") 3']))
+    [['(', 'print'], ['"two\\\\nlines"', ')', 3]]
+    """
+    def escape_newline(match):
+        return match.group(1) or '\\n'
+    partial = None  # The part of a string seen on earlier lines
+    for line in input:
+        result = []
+        k = 0
+        if partial is not None:
+            if not partial.endswith('\n'):
+                partial += '\n'
+            match = _STRING_REST.match(line)
+            if match is None:
+                partial += line
+                yield result
+                continue
+            k = match.end()
+            result.append(_STRING_NEWLINE.sub(escape_newline,
+                                              partial + line[:k]))
+            partial = None
+        open_string = _scan(line, k, result)
+        if open_string is not None:
+            partial = line[open_string:]
+        yield result
+    if partial is not None:
+        raise ValueError("invalid string: {0}".format(partial))
 
 def count_tokens(input):
     """Count the number of non-delimiter tokens in input."""
-    return len(list(filter(lambda x: x not in DELIMITERS,
-                           itertools.chain(*tokenize_lines(input)))))
+    return sum(1 for tokens in tokenize_lines(input)
+               for token in tokens if token not in DELIMITERS)
 
 @main
 def run(*args):
@@ -0,0 +1,612 @@
+"""This module implements a bytecode compiler and a virtual machine for Scheme.
+
+The compiler turns an expression read by scheme_read into Bytecode, a flat list
+of instructions for a stack machine, resolving variables into frame slots as
+the analyzer in scheme_analyze.py does.  The machine (run) executes Bytecode
+with a single loop.  Its registers are the current instruction list, the
+program counter, and the environment; intermediate values are kept on a stack
+of operands, and the callers of the procedure being executed on a stack of
+suspended activations.  Scheme procedure calls therefore use neither Python
+recursion nor the scheme_eval/Procedure.apply trampoline.
+
+Each instruction is a pair (opcode, argument):
+
+  CONST v          push the value v
+  LOCAL0 i         push slot i of the current frame
+  LOCAL1 i         push slot i of the frame's parent
+  LOCAL (d, i)     push slot i of the frame d levels up
+  LOCAL_THUNK (d, i)  push the forced value of a nu procedure's argument
+  GLOBAL ref       push the value of a global name (ref is a GlobalRef)
+  NAME (s, d)      push the value of symbol s, looked up by name from d levels up
+  POP              discard the top of the stack
+  JUMP t           continue at instruction t
+  JUMP_IF_FALSE t  pop a value, and continue at t if it is false
+  JUMP_IF_TRUE_OR_POP t  continue at t if the top is true; otherwise pop it
+  ARGS a           check the procedure on top of the stack before its operands
+                   are evaluated; a nu procedure gets thunks, skipping to a.skip
+  CALL n           call the procedure below the top n values on them
+  TAIL_CALL n      the same, replacing the current activation
+  RETURN           return the top of the stack to the caller
+  MAKE_CLOSURE t   push a new procedure from the template t
+  DEFINE s         bind s to the popped value in the current frame; push s
+  LET (names, err) bind names to the values on top of the stack in a new frame
+  POP_ENV          return to the parent of the current frame
+  SPECIAL (f, v)   evaluate a special form with its do_..._form function f
+  RAISE err        raise the SchemeError err
+
+Select this evaluator with use_engine('vm') in scheme.py, or by running
+    python3 scheme.py --engine vm FILE
+"""
+
+from scheme_primitives import *
+from scheme import (Procedure, PrimitiveProcedure, LambdaProcedure,
+                    MuProcedure, NuProcedure, Thunk, CallFrame, GlobalFrame,
+                    SPECIAL_FORMS, inline_cache_stats, scheme_eval,
+                    scheme_apply,
+                    check_form, check_formals, and_sym, begin_sym, cond_sym,
+                    define_sym, else_sym, if_sym, lambda_sym, let_sym, mu_sym,
+                    nu_sym, or_sym, quote_sym)
+from scheme_analyze import Scope, binds_dynamically
+
+(CONST, LOCAL0, LOCAL1, LOCAL, LOCAL_THUNK, GLOBAL, NAME, POP, JUMP,
+ JUMP_IF_FALSE, JUMP_IF_TRUE_OR_POP, ARGS, CALL, TAIL_CALL, RETURN,
+ MAKE_CLOSURE, DEFINE, LET, POP_ENV, SPECIAL, RAISE) = range(21)
+
+OPCODE_NAMES = ('CONST', 'LOCAL0', 'LOCAL1', 'LOCAL', 'LOCAL_THUNK', 'GLOBAL',
+                'NAME', 'POP', 'JUMP', 'JUMP_IF_FALSE', 'JUMP_IF_TRUE_OR_POP',
+                'ARGS', 'CALL', 'TAIL_CALL', 'RETURN', 'MAKE_CLOSURE',
+                'DEFINE', 'LET', 'POP_ENV', 'SPECIAL', 'RAISE')
+
+#############
+# Execution #
+#############
+
+def vm_eval(expr, env):
+    """Evaluate Scheme expression EXPR in environment ENV by compiling it and
+    running the result.  If ENV is None, simply returns EXPR.
+
+    >>> from scheme import create_global_frame
+    >>> from scheme_reader import read_line
+    >>> vm_eval(read_line("((lambda (x) (* x x)) 7)"), create_global_frame())
+    scnum(49)
+    """
+    if env is None:
+        return expr
+    if isinstance(env, GlobalFrame):
+        scope = Scope(None, None, frame=env)
+    else:
+        scope = None
+    return run(compile_expression(expr, scope), env)
+
+def vm_apply(procedure, args, env):
+    """Apply PROCEDURE to the Scheme list ARGS in environment ENV, running the
+    compiled body of a LambdaProcedure instead of compiling it again, and
+    return the resulting value."""
+    expr, env = procedure.apply(args, env)
+    if env is None:
+        return expr
+    if expr is getattr(procedure, 'body', None):
+        return run(procedure.bytecode or procedure_bytecode(procedure), env)
+    return vm_eval(expr, env)
+
+def procedure_bytecode(procedure):
+    """The Bytecode for the body of PROCEDURE, a LambdaProcedure, compiling
+    it if that has not been done yet."""
+    bytecode = procedure.bytecode
+    if bytecode is None:
+        names, parent = tuple(procedure.formals), None
+        if (isinstance(procedure.env, GlobalFrame) and
+            not isinstance(procedure, MuProcedure)):
+            parent = Scope(None, None, frame=procedure.env)
+        scope = Scope(names, parent,
+                      dynamic=binds_dynamically(procedure.body),
+                      thunks=isinstance(procedure, NuProcedure))
+        bytecode = compile_expression(procedure.body, scope)
+        bytecode.names = names
+        procedure.bytecode = bytecode
+    return bytecode
+
+class VMThunk(Thunk):
+    """A by-name argument to a nu procedure whose expression has already been
+    compiled into BYTECODE."""
+
+    def __init__(self, bytecode, expr, env):
+        Thunk.__init__(self, nil, expr, env)
+        self.bytecode = bytecode
+
+    def get_actual_value(self):
+        return run(self.bytecode, self.env)
+
+    def __reduce__(self):
+        return (Thunk, (nil, self.body, self.env))
+
+def run(bytecode, env):
+    """Run BYTECODE in environment ENV and return the value it returns."""
+    instructions, pc = bytecode.instructions, 0
+    stack = []
+    frames = []      # (instructions, pc, env) for each suspended caller
+    while True:
+        op, arg = instructions[pc]
+        pc += 1
+        if op == LOCAL0:
+            stack.append(env.values[arg])
+        elif op == GLOBAL:
+            if arg.version == arg.frame.version:
+                inline_cache_stats.hits += 1
+                stack.append(arg.cell.value)
+            else:
+                stack.append(arg.resolve())
+        elif op == CONST:
+            stack.append(arg)
+        elif op == LOCAL1:
+            stack.append(env.parent.values[arg])
+        elif op == ARGS:
+            kind = type(stack[-1])
+            if kind is not LambdaProcedure and kind is not PrimitiveProcedure:
+                procedure = stack[-1]
+                if isinstance(procedure, NuProcedure):
+                    for code, operand in arg.thunk_parts():
+                        stack.append(VMThunk(code, operand, env))
+                    pc = arg.skip
+                elif not isinstance(procedure, Procedure):
+                    procedure.evaluate_arguments(arg.operands, env)  # Raises
+        elif op == CALL or op == TAIL_CALL:
+            if arg:
+                args = stack[-arg:]
+                del stack[-arg:]
+            else:
+                args = []
+            procedure = stack.pop()
+            kind = type(procedure)
+            if (kind is LambdaProcedure or kind is MuProcedure or
+                kind is NuProcedure):
+                code = procedure.bytecode or procedure_bytecode(procedure)
+                if len(args) != len(code.names):
+                    raise SchemeError('different number of formal parameters '
+                                      'and arguments')
+                if op == CALL:
+                    frames.append((instructions, pc, env))
+                if kind is not MuProcedure:
+                    env = procedure.env
+                env = CallFrame(env, code.names, args)
+                instructions, pc = code.instructions, 0
+                continue
+            if kind is PrimitiveProcedure and not procedure.use_env:
+                try:
+                    value = procedure.fn(*args)
+                except TypeError as err:
+                    raise SchemeError(err)
+            else:
+                value = scheme_apply(procedure, scheme_list(*args), env)
+            if op == CALL:
+                stack.append(value)
+            elif frames:
+                instructions, pc, env = frames.pop()
+                stack.append(value)
+            else:
+                return value
+        elif op == JUMP_IF_FALSE:
+            if not stack.pop():
+                pc = arg
+        elif op == RETURN:
+            if not frames:
+                return stack.pop()
+            instructions, pc, env = frames.pop()
+        elif op == LOCAL:
+            frame = env
+            for _ in range(arg[0]):
+                frame = frame.parent
+            stack.append(frame.values[arg[1]])
+        elif op == POP:
+            stack.pop()
+        elif op == JUMP:
+            pc = arg
+        elif op == JUMP_IF_TRUE_OR_POP:
+            if stack[-1]:
+                pc = arg
+            else:
+                stack.pop()
+        elif op == LOCAL_THUNK:
+            frame = env
+            for _ in range(arg[0]):
+                frame = frame.parent
+            stack.append(frame.values[arg[1]].get_actual_value())
+        elif op == NAME:
+            frame = env
+            for _ in range(arg[1]):
+                frame = frame.parent
+            stack.append(frame.lookup(arg[0]).get_actual_value())
+        elif op == MAKE_CLOSURE:
+            function_type, formals, body, code = arg
+            procedure = function_type(formals, body, env)
+            procedure.bytecode = code
+            stack.append(procedure)
+        elif op == DEFINE:
+            env.define(arg, stack.pop())
+            stack.append(arg)
+        elif op == LET:
+            names, duplicate = arg
+            if names:
+                values = stack[-len(names):]
+                del stack[-len(names):]
+            else:
+                values = []
+            if duplicate is not None:
+                raise duplicate
+            env = CallFrame(env, names, values)
+        elif op == POP_ENV:
+            env = env.parent
+        elif op == SPECIAL:
+            form, vals = arg
+            expr, form_env = form(vals, env)
+            stack.append(scheme_eval(expr, form_env))
+        elif op == RAISE:
+            raise arg
+        else:
+            raise SchemeError("bad opcode: {0}".format(op))
+
+#############
+# Bytecode  #
+#############
+
+class Bytecode:
+    """Compiled code: a list of INSTRUCTIONS, each a pair (opcode, argument),
+    to be run in a frame whose slots hold the values of the tuple NAMES."""
+
+    def __init__(self, instructions, names=()):
+        self.instructions = instructions
+        self.names = names
+
+    def __repr__(self):
+        return "<bytecode: {0} instructions>".format(len(self.instructions))
+
+def disassemble(bytecode):
+    """Return a readable listing of BYTECODE.
+
+    >>> from scheme_reader import read_line
+    >>> print(disassemble(compile_expression(read_line("(if x 1 2)"), None)))
+    0 NAME (intern('x'), 0)
+    1 JUMP_IF_FALSE 4
+    2 CONST scnum(1)
+    3 RETURN
+    4 CONST scnum(2)
+    5 RETURN
+    """
+    lines = []
+    for i, (op, arg) in enumerate(bytecode.instructions):
+        line = '{0} {1}'.format(i, OPCODE_NAMES[op])
+        if arg is not None:
+            line += ' {0!r}'.format(arg)
+        lines.append(line)
+    return '\n'.join(lines)
+
+class GlobalRef:
+    """A reference to the global name SYM in the GlobalFrame FRAME, with an
+    inline cache of the Cell bound to SYM that is valid while the frame's
+    version equals VERSION."""
+
+    __slots__ = ('sym', 'frame', 'cell', 'version')
+
+    def __init__(self, sym, frame):
+        self.sym, self.frame = sym, frame
+        self.cell, self.version = None, -1
+
+    def resolve(self):
+        """Look up SYM after a cache miss, and return its value."""
+        inline_cache_stats.misses += 1
+        self.cell = self.frame.bindings.get(self.sym)
+        if self.cell is None:
+            raise SchemeError("unknown identifier: {0}".format(str(self.sym)))
+        self.version = self.frame.version
+        return self.cell.value
+
+    def __repr__(self):
+        return "GlobalRef({0!r})".format(self.sym)
+
+class CallOperands:
+    """The argument of an ARGS instruction: the OPERANDS of a call, compiled
+    into thunks only if the call turns out to be to a nu procedure."""
+
+    def __init__(self, operands, scope):
+        self.operands = operands
+        self.scope = scope
+        self.skip = None
+        self._thunk_parts = None
+
+    def thunk_parts(self):
+        """Pairs (bytecode, expression) for the operands."""
+        if self._thunk_parts is None:
+            self._thunk_parts = [(compile_expression(operand, self.scope),
+                                  operand) for operand in self.operands]
+        return self._thunk_parts
+
+    def __repr__(self):
+        return "<operands, skip to {0}>".format(self.skip)
+
+#############
+# Compiling #
+#############
+
+def compile_expression(expr, scope):
+    """Compile EXPR, to be run in environments described by SCOPE, into
+    Bytecode that returns its value."""
+    compiler = Compiler()
+    compiler.compile(expr, scope, True)
+    return Bytecode(compiler.instructions)
+
+class Compiler:
+    """A Compiler accumulates the instructions for one Bytecode.
+
+    Each compile method takes the SCOPE of the expression it compiles and
+    whether the expression is in TAIL position.  Code for an expression in
+    tail position returns its value (or ends with a tail call); other code
+    leaves the value on the stack.  Errors in the form of an expression are
+    compiled into RAISE instructions, so that they are reported when the
+    expression is evaluated, as they are by scheme_eval.
+    """
+
+    def __init__(self):
+        self.instructions = []
+
+    def emit(self, op, arg=None):
+        """Append the instruction (OP, ARG), returning its index."""
+        self.instructions.append((op, arg))
+        return len(self.instructions) - 1
+
+    def patch(self, index, target=None):
+        """Make the jump at INDEX go to TARGET (default: the next
+        instruction to be emitted)."""
+        if target is None:
+            target = len(self.instructions)
+        op, _ = self.instructions[index]
+        self.instructions[index] = (op, target)
+
+    def finish(self, tail):
+        if tail:
+            self.emit(RETURN)
+
+    def compile(self, expr, scope, tail):
+        if scheme_symbolp(expr):
+            self.compile_variable(expr, scope)
+            return self.finish(tail)
+        elif scheme_atomp(expr):
+            self.emit(CONST, expr)
+            return self.finish(tail)
+        start = len(self.instructions)
+        try:
+            if not scheme_listp(expr):
+                raise SchemeError("malformed list: {0}".format(str(expr)))
+            first, rest = scheme_car(expr), scheme_cdr(expr)
+            if scheme_symbolp(first) and first in SPECIAL_FORMS:
+                method = self.FORMS.get(first)
+                if method is None:
+                    self.emit(SPECIAL, (SPECIAL_FORMS[first], rest))
+                    self.finish(tail)
+                else:
+                    method(self, rest, scope, tail)
+            else:
+                self.compile_call(first, rest, scope, tail)
+        except SchemeError as err:
+            del self.instructions[start:]
+            self.emit(RAISE, err)
+
+    def compile_variable(self, sym, scope):
+        depth = 0
+        while scope is not None:
+            if scope.names is None:
+                self.emit(GLOBAL, GlobalRef(sym, scope.frame))
+                return
+            if sym in scope.names:
+                slot = scope.names.index(sym)
+                if scope.thunks:
+                    self.emit(LOCAL_THUNK, (depth, slot))
+                elif depth <= 1:
+                    self.emit(LOCAL1 if depth else LOCAL0, slot)
+                else:
+                    self.emit(LOCAL, (depth, slot))
+                return
+            if scope.dynamic:
+                break
+            scope, depth = scope.parent, depth + 1
+        self.emit(NAME, (sym, depth))
+
+    def compile_call(self, operator, operands, scope, tail):
+        operand_list = list(operands)
+        self.compile(operator, scope, False)
+        call_operands = CallOperands(operand_list, scope)
+        self.emit(ARGS, call_operands)
+        for operand in operand_list:
+            self.compile(operand, scope, False)
+        call_operands.skip = len(self.instructions)
+        self.emit(TAIL_CALL if tail else CALL, len(operand_list))
+
+    def compile_sequence(self, exprs, scope, tail):
+        exprs = list(exprs)
+        for expr in exprs[:-1]:
+            self.compile(expr, scope, False)
+            self.emit(POP)
+        self.compile(exprs[-1], scope, tail)
+
+    # Special forms, performing the same checks as the do_..._form functions
+
+    def compile_lambda(self, vals, scope, tail, function_type=LambdaProcedure):
+        check_form(vals, 2)
+        formals = vals[0]
+        check_formals(formals)
+        body = vals[1]
+        if len(vals) > 2:
+            body = Pair('begin', scheme_cdr(vals))
+        names = tuple(formals)
+        if function_type is MuProcedure:
+            scope = None
+        body_scope = Scope(names, scope, dynamic=binds_dynamically(body),
+                           thunks=function_type is NuProcedure)
+        code = compile_expression(body, body_scope)
+        code.names = names
+        self.emit(MAKE_CLOSURE, (function_type, formals, body, code))
+        self.finish(tail)
+
+    def compile_mu(self, vals, scope, tail):
+        self.compile_lambda(vals, scope, tail, function_type=MuProcedure)
+
+    def compile_nu(self, vals, scope, tail):
+        self.compile_lambda(vals, scope, tail, function_type=NuProcedure)
+
+    def compile_define(self, vals, scope, tail):
+        check_form(vals, 2)
+        target = vals[0]
+        if scheme_symbolp(target):
+            check_form(vals, 2, 2)
+            self.compile(vals[1], scope, False)
+        elif scheme_pairp(target):
+            formals, target = scheme_cdr(target), scheme_car(target)
+            if not scheme_symbolp(target):
+                raise SchemeError("bad variable")
+            lambda_expr = Pair(lambda_sym, scheme_cons(formals, vals.second))
+            self.compile(lambda_expr, scope, False)
+        else:
+            raise SchemeError("bad argument to define")
+        self.emit(DEFINE, target)
+        self.finish(tail)
+
+    def compile_quote(self, vals, scope, tail):
+        check_form(vals, 1, 1)
+        self.emit(CONST, vals[0])
+        self.finish(tail)
+
+    def compile_let(self, vals, scope, tail):
+        check_form(vals, 2)
+        bindings = vals[0]
+        if not scheme_listp(bindings):
+            raise SchemeError("bad bindings list in let form")
+        names = []
+        for binding in bindings:
+            check_form(binding, 2)
+            names.append(binding[0])
+            self.compile(binding[1], scope, False)
+        names = tuple(names)
+        try:
+            check_formals(names)
+            duplicate = None
+        except SchemeError as err:
+            duplicate = err    # Raised only after evaluating the bindings
+        self.emit(LET, (names, duplicate))
+        body_scope = Scope(names, scope, dynamic=binds_dynamically(vals.second))
+        self.compile_sequence(vals.second, body_scope, tail)
+        if not tail:
+            self.emit(POP_ENV)
+
+    def compile_if(self, vals, scope, tail):
+        check_form(vals, 2, 3)
+        self.compile(vals[0], scope, False)
+        to_alternative = self.emit(JUMP_IF_FALSE)
+        self.compile(vals[1], scope, tail)
+        to_end = None if tail else self.emit(JUMP)
+        self.patch(to_alternative)
+        if len(vals) == 3:
+            self.compile(vals[2], scope, tail)
+        else:
+            self.emit(CONST, okay)
+            self.finish(tail)
+        if to_end is not None:
+            self.patch(to_end)
+
+    def compile_and(self, vals, scope, tail):
+        if len(vals) == 0:
+            self.emit(CONST, scheme_true)
+            return self.finish(tail)
+        exprs = list(vals)
+        to_false = []
+        for expr in exprs[:-1]:
+            self.compile(expr, scope, False)
+            to_false.append(self.emit(JUMP_IF_FALSE))
+        self.compile(exprs[-1], scope, tail)
+        to_end = None if tail else self.emit(JUMP)
+        for index in to_false:
+            self.patch(index)
+        self.emit(CONST, scheme_false)
+        self.finish(tail)
+        if to_end is not None:
+            self.patch(to_end)
+
+    def compile_or(self, vals, scope, tail):
+        if len(vals) == 0:
+            self.emit(CONST, scheme_false)
+            return self.finish(tail)
+        exprs = list(vals)
+        to_end = []
+        for expr in exprs[:-1]:
+            self.compile(expr, scope, False)
+            to_end.append(self.emit(JUMP_IF_TRUE_OR_POP))
+        self.compile(exprs[-1], scope, tail)
+        for index in to_end:
+            self.patch(index)
+        if to_end:
+            self.finish(tail)
+
+    def compile_cond(self, vals, scope, tail):
+        num_clauses = len(vals)
+        to_end, to_value = [], []
+        for i, clause in enumerate(vals):
+            try:
+                check_form(clause, 1)
+                if clause.first is else_sym:
+                    if i < num_clauses-1:
+                        raise SchemeError("else must be last")
+                    if clause.second is nil:
+                        raise SchemeError("badly formed else clause")
+            except SchemeError as err:
+                self.emit(RAISE, err)
+                break
+            if clause.first is else_sym:
+                self.compile_clause_body(clause.second, scope, tail)
+                if not tail:
+                    to_end.append(self.emit(JUMP))
+                break
+            self.compile(clause.first, scope, False)
+            if clause.second is nil:
+                to_value.append(self.emit(JUMP_IF_TRUE_OR_POP))
+                continue
+            to_next = self.emit(JUMP_IF_FALSE)
+            self.compile_clause_body(clause.second, scope, tail)
+            if not tail:
+                to_end.append(self.emit(JUMP))
+            self.patch(to_next)
+        else:
+            self.emit(CONST, okay)
+            self.finish(tail)
+        for index in to_value:
+            self.patch(index)
+        if to_value:
+            self.finish(tail)
+        for index in to_end:
+            self.patch(index)
+
+    def compile_clause_body(self, exprs, scope, tail):
+        start = len(self.instructions)
+        try:
+            self.compile_begin(exprs, scope, tail)
+        except SchemeError as err:
+            del self.instructions[start:]
+            self.emit(RAISE, err)
+
+    def compile_begin(self, vals, scope, tail):
+        check_form(vals, 0)
+        if scheme_nullp(vals):
+            self.emit(CONST, okay)
+            return self.finish(tail)
+        self.compile_sequence(vals, scope, tail)
+
+    FORMS = {
+        and_sym:          compile_and,
+        begin_sym:        compile_begin,
+        cond_sym:         compile_cond,
+        define_sym:       compile_define,
+        if_sym:           compile_if,
+        lambda_sym:       compile_lambda,
+        let_sym:          compile_let,
+        mu_sym:           compile_mu,
+        nu_sym:           compile_nu,
+        or_sym:           compile_or,
+        quote_sym:        compile_quote,
+    }
@@ -128,6 +128,140 @@ a
 (list-partitions 5 5 2)
 ;expect ((2 2 1) (2 1 1 1) (1 1 1 1 1))
 
+; Redefining a global is seen by procedures that already called it
+(define (callee) 1)
+(define (caller) (callee))
+(caller)
+; expect 1
+(define (callee) 2)
+(caller)
+; expect 2
+
+; Procedures translated to Python loop on self tail calls
+(define (count-up n total) (if (= n 0) total (count-up (- n 1) (+ total 1))))
+(define count-up (native count-up))
+(count-up 5000 0)
+; expect 5000
+(define (sign x) (cond ((< x 0) 'negative) ((= x 0) 'zero) (else (let ((y x)) (and y 'positive)))))
+(define sign (native sign))
+(list (sign -2) (sign 0) (sign 3))
+; expect (negative zero positive)
+; Mu procedures called from native code see its local variables, and nu
+; procedures receive their operands unevaluated
+(define add-yy (mu (x) (+ x yy)))
+(define (call-add-yy yy) (add-yy 1))
+((native call-add-yy) 10)
+; expect 11
+(define double (nu (x) (+ x x)))
+(define (noisy-two) (begin (display 'two) 2))
+(define (double-noisy) (double (noisy-two)))
+((native double-noisy))
+; expect twotwo4
+
+; Memoized procedures remember results, including those of recursive calls
+(define-memoized (memo-fib n) (if (< n 2) n (+ (memo-fib (- n 1)) (memo-fib (- n 2)))))
+(memo-fib 60)
+; expect 1548008755920
+(memo-stats memo-fib)
+; expect ((hits . 58) (misses . 61) (evictions . 0) (size . 61) (max-size . 1024))
+(define (pair-sum p) (+ (car p) (cdr p)))
+(define pair-sum (memoize pair-sum 1))
+(list (pair-sum '(1 . 2)) (pair-sum (cons 1 2)) (pair-sum '(3 . 4)) (pair-sum '(1 . 2)))
+; expect (3 3 7 3)
+(memo-stats pair-sum)
+; expect ((hits . 1) (misses . 3) (evictions . 2) (size . 1) (max-size . 1))
+
+; Numbers computed separately are not eq?, however small
+(list (eq? 3 3) (eq? 300 300) (eq? (+ 1 2) 3) (eq? 3000 3000) (let ((x 5)) (eq? x x)))
+; expect (#f #f #f #f #t)
+
+; Vectors
+(define v (make-vector 3 'a))
+(vector-set! v 1 #(1 (2 3)))
+; expect okay
+v
+; expect #(a #(1 (2 3)) a)
+(list (vector-length v) (vector-ref v 2) (vector? v) (vector? '(1)))
+; expect (3 a #t #f)
+(vector->list (list->vector '(1 2 3)))
+; expect (1 2 3)
+(equal? (vector 1 (list 2)) #(1 (2)))
+; expect #t
+(vector-ref v 3)
+; expect Error: index 3 out of range for vector of length 3
+
+; Hash tables
+(define table (make-hash-table))
+(hash-table-set! table '(1 "two") 'list)
+; expect okay
+(hash-table-set! table 3 'three)
+; expect okay
+(list (hash-table-ref table (list 1 "two")) (hash-table-ref table 3.0) (hash-table-count table))
+; expect (list three 2)
+(hash-table-delete! table 3)
+; expect okay
+(list (hash-table-keys table) (hash-table-ref table 3 'none))
+; expect (((1 two)) none)
+(define eq-table (make-hash-table eq?))
+(hash-table-set! eq-table (list 1) 'a)
+; expect okay
+(hash-table-ref eq-table (list 1) 'none)
+; expect none
+
+(define xs (f64vector 1 2.5 4))
+(define ns (s64vector 1 2 3))
+(vector+ xs ns)
+; expect #f64(2 4.5 7)
+(vector* ns 3)
+; expect #s64(3 6 9)
+(list (vector-sum xs) (vector-dot xs ns))
+; expect (7.5 18)
+(vector-map - ns)
+; expect #s64(-1 -2 -3)
+(define tail (vector-slice ns 1))
+(s64vector-set! tail 0 20)
+; expect okay
+(list (s64vector->list ns) (s64vector-length tail))
+; expect ((1 20 3) 2)
+(s64vector 1.5)
+; expect Error
+(s64vector-set! ns 0 2.5)
+; expect Error
+(define near-limit (s64vector 4611686018427387904 -3))
+(vector+ near-limit near-limit)
+; expect Error
+(vector* near-limit 2)
+; expect Error
+(vector+ near-limit 4611686018427387903)
+; expect #s64(9223372036854775807 4611686018427387900)
+(list (vector-sum (s64vector 9223372036854775807 1))
+      (vector-dot near-limit near-limit))
+; expect (9223372036854775808 21267647932558653966460912964485513225)
+
+(define (iota-list n)
+  (define (build k acc) (if (< k 0) acc (build (- k 1) (cons k acc))))
+  (build (- n 1) nil))
+(define long-list (iota-list 20000))
+(list (length (append long-list long-list)) (equal? long-list (iota-list 20000)))
+; expect (40000 #t)
+
+(define poem "two
+lines, \"quoted\"")
+poem
+; expect "two\nlines, \"quoted\""
+
+; Inline caches of global names survive the definition of other names
+(define (cache-misses) (cdr (car (cdr (inline-cache-stats)))))
+(define (misses-during thunk)
+  (let ((before (cache-misses)))
+    (thunk)
+    (- (cache-misses) before)))
+(define (cached-call) (+ 1 1))
+(misses-during cached-call)
+(define unrelated-name 0)
+(misses-during cached-call)
+; expect 0
+
 
 (exit)
 
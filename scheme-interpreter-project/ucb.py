@@ -1,8 +1,6 @@
 """The ucb module contains functions specific to 61A at UC Berkeley."""
 
-import code
 import functools
-import inspect
 import re
 import signal
 import sys
@@ -19,7 +17,7 @@ def main(fn):
 
     Use this instead of the typical __name__ == "__main__" predicate.
     """
-    if inspect.stack()[1][0].f_locals['__name__'] == '__main__':
+    if sys._getframe(1).f_globals['__name__'] == '__main__':
         args = sys.argv[1:] # Discard the script name from command line
         fn(*args) # Call the main function
     return fn
@@ -63,8 +61,9 @@ def log(message):
 
 def log_current_line():
     """Print information about the current line of code."""
-    frame = inspect.stack()[1]
-    log('Current line: File "{f[1]}", line {f[2]}, in {f[3]}'.format(f=frame))
+    frame = sys._getframe(1)
+    log('Current line: File "{0}", line {1}, in {2}'.format(
+        frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name))
 
 
 def interact(msg=None):
@@ -76,11 +75,8 @@ def interact(msg=None):
       <Control>-Z <Enter> exists the interactive session and returns to normal
       execution.
     """
-    # use exception trick to pick up the current frame
-    try:
-        raise None
-    except:
-        frame = sys.exc_info()[2].tb_frame.f_back
+    import code
+    frame = sys._getframe(1)
 
     # evaluate commands in current namespace
     namespace = frame.f_globals.copy()
@@ -93,7 +89,7 @@ def interact(msg=None):
     signal.signal(signal.SIGINT, handler)
 
     if not msg:
-        _, filename, line, _, _, _ = inspect.stack()[1]
+        filename, line = frame.f_code.co_filename, frame.f_lineno
         msg = 'Interacting at File "{0}", line {1} \n'.format(filename, line)
         msg += '    Unix:    <Control>-D continues the program; \n'
         msg += '    Windows: <Control>-Z <Enter> continues the program; \n'